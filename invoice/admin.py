@@ -1,8 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
 from django import forms
-from django.contrib import admin
-from django.conf.urls import patterns, url
+from django.contrib import admin, messages
+from django.conf.urls import url
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.utils.html import format_html
+from django.template.response import TemplateResponse
+from django.utils.timezone import now
 
-from .models import Client, Invoice, InvoiceItem
+from . import search
+from .export import csv_response, iter_invoice_rows
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceItem, Client, Invoice, InvoiceItem, RequestTiming, VatRate)
+from .reports import (
+    AGING_BUCKETS, TIMING_DAYS, TIMING_METRICS, TIMING_PERCENTILES, VAT_REPORT_COLUMNS,
+    aging_totals, iter_vat_report_rows, receivables_aging, request_timing_percentiles, vat_report)
+from .xml_import import ParseError, import_invoices
 
 
 def custom_titled_filter(title):
@@ -14,13 +31,13 @@ def custom_titled_filter(title):
     return Wrapper
 
 
-def get_urls(self):
-    urls = super(InvoiceAdmin, self).get_urls()
-    my_urls = patterns(
-        "",
-        url(r"^upload_xml/$", self.admin_site.admin_view(self.upload_xml_view))
-    )
-    return my_urls + urls
+RATE_PENDING_LABEL = u'čeka tečaj'
+# the most clients or invoices an admin search returns
+SEARCH_LIMIT = 1000
+
+
+class UploadXMLForm(forms.Form):
+    xml_file = forms.FileField(label=u'XML datoteka')
 
 
 class InvoiceItemForm(forms.ModelForm):
@@ -46,7 +63,19 @@ class ClientAdmin(admin.ModelAdmin):
             'default_payment_method'
         ]}),
     ]
-    list_display = ('name', 'address', 'country')
+    list_display = ('name', 'address', 'country', 'get_statement_link')
+    search_fields = ('name', 'vat_id')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        ids = search.search(search_term, search.CLIENT, limit=SEARCH_LIMIT)
+        return queryset.filter(pk__in=ids), False
+
+    def get_statement_link(self, obj):
+        return format_html(
+            '<a href="{}">Izvod</a>', reverse('client_statement', args=[obj.id]))
+    get_statement_link.short_description = "Izvod"
 
 
 class InvoiceAdmin(admin.ModelAdmin):
@@ -63,37 +92,250 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_filter = [
         ('created', custom_titled_filter('datumu')),
         ('client', custom_titled_filter('klijentu')),
-        ('paid', custom_titled_filter('stanju racuna'))
+        ('paid', custom_titled_filter('stanju racuna')),
+        ('exchange_rate_pending', custom_titled_filter(u'tečaju koji čeka HNB')),
     ]
+    search_fields = ('seq', 'client__name', 'items__description')
     change_form_template = "admin/duplicate.html"
+    change_list_template = "admin/invoice_change_list.html"
+    actions = ['export_csv']
+
+    def get_urls(self):
+        urls = super(InvoiceAdmin, self).get_urls()
+        my_urls = [
+            url(r"^upload_xml/$", self.admin_site.admin_view(self.upload_xml_view),
+                name='invoice_invoice_upload_xml'),
+            url(r"^aging/$", self.admin_site.admin_view(self.aging_view),
+                name='invoice_invoice_aging'),
+            url(r"^vat/$", self.admin_site.admin_view(self.vat_report_view),
+                name='invoice_invoice_vat_report'),
+        ]
+        return my_urls + urls
+
+    def upload_xml_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = UploadXMLForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            try:
+                result = import_invoices(form.cleaned_data['xml_file'])
+            except ParseError as e:
+                self.message_user(request, u'Neispravan XML: %s' % e, messages.ERROR)
+            else:
+                self.message_user(request, u'Uvezeno računa: %d' % result.imported)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=u'Uvoz računa iz XML-a',
+            opts=self.model._meta,
+            form=form,
+            result=result,
+        )
+        return TemplateResponse(request, "admin/upload_xml.html", context)
+
+    def aging_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        rows = receivables_aging()
+        totals = aging_totals(rows)
+        for row in rows + [totals]:
+            row['buckets'] = [row[bucket[0]] for bucket in AGING_BUCKETS]
+        context = dict(
+            self.admin_site.each_context(request),
+            title=u'Starosna struktura potraživanja',
+            opts=self.model._meta,
+            bucket_labels=[bucket[1] for bucket in AGING_BUCKETS],
+            rows=rows,
+            totals=totals,
+        )
+        return TemplateResponse(request, "admin/aging.html", context)
+
+    def vat_report_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            year = int(request.GET.get('year', now().year))
+        except ValueError:
+            year = now().year
+        if request.GET.get('format') == 'csv':
+            return csv_response(iter_vat_report_rows(year), 'pdv-%d.csv' % year)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=u'PDV po mjesecima za %d.' % year,
+            opts=self.model._meta,
+            year=year,
+            columns=[title for name, title in VAT_REPORT_COLUMNS],
+            rows=vat_report(year),
+        )
+        return TemplateResponse(request, "admin/vat_report.html", context)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        # invoices found by number or items, and those of matching clients
+        invoice_ids = search.search(search_term, search.INVOICE, limit=SEARCH_LIMIT)
+        client_ids = search.search(search_term, search.CLIENT, limit=SEARCH_LIMIT)
+        return queryset.filter(Q(pk__in=invoice_ids) | Q(client__in=client_ids)), False
+
+    def get_queryset(self, request):
+        # money columns are stored on the invoice, so the client is the only
+        # relation the changelist rows need
+        return super(InvoiceAdmin, self).get_queryset(request).select_related('client')
+
+    def export_csv(self, request, queryset):
+        return csv_response(iter_invoice_rows(queryset), 'racuni.csv')
+    export_csv.short_description = u'Izvoz odabranih računa u CSV'
+
+    def save_related(self, request, form, formsets, change):
+        with form.instance.deferred_totals():
+            super(InvoiceAdmin, self).save_related(request, form, formsets, change)
 
     def get_subtotal(self, obj):
         return str(obj.subtotal) + " " + str(obj.currency)
     get_subtotal.short_description = "Osnovica"
+    get_subtotal.admin_order_field = 'subtotal'
 
     def get_client_name(self, obj):
         return str(obj.client.name)
     get_client_name.short_description = "Klijent"
+    get_client_name.admin_order_field = 'client__name'
 
     def get_subtotal_hrk(self, obj):
+        if obj.exchange_rate_pending:
+            return RATE_PENDING_LABEL
         return obj.subtotal_hrk
     get_subtotal_hrk.short_description = "Osnovica(HRK)"
+    get_subtotal_hrk.admin_order_field = 'subtotal_hrk'
 
     def get_vat_amount(self, obj):
         return obj.vat_amount
     get_vat_amount.short_description = "PDV"
+    get_vat_amount.admin_order_field = 'vat_amount'
 
     def get_vat_hrk(self, obj):
+        if obj.exchange_rate_pending:
+            return RATE_PENDING_LABEL
         return obj.vat_hrk
     get_vat_hrk.short_description = "PDV(HRK)"
+    get_vat_hrk.admin_order_field = 'vat_hrk'
 
     def get_total(self, obj):
         return str(obj.total) + " " + str(obj.currency)
     get_total.short_description = "Ukupno"
+    get_total.admin_order_field = 'total'
 
     def get_total_hrk(self, obj):
+        if obj.exchange_rate_pending:
+            return RATE_PENDING_LABEL
         return obj.total_hrk
     get_total_hrk.short_description = "Ukupno(HRK)"
+    get_total_hrk.admin_order_field = 'total_hrk'
+
+
+class RequestTimingAdmin(admin.ModelAdmin):
+    list_display = (
+        'created', 'view_name', 'method', 'status_code', 'queries', 'db_time',
+        'template_time', 'total_time'
+    )
+    list_filter = ['view_name', 'method']
+    ordering = ['-created']
+    change_list_template = "admin/requesttiming_change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = super(RequestTimingAdmin, self).get_urls()
+        my_urls = [
+            url(r"^percentiles/$", self.admin_site.admin_view(self.percentiles_view),
+                name='invoice_requesttiming_percentiles'),
+        ]
+        return my_urls + urls
+
+    def percentiles_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', TIMING_DAYS))
+        except ValueError:
+            days = TIMING_DAYS
+        since = now() - timedelta(days=days)
+        rows = request_timing_percentiles(RequestTiming.objects.filter(created__gte=since))
+        for row in rows:
+            row['columns'] = [value for metric in TIMING_METRICS for value in row[metric]]
+        context = dict(
+            self.admin_site.each_context(request),
+            title=u'Upiti i trajanje po pogledu (zadnjih %d dana)' % days,
+            opts=self.model._meta,
+            metrics=[
+                (RequestTiming._meta.get_field(metric).verbose_name, len(TIMING_PERCENTILES))
+                for metric in TIMING_METRICS],
+            percentiles=TIMING_PERCENTILES * len(TIMING_METRICS),
+            rows=rows,
+        )
+        return TemplateResponse(request, "admin/request_timing_percentiles.html", context)
+
+
+class ArchivedInvoiceItemInline(admin.TabularInline):
+    model = ArchivedInvoiceItem
+    fields = readonly_fields = (
+        'is_hourly', 'description', 'additional_info', 'hours', 'rate', 'amount')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+    """Archived invoices can be looked at and printed, but not changed."""
+
+    fields = readonly_fields = (
+        'seq', 'client', 'created', 'due_date', 'currency', 'exchange_rate',
+        'vat_value', 'reverse_charge', 'default_payment_method', 'paid', 'subtotal',
+        'subtotal_hrk', 'vat_amount', 'vat_hrk', 'total', 'total_hrk', 'archived'
+    )
+    inlines = [ArchivedInvoiceItemInline]
+    list_display = (
+        '__unicode__', 'get_client_name', 'created', 'total', 'currency', 'total_hrk',
+        'archived', 'get_print_link'
+    )
+    list_filter = [
+        ('created', custom_titled_filter('datumu')),
+        ('client', custom_titled_filter('klijentu')),
+    ]
+    search_fields = ('seq', 'client__name')
+    list_select_related = ('client',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        if request.method == 'POST':
+            raise PermissionDenied
+        return super(ArchivedInvoiceAdmin, self).change_view(
+            request, object_id, form_url, extra_context)
+
+    def get_client_name(self, obj):
+        return obj.client.name
+    get_client_name.short_description = "Klijent"
+    get_client_name.admin_order_field = 'client__name'
+
+    def get_print_link(self, obj):
+        return format_html('<a href="{}">Ispis</a>', obj.get_absolute_url())
+    get_print_link.short_description = "Ispis"
+
+
+class VatRateAdmin(admin.ModelAdmin):
+    list_display = ('country', 'rate', 'reverse_charge', 'valid_from', 'valid_to')
+    list_filter = ['country', 'reverse_charge']
+    ordering = ['country', '-valid_from']
 
 admin.site.register(Client, ClientAdmin)
 admin.site.register(Invoice, InvoiceAdmin)
+admin.site.register(RequestTiming, RequestTimingAdmin)
+admin.site.register(VatRate, VatRateAdmin)
+admin.site.register(ArchivedInvoice, ArchivedInvoiceAdmin)
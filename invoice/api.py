@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+from functools import wraps
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.http import require_http_methods
+
+from . import search
+from .bulk import create_invoices
+from .models import Client, Invoice, InvoiceItem, format_invoice_number
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+CLIENT_FIELDS = (
+    'id', 'name', 'address', 'country', 'vat_id', 'currency', 'default_payment_method',
+)
+INVOICE_FIELDS = (
+    'id', 'seq', 'client', 'created', 'due_date', 'currency', 'exchange_rate',
+    'vat_value', 'reverse_charge', 'default_payment_method', 'paid',
+    'subtotal', 'vat_amount', 'total', 'subtotal_hrk', 'vat_hrk', 'total_hrk',
+    'modified',
+)
+ITEM_FIELDS = (
+    'id', 'is_hourly', 'description', 'additional_info', 'rate', 'hours', 'amount',
+)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def api_view(view=None, methods=('GET',)):
+    """
+    Answer requests of logged in users with JSON, errors included.
+
+    Users are authenticated by their admin session, so unsafe methods need
+    the CSRF token like any form (see the README). The view returns
+    the data to encode, or a ``(data, status)`` pair.
+    """
+
+    def decorator(view):
+        @require_http_methods(list(methods))
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated():
+                return JsonResponse({'error': 'Authentication required'}, status=401)
+            try:
+                data = view(request, *args, **kwargs)
+            except BadRequest as e:
+                return JsonResponse({'error': force_text(e)}, status=400)
+            status = 200
+            if isinstance(data, tuple):
+                data, status = data
+            return JsonResponse(data, status=status)
+        return wrapper
+
+    return decorator(view) if view is not None else decorator
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _fields(request, allowed, default=None):
+    if 'fields' not in request.GET:
+        return list(default or allowed)
+    fields = [name for name in request.GET['fields'].split(',') if name]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise BadRequest('Unknown fields: %s' % ', '.join(sorted(unknown)))
+    return fields
+
+
+def encode_cursor(created, id):
+    return force_text(urlsafe_base64_encode(force_bytes('%s,%d' % (created.isoformat(), id))))
+
+
+def decode_cursor(cursor):
+    try:
+        created, id = force_text(urlsafe_base64_decode(cursor)).rsplit(',', 1)
+        created, id = parse_datetime(created), int(id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        created = None
+    if created is None:
+        raise BadRequest('Invalid cursor')
+    return created, id
+
+
+def _next_url(request, **params):
+    query = request.GET.copy()
+    # QueryDict.update() would add a second cursor next to this page's
+    for key, value in params.items():
+        query[key] = value
+    return request.build_absolute_uri('%s?%s' % (request.path, query.urlencode()))
+
+
+def _page(request, rows, limit, cursor):
+    # one row more than asked for tells whether there is a next page
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': rows,
+        'next': _next_url(request, **cursor(rows[-1])) if has_next else None,
+    }
+
+
+def _embed_items(invoices):
+    """Attach the items of all `invoices` rows using a single query."""
+    by_invoice = {}
+    for item in InvoiceItem.objects.filter(
+            invoice_id__in=[invoice['id'] for invoice in invoices]
+    ).order_by('id').values('invoice_id', *ITEM_FIELDS):
+        by_invoice.setdefault(item.pop('invoice_id'), []).append(item)
+    for invoice in invoices:
+        invoice['items'] = by_invoice.get(invoice['id'], [])
+
+
+@api_view
+def client_list(request):
+    limit = _limit(request)
+    clients = Client.objects.order_by('id').values(*CLIENT_FIELDS)
+    if 'after' in request.GET:
+        try:
+            clients = clients.filter(id__gt=int(request.GET['after']))
+        except ValueError:
+            raise BadRequest('after must be a client id')
+    rows = list(clients[:limit + 1])
+    return _page(request, rows, limit, lambda row: {'after': row['id']})
+
+
+@api_view
+def client_detail(request, id=None):
+    return get_object_or_404(Client.objects.values(*CLIENT_FIELDS), id=id)
+
+
+@api_view
+def invoice_list(request):
+    """
+    List invoices in (created, id) order, `limit` at a time.
+
+    The next page starts after the (created, id) of the last row of this
+    one, so every page is a range scan however deep into the table it is.
+    Pass ``fields=`` to pick columns; items are only embedded when
+    ``items`` is among them (and by default).
+    """
+
+    limit = _limit(request)
+    fields = _fields(request, INVOICE_FIELDS + ('items',))
+    embed_items = 'items' in fields
+    columns = [name for name in fields if name != 'items']
+    # the cursor needs these, they are dropped again below when not asked for
+    query_columns = list(set(columns) | set(['id', 'created']))
+
+    invoices = Invoice.objects.order_by('created', 'id').values(*query_columns)
+    if 'client' in request.GET:
+        try:
+            invoices = invoices.filter(client=int(request.GET['client']))
+        except ValueError:
+            raise BadRequest('client must be a client id')
+    if 'cursor' in request.GET:
+        created, id = decode_cursor(request.GET['cursor'])
+        invoices = invoices.filter(Q(created__gt=created) | Q(created=created, id__gt=id))
+    rows = list(invoices[:limit + 1])
+
+    page = _page(
+        request, rows, limit,
+        lambda row: {'cursor': encode_cursor(row['created'], row['id'])})
+    if embed_items:
+        _embed_items(page['results'])
+    page['results'] = [
+        dict((name, row[name]) for name in fields) for row in page['results']]
+    return page
+
+
+@api_view
+def invoice_detail(request, id=None):
+    invoice = get_object_or_404(Invoice.objects.values(*INVOICE_FIELDS), id=id)
+    _embed_items([invoice])
+    return invoice
+
+
+@api_view(methods=['POST'])
+def invoice_bulk_create(request):
+    """
+    Create all invoices in the posted JSON list (see `invoice.bulk`) or,
+    if any of them is invalid, none.
+    """
+
+    if not request.user.has_perm('invoice.add_invoice'):
+        return {'error': 'Permission denied'}, 403
+    try:
+        rows = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        raise BadRequest('Request body is not valid JSON')
+    if not isinstance(rows, list):
+        raise BadRequest('Expected a list of invoices')
+
+    result = create_invoices(rows)
+    if result.errors:
+        return {'errors': [
+            {'index': position, 'error': message} for position, message in result.errors
+        ]}, 400
+    return {'invoices': [
+        {'id': invoice.id, 'number': format_invoice_number(invoice.seq)}
+        for invoice in result.invoices
+    ]}, 201
+
+
+SEARCH_KINDS = {
+    'client': search.CLIENT,
+    'invoice': search.INVOICE,
+}
+
+
+@api_view
+def search_view(request):
+    """
+    Search clients and invoices by name, VAT ID, address, invoice number
+    or item description, best matches first (see `invoice.search`).
+    """
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        raise BadRequest('q is required')
+    kinds = request.GET.get('kind', 'client,invoice').split(',')
+    if set(kinds) - set(SEARCH_KINDS):
+        raise BadRequest('kind must be client, invoice or both')
+    limit = _limit(request)
+
+    results = {}
+    if 'client' in kinds:
+        ids = search.search(query, search.CLIENT, limit)
+        clients = Client.objects.in_bulk(ids)
+        results['clients'] = [
+            {'id': id, 'name': clients[id].name, 'vat_id': clients[id].vat_id}
+            for id in ids if id in clients]
+    if 'invoice' in kinds:
+        ids = search.search(query, search.INVOICE, limit)
+        invoices = dict(
+            (row[0], row) for row in Invoice.objects.filter(id__in=ids).values_list(
+                'id', 'seq', 'created', 'client_id', 'client__name', 'total', 'currency'))
+        results['invoices'] = [
+            {'id': id, 'number': format_invoice_number(seq), 'created': created,
+             'client': client_id, 'client_name': client_name, 'total': total,
+             'currency': currency}
+            for id, seq, created, client_id, client_name, total, currency in (
+                invoices[id] for id in ids if id in invoices)]
+    return results
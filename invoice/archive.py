@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Moving closed invoices out of the active tables.
+
+Paid invoices with a known exchange rate from years before the last
+``ARCHIVE_AFTER_YEARS`` are copied into `ArchivedInvoice` and
+`ArchivedInvoiceItem` under their original ids and deleted from the active
+tables. The admin list, invoice numbering and filters then only work on
+recent years. Printing, the VAT rollups and number uniqueness checks still
+see archived invoices.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import make_aware, now
+
+from . import search
+from .models import ArchivedInvoice, ArchivedInvoiceItem, Invoice, InvoiceItem, _archiving
+
+
+def archive_cutoff(years=None):
+    """The start of the oldest year that is kept in the active tables."""
+    if years is None:
+        years = settings.ARCHIVE_AFTER_YEARS
+    return make_aware(datetime.datetime(now().year - years, 1, 1))
+
+
+def archivable(cutoff=None):
+    """The invoices created before `cutoff` that are closed for good."""
+    if cutoff is None:
+        cutoff = archive_cutoff()
+    return Invoice.objects.filter(created__lt=cutoff, paid=True, exchange_rate_pending=False)
+
+
+def _copy(instance, model, **extra):
+    # columns only active invoices have (e.g. Invoice.source) aren't kept
+    names = set(field.attname for field in model._meta.concrete_fields)
+    values = dict(
+        (field.attname, getattr(instance, field.attname))
+        for field in instance._meta.concrete_fields if field.attname in names)
+    values.update(extra)
+    return model(**values)
+
+
+def archive_invoices(queryset, batch_size=500):
+    """
+    Move the invoices in `queryset` and their items into the archive.
+
+    Every batch is copied and deleted in its own transaction, so an
+    interrupted run leaves each invoice either active or archived. Returns
+    the number of invoices moved.
+    """
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            invoices = list(queryset.order_by('id')[:batch_size])
+            if not invoices:
+                break
+            ids = [invoice.id for invoice in invoices]
+            stamp = now()
+            ArchivedInvoice.objects.bulk_create(
+                _copy(invoice, ArchivedInvoice, archived=stamp) for invoice in invoices)
+            ArchivedInvoiceItem.objects.bulk_create(
+                _copy(item, ArchivedInvoiceItem)
+                for item in InvoiceItem.objects.filter(invoice_id__in=ids).order_by('id'))
+            _archiving.active = True
+            try:
+                Invoice.objects.filter(id__in=ids).delete()
+            finally:
+                _archiving.active = False
+            search.remove(search.INVOICE, ids)
+        archived += len(ids)
+    return archived
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data and timing helpers for benchmarking the invoicing models.
+
+Seeding writes to the configured database, so point ``DATABASE_NAME`` at a
+scratch database before using any of this.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from . import search
+from .models import Client, ExchangeRate, Invoice, InvoiceItem
+
+# fixed rates stored for every day instead of asking HNB
+BENCHMARK_RATES = {
+    Client.CURRENCY_EUR: Decimal('7.530000'),
+    Client.CURRENCY_USD: Decimal('6.790000'),
+    Client.CURRENCY_AUD: Decimal('5.120000'),
+}
+
+BENCHMARK_CLIENTS = (
+    # country, vat_id
+    ('HR', ''),
+    ('SE', 'SE999999999901'),
+    ('DE', ''),
+    ('US', ''),
+    ('GB', ''),
+)
+
+
+def mock_rates(date_from, date_to):
+    """Store `BENCHMARK_RATES` for every day from `date_from` to `date_to`."""
+    stored = set(ExchangeRate.objects.filter(
+        date__range=(date_from, date_to)).dates('date', 'day'))
+    rates = []
+    day = date_from
+    while day <= date_to:
+        if day not in stored:
+            rates.extend(
+                ExchangeRate(date=day, currency=currency, rate=rate)
+                for currency, rate in BENCHMARK_RATES.items())
+        day += datetime.timedelta(days=1)
+    ExchangeRate.objects.bulk_create(rates)
+
+
+def seed(clients, invoices, items=0, years=3, batch_size=500, random_seed=0, progress=None):
+    """
+    Add `clients` clients and `invoices` invoices with `items` items each,
+    created over the last `years` years.
+
+    Invoices go through `InvoiceManager.create_batch`, so numbers, VAT and
+    stored totals are the same as for real ones. Every batch looks its
+    invoices up by id, so `batch_size` stays under SQLite's limit of 999
+    query parameters.
+    """
+
+    rng = random.Random(random_seed)
+    end = now()
+    start = end - datetime.timedelta(days=365 * years)
+    mock_rates(start.date(), end.date())
+
+    currencies = [currency for currency, name in Client.CURRENCY_CHOICES]
+    new_clients = []
+    for n in range(clients):
+        country, vat_id = BENCHMARK_CLIENTS[n % len(BENCHMARK_CLIENTS)]
+        new_clients.append(Client(
+            name='Benchmark klijent %d' % n,
+            address='Ulica %d\n10000 Zagreb' % n,
+            country=country,
+            vat_id=vat_id,
+            currency=rng.choice(currencies)))
+    Client.objects.bulk_create(new_clients)
+    all_clients = list(Client.objects.all())
+    search.index_clients([client.id for client in all_clients])
+
+    span = int((end - start).total_seconds())
+    rates = {}
+    created_count = 0
+    while created_count < invoices:
+        batch = []
+        for n in range(min(batch_size, invoices - created_count)):
+            client = rng.choice(all_clients)
+            invoice = Invoice(
+                client=client,
+                currency=client.currency,
+                default_payment_method=client.default_payment_method,
+                created=start + datetime.timedelta(seconds=rng.randint(0, span)),
+                paid=rng.random() < 0.8)
+            invoice_items = []
+            for k in range(items):
+                hourly = rng.random() < 0.7
+                invoice_items.append(InvoiceItem(
+                    is_hourly=hourly,
+                    description='Stavka %d' % k,
+                    rate=Decimal(rng.randint(20, 80)) if hourly else None,
+                    hours=Decimal(rng.randint(1, 400)) / 10 if hourly else None,
+                    amount=None if hourly else Decimal(rng.randint(1000, 500000)) / 100))
+            batch.append((invoice, invoice_items))
+        Invoice.objects.create_batch(batch, rates=rates)
+        created_count += len(batch)
+        if progress is not None:
+            progress(created_count)
+
+
+def timed(func, repeat=5):
+    """Run `func` `repeat` times and return the median run time in seconds."""
+    times = []
+    for n in range(repeat):
+        started = time.time()
+        func()
+        times.append(time.time() - started)
+    times.sort()
+    return times[len(times) // 2]
+
+
+class _Rollback(Exception):
+    pass
+
+
+def rolled_back(func):
+    """Wrap `func` so whatever it writes to the database is undone."""
+    def run():
+        try:
+            with transaction.atomic():
+                func()
+                raise _Rollback
+        except _Rollback:
+            pass
+    return run
+
+
+def measure(func, repeat=5):
+    """
+    Run `func` `repeat` times and return the median, fastest and slowest
+    run time in milliseconds and the number of queries of one run.
+    """
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    times = []
+    for n in range(repeat):
+        started = time.time()
+        func()
+        times.append((time.time() - started) * 1000)
+    times.sort()
+    return {
+        'median_ms': round(times[len(times) // 2], 3),
+        'min_ms': round(times[0], 3),
+        'max_ms': round(times[-1], 3),
+        'queries': len(queries),
+    }
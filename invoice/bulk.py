@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Creating many invoices at once from plain data, e.g. decoded JSON::
+
+    [
+        {
+            "client": 3,
+            "created": "2016-05-10T10:00:00",
+            "currency": "USD",
+            "seq": 12,
+            "paid": false,
+            "items": [
+                {"is_hourly": true, "rate": "40", "hours": "12.5",
+                 "description": "Development"},
+                {"is_hourly": false, "amount": "100", "description": "Hosting"}
+            ]
+        }
+    ]
+
+Only ``client`` (the client id) is required on an invoice; the currency and
+payment method default to the client's. Without ``seq`` the next free
+invoice number is used, without ``created`` the current time.
+"""
+
+from __future__ import unicode_literals
+
+from django.core.exceptions import ValidationError
+from django.utils import six
+from django.utils.timezone import is_naive, make_aware
+
+from .models import Client, Invoice, InvoiceItem, year_of
+from .xml_import import _error_text
+
+INVOICE_INPUT_FIELDS = ('created', 'currency', 'default_payment_method', 'seq', 'paid')
+ITEM_INPUT_FIELDS = ('is_hourly', 'description', 'additional_info', 'amount', 'rate', 'hours')
+
+
+class BulkResult(object):
+
+    def __init__(self):
+        self.invoices = []
+        self.errors = []
+
+    def add_error(self, row, message):
+        self.errors.append((row, message))
+
+
+def _clean_value(model, name, value):
+    field = model._meta.get_field(name)
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise ValidationError({name: e.messages})
+
+
+def _client_id(data):
+    # JSON true is an int to Python, lists and objects can't be looked up
+    client_id = data.get('client')
+    return client_id if type(client_id) in six.integer_types else None
+
+
+def _build_invoice(data, clients):
+    if not isinstance(data, dict):
+        raise ValidationError('Račun mora biti objekt')
+    client = clients.get(_client_id(data))
+    if client is None:
+        raise ValidationError('Nepoznat klijent: %s' % data.get('client'))
+
+    invoice = Invoice(
+        client=client,
+        currency=client.currency,
+        default_payment_method=client.default_payment_method)
+    for name in INVOICE_INPUT_FIELDS:
+        if data.get(name) is not None:
+            setattr(invoice, name, _clean_value(Invoice, name, data[name]))
+    if is_naive(invoice.created):
+        invoice.created = make_aware(invoice.created)
+    # numbers in use are looked up for all invoices at once
+    invoice.full_clean(exclude=['client'], validate_unique=False)
+
+    items = []
+    for item_data in data.get('items') or []:
+        if not isinstance(item_data, dict):
+            raise ValidationError('Stavka mora biti objekt')
+        item = InvoiceItem()
+        for name in ITEM_INPUT_FIELDS:
+            if item_data.get(name) is not None:
+                setattr(item, name, _clean_value(InvoiceItem, name, item_data[name]))
+        item.full_clean(exclude=['invoice'])
+        items.append(item)
+    return invoice, items
+
+
+def create_invoices(rows):
+    """
+    Validate and create the invoices described by `rows`.
+
+    Clients are loaded with one query, invoices and items are checked with
+    `full_clean` like in the admin, without queries, and already used
+    invoice numbers with one query per year. If anything is
+    wrong nothing is created and the errors are reported by the position of
+    the invoice in `rows`; otherwise all invoices are inserted in one
+    transaction by `InvoiceManager.create_batch`.
+    """
+
+    result = BulkResult()
+    client_ids = set(_client_id(row) for row in rows if isinstance(row, dict))
+    clients = Client.objects.in_bulk([id for id in client_ids if id is not None])
+
+    invoices = []
+    for position, row in enumerate(rows):
+        try:
+            invoices.append((position, ) + _build_invoice(row, clients))
+        except ValidationError as e:
+            result.add_error(position, _error_text(e))
+
+    taken = Invoice.objects.taken_numbers(invoice for position, invoice, items in invoices)
+    for position, invoice, items in invoices:
+        key = (year_of(invoice.created), invoice.seq)
+        if invoice.seq is None:
+            continue
+        if key in taken:
+            result.add_error(position, 'Račun broj %s za %s. već postoji' % key[::-1])
+        taken.add(key)
+
+    if result.errors:
+        result.errors.sort()
+        return result
+    result.invoices = Invoice.objects.create_batch(
+        [(invoice, items) for position, invoice, items in invoices])
+    return result
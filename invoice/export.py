@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import csv
+import datetime
+
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_str
+from django.utils.timezone import localtime, make_aware
+
+EXPORT_COLUMNS = (
+    ('id', 'ID'),
+    ('seq', 'Broj računa'),
+    ('created', 'Datum izrade'),
+    ('due_date', 'Datum dospijeća'),
+    ('client__name', 'Klijent'),
+    ('client__vat_id', 'VAT ID'),
+    ('client__country', 'Država'),
+    ('currency', 'Valuta'),
+    ('exchange_rate', 'Tečaj'),
+    ('vat_value', 'Stopa PDV-a'),
+    ('subtotal', 'Osnovica'),
+    ('vat_amount', 'PDV'),
+    ('total', 'Ukupno'),
+    ('subtotal_hrk', 'Osnovica (HRK)'),
+    ('vat_hrk', 'PDV (HRK)'),
+    ('total_hrk', 'Ukupno (HRK)'),
+    ('paid', 'Plaćen'),
+)
+
+
+class Echo(object):
+    """File-like object that hands back whatever the csv writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def created_between(queryset, date_from=None, date_to=None):
+    """Filter invoices created on days `date_from` to `date_to`, inclusive."""
+    if date_from is not None:
+        queryset = queryset.filter(
+            created__gte=make_aware(datetime.datetime.combine(date_from, datetime.time.min)))
+    if date_to is not None:
+        queryset = queryset.filter(
+            created__lt=make_aware(datetime.datetime.combine(
+                date_to + datetime.timedelta(days=1), datetime.time.min)))
+    return queryset
+
+
+def _format(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'da' if value else 'ne'
+    if isinstance(value, datetime.datetime):
+        return localtime(value).strftime('%Y-%m-%d')
+    return value
+
+
+def iter_invoice_rows(queryset, chunk_size=2000):
+    """
+    Yield the export header and one row per invoice in `queryset`.
+
+    Invoices are read in primary key order in chunks of `chunk_size`, so
+    neither the queryset nor the whole result set is ever held in memory.
+    All totals are stored columns and the client is joined in, so every
+    chunk takes exactly one query.
+    """
+
+    fields = [name for name, title in EXPORT_COLUMNS]
+    yield [title for name, title in EXPORT_COLUMNS]
+
+    queryset = queryset.order_by('id').values_list(*fields)
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size].iterator())
+        if not rows:
+            break
+        for row in rows:
+            yield [_format(value) for value in row]
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow([force_str(value) for value in row])
+
+
+def csv_response(rows, filename):
+    response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import argparse
+import datetime
+
+from django.utils.dateparse import parse_date
+
+
+def date_argument(value):
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise argparse.ArgumentTypeError('Expected a YYYY-MM-DD date, got %r' % value)
+    return date
+
+
+def month_argument(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected a YYYY-MM month, got %r' % value)
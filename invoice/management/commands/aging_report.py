@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import make_aware
+
+from invoice.management.arguments import date_argument
+from invoice.reports import AGING_BUCKETS, aging_totals, receivables_aging
+
+
+class Command(BaseCommand):
+    help = 'Print unpaid invoice totals per client and currency, in HRK, by days overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', dest='as_of', type=date_argument,
+            help='Age the receivables as of the end of this day (YYYY-MM-DD, default: now)')
+
+    def handle(self, *args, **options):
+        as_of = options['as_of']
+        if as_of is not None:
+            as_of = make_aware(datetime.combine(as_of, time.max))
+        rows = receivables_aging(as_of)
+
+        keys = [bucket[0] for bucket in AGING_BUCKETS] + ['total_hrk_sum']
+        header = ['Klijent', 'Valuta'] + [bucket[1] for bucket in AGING_BUCKETS] + ['Ukupno']
+        self.stdout.write('\t'.join(header))
+        for row in rows:
+            values = [row['client__name'], row['currency']] + [row[key] or 0 for key in keys]
+            self.stdout.write('\t'.join('%s' % value for value in values))
+        totals = aging_totals(rows)
+        self.stdout.write('\t'.join(
+            ['Ukupno', ''] + ['%s' % totals[key] for key in keys]))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoice.archive import archivable, archive_cutoff, archive_invoices
+
+
+class Command(BaseCommand):
+    help = 'Move paid invoices of past years out of the active tables into the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--years', type=int, default=settings.ARCHIVE_AFTER_YEARS,
+            help='Keep this many past years besides the current one active')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of invoices moved per transaction')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report how many invoices would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['years'])
+        invoices = archivable(cutoff)
+        if options['dry_run']:
+            self.stdout.write('Would archive %d invoices created before %s.' % (
+                invoices.count(), cutoff.date()))
+            return
+        archived = archive_invoices(invoices, options['batch_size'])
+        self.stdout.write('Archived %d invoices created before %s.' % (archived, cutoff.date()))
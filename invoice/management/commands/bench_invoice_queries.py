@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.utils.six.moves import input
+from django.utils.timezone import now
+
+from invoice.benchmark import seed, timed
+from invoice.models import Client, Invoice
+
+
+def hot_queries():
+    today = now()
+    year = today.year
+    month_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    client = Client.objects.order_by('id').first()
+    return [
+        ('seq of the year', lambda: Invoice.objects.filter(
+            created__year=year).aggregate(models.Max('seq'))),
+        ('admin date filter', lambda: list(Invoice.objects.filter(
+            created__gte=month_start).order_by('-created')[:100])),
+        ('client invoices', lambda: list(Invoice.objects.filter(
+            client=client).order_by('-created')[:100])),
+        ('overdue count', lambda: Invoice.objects.filter(
+            paid=False, due_date__lt=today).count()),
+        ('year by currency', lambda: list(Invoice.objects.filter(
+            created__year=year).values('currency').annotate(models.Sum('total_hrk')))),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Time the hot invoice queries with and without the invoice indexes '
+            'at growing table sizes. Adds benchmark data to the database!')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10000,100000,1000000',
+            help='Comma separated invoice counts to measure at')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Runs per query, the median is reported')
+        parser.add_argument(
+            '--noinput', action='store_false', dest='interactive', default=True,
+            help='Do not ask for confirmation before adding data')
+
+    def set_indexes(self, enabled):
+        indexes = set(Invoice._meta.index_together)
+        with connection.schema_editor() as editor:
+            if enabled:
+                editor.alter_index_together(Invoice, set(), indexes)
+            else:
+                editor.alter_index_together(Invoice, indexes, set())
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of numbers')
+        if options['interactive']:
+            answer = input(
+                'This adds up to %d invoices to %s. Continue? [y/N] ' % (
+                    sizes[-1], connection.settings_dict['NAME']))
+            if answer.lower() not in ('y', 'yes'):
+                raise CommandError('Cancelled')
+
+        self.stdout.write('%10s  %-20s %12s %12s' % ('invoices', 'query', 'no index', 'index'))
+        for size in sizes:
+            missing = size - Invoice.objects.count()
+            if missing > 0:
+                seed(clients=max(10, missing // 100) if not Client.objects.exists() else 0,
+                     invoices=missing)
+            results = {}
+            try:
+                self.set_indexes(False)
+                for name, query in hot_queries():
+                    results[name] = [timed(query, options['repeat'])]
+            finally:
+                self.set_indexes(True)
+            for name, query in hot_queries():
+                results[name].append(timed(query, options['repeat']))
+            for name, query in hot_queries():
+                without_index, with_index = results[name]
+                self.stdout.write('%10d  %-20s %10.2fms %10.2fms' % (
+                    size, name, without_index * 1000, with_index * 1000))
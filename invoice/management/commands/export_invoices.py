@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from invoice.export import created_between, iter_csv, iter_invoice_rows
+from invoice.management.arguments import date_argument
+from invoice.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Write invoices with their HRK totals as CSV to standard output'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='date_from', type=date_argument,
+            help='Only invoices created on or after this day (YYYY-MM-DD)')
+        parser.add_argument(
+            '--to', dest='date_to', type=date_argument,
+            help='Only invoices created on or before this day (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        queryset = created_between(
+            Invoice.objects.all(), options['date_from'], options['date_to'])
+        for line in iter_csv(iter_invoice_rows(queryset)):
+            self.stdout.write(line, ending='')
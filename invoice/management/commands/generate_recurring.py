@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from invoice.management.arguments import month_argument
+from invoice.models import Invoice, month_bounds
+
+
+def previous_month():
+    return (now().date().replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+
+
+class Command(BaseCommand):
+    help = 'Issue new invoices for this month by duplicating all invoices of a past month'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month', type=month_argument,
+            help='Month to duplicate (YYYY-MM), defaults to the previous month')
+        parser.add_argument(
+            '--client', type=int, action='append', dest='clients',
+            help='Only duplicate invoices of this client id (can be repeated)')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report how many invoices would be generated')
+
+    def handle(self, *args, **options):
+        month = options['month'] or previous_month()
+        sources = Invoice.objects.filter(created__year=month.year, created__month=month.month)
+        if options['clients']:
+            sources = sources.filter(client_id__in=options['clients'])
+        # a repeated run (e.g. a retried cron job) doesn't copy them again
+        this_month = month_bounds(now().date())[0]
+        done = sources.filter(copies__created__gte=this_month).distinct().count()
+        sources = sources.exclude(copies__created__gte=this_month)
+        if done:
+            self.stdout.write('Skipping %d invoices already duplicated this month.' % done)
+
+        if options['dry_run']:
+            self.stdout.write('Would generate %d invoices from %s.' % (
+                sources.count(), month.strftime('%Y-%m')))
+            return
+
+        started = time.time()
+        invoices = Invoice.objects.duplicate(sources)
+        elapsed = time.time() - started
+
+        self.stdout.write('Generated %d invoices from %s in %.2fs (%.1f invoices/s).' % (
+            len(invoices), month.strftime('%Y-%m'), elapsed,
+            len(invoices) / elapsed if elapsed else 0))
+        if invoices:
+            self.stdout.write('Invoice numbers %s - %s.' % (invoices[0], invoices[-1]))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.xml_import import ParseError, import_invoices
+
+
+class Command(BaseCommand):
+    help = 'Import invoices from an XML file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='XML file to import')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of invoices inserted per transaction')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        try:
+            with open(options['path'], 'rb') as source:
+                result = import_invoices(source, batch_size=options['batch_size'])
+        except (IOError, ParseError) as e:
+            raise CommandError(e)
+        elapsed = time.time() - started
+
+        for row, message in result.errors:
+            self.stderr.write('Invoice #%d: %s' % (row, message))
+        self.stdout.write('Imported %d invoices in %.2fs, skipped %d.' % (
+            result.imported, elapsed, len(result.errors)))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from invoice.models import RequestTiming
+from invoice.reports import (
+    TIMING_DAYS, TIMING_METRICS, TIMING_PERCENTILES, request_timing_percentiles)
+
+
+class Command(BaseCommand):
+    help = 'Print query count and latency percentiles per view, as recorded by QueryStatsMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=TIMING_DAYS,
+            help='Only requests from the last this many days')
+        parser.add_argument(
+            '--view', dest='view_name',
+            help='Only requests to this view (e.g. admin:invoice_invoice_changelist)')
+        parser.add_argument(
+            '--clear', action='store_true', default=False,
+            help='Delete the recorded requests older than --days instead')
+
+    def handle(self, *args, **options):
+        since = now() - timedelta(days=options['days'])
+        if options['clear']:
+            deleted = RequestTiming.objects.filter(created__lt=since).delete()[0]
+            self.stdout.write('Deleted %d recorded requests.' % deleted)
+            return
+
+        timings = RequestTiming.objects.filter(created__gte=since)
+        if options['view_name']:
+            timings = timings.filter(view_name=options['view_name'])
+
+        header = ['view', 'requests']
+        for metric in TIMING_METRICS:
+            header.extend('%s p%d' % (metric, p) for p in TIMING_PERCENTILES)
+        self.stdout.write('\t'.join(header))
+        for row in request_timing_percentiles(timings):
+            values = [row['view_name'], '%d' % row['requests']]
+            for metric in TIMING_METRICS:
+                values.extend('%g' % round(value, 1) for value in row[metric])
+            self.stdout.write('\t'.join(values))
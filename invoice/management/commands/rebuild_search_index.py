@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from invoice import search
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the search documents of all clients and invoices'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not search.rebuild():
+                raise CommandError(
+                    'This database has no search table, searching uses plain filters')
+        self.stdout.write('Search index rebuilt.')
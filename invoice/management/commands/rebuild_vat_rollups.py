@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import six
+
+from invoice.models import Invoice, VatRollup, month_of
+
+ROLLUP_KEY = ('month', 'vat_value', 'reverse_charge', 'country')
+ROLLUP_TOTALS = ('invoices', 'subtotal_hrk', 'vat_hrk', 'total_hrk')
+
+
+def _rollup_key(rollup):
+    return tuple(six.text_type(getattr(rollup, name)) for name in ROLLUP_KEY)
+
+
+def _rollup_totals(rollup):
+    return tuple(getattr(rollup, name) for name in ROLLUP_TOTALS)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the monthly VAT rollups from all invoices and verify the stored ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report rollups that differ, without replacing them')
+
+    def handle(self, *args, **options):
+        stored = dict(
+            (_rollup_key(rollup), _rollup_totals(rollup))
+            for rollup in VatRollup.objects.all().iterator())
+
+        months = set(month_of(created) for created in Invoice.objects.datetimes('created', 'month'))
+        rollups = []
+        for month in sorted(months):
+            rollups.extend(VatRollup.objects.compute(month))
+
+        mismatched = 0
+        for rollup in rollups:
+            if stored.pop(_rollup_key(rollup), None) != _rollup_totals(rollup):
+                mismatched += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write('Rollup %s is wrong or missing' % (rollup,))
+        # whatever is left has no invoices behind it any more
+        mismatched += len(stored)
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                VatRollup.objects.all().delete()
+                VatRollup.objects.bulk_create(rollups, batch_size=500)
+
+        self.stdout.write('Computed %d rollups over %d months, %s %d.' % (
+            len(rollups), len(months),
+            'found wrong' if options['dry_run'] else 'replaced wrong', mismatched))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import multiprocessing
+import os
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, models, transaction
+from django.utils.six.moves import map
+from django.utils.timezone import now
+
+from invoice.models import (
+    TOTAL_FIELDS, Invoice, InvoiceEvent, InvoiceItem, RatePending, VatRollup, month_of)
+
+RECALC_FIELDS = (
+    'exchange_rate', 'exchange_rate_pending', 'reverse_charge', 'vat_value') + TOTAL_FIELDS
+
+
+def _case_update(rows, fields):
+    """
+    Write `rows` ({invoice id: {field: value}}) with one UPDATE per batch,
+    every field set through a CASE over the invoice ids.
+    """
+
+    # every row takes an id and a value parameter per field, plus its id in
+    # the WHERE clause, and SQLite caps the parameters of a query
+    batch_size = connection.ops.bulk_batch_size([None] * (2 * len(fields) + 1), list(rows))
+    ids = sorted(rows)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        values = {}
+        for name in fields:
+            field = Invoice._meta.get_field(name)
+            values[name] = models.Case(*[
+                models.When(id=invoice_id, then=models.Value(rows[invoice_id][name], output_field=field))
+                for invoice_id in batch
+            ], output_field=field)
+        Invoice.objects.filter(id__in=batch).update(modified=now(), **values)
+
+
+def _recalc_range(id_range):
+    """
+    Recompute the invoices with ids in `id_range` and store the changed ones.
+
+    Exchange rates are resolved once per currency and day and VAT comes
+    from the cached rate table, so nothing is fetched per invoice. The
+    changes are written to the invoice change log in the same transaction.
+    Returns the range, the number of invoices checked and changed and the
+    number left with a pending exchange rate.
+    """
+
+    first_id, last_id, year = id_range
+    invoices = list(
+        Invoice.objects.filter(created__year=year, id__gte=first_id, id__lte=last_id)
+        .select_related('client').order_by('id'))
+    subtotals = dict(InvoiceItem.objects.filter(
+        invoice_id__in=[invoice.id for invoice in invoices]
+    ).values_list('invoice').annotate(models.Sum('amount')))
+
+    rates = {}
+    changed = {}
+    pending = 0
+    for invoice in invoices:
+        stored = dict((name, getattr(invoice, name)) for name in RECALC_FIELDS)
+        invoice.reverse_charge, invoice.vat_value = invoice._calc_vat()
+        rate_key = (invoice.currency, invoice.created.date())
+        if rate_key not in rates:
+            try:
+                rates[rate_key] = invoice.get_exchange_rate(*rate_key)
+            except RatePending:
+                rates[rate_key] = RatePending
+        invoice.exchange_rate_pending = rates[rate_key] is RatePending
+        invoice.exchange_rate = None if invoice.exchange_rate_pending else rates[rate_key]
+        pending += invoice.exchange_rate_pending
+        invoice.subtotal = Decimal(subtotals.get(invoice.id) or 0)
+        invoice._calc_totals()
+        row = dict((name, getattr(invoice, name)) for name in RECALC_FIELDS)
+        if row != stored:
+            changed[invoice.id] = row
+
+    if changed:
+        with transaction.atomic():
+            _case_update(changed, RECALC_FIELDS)
+            InvoiceEvent.objects.record(changed)
+    return first_id, last_id, len(invoices), len(changed), pending
+
+
+def _partition(ids, size):
+    for start in range(0, len(ids), size):
+        chunk = ids[start:start + size]
+        yield chunk[0], chunk[-1]
+
+
+def _load_checkpoint(path, year):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('year') != year:
+        raise CommandError('Checkpoint %s belongs to %s, not %s' % (
+            path, checkpoint.get('year'), year))
+    return [tuple(done) for done in checkpoint['done']]
+
+
+def _save_checkpoint(path, year, done):
+    # write a new file and swap it in, so an interrupted write never
+    # leaves a truncated checkpoint behind
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'year': year, 'done': sorted(done)}, f)
+    os.rename(path + '.tmp', path)
+
+
+class Command(BaseCommand):
+    help = "Recompute exchange rates, VAT and totals of a year's invoices in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--year', type=int, required=True, help='Year of the invoices to recompute')
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='Number of worker processes')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of invoices per id range handed to a worker')
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording finished id ranges (default: one per year in RECALC_CHECKPOINT_DIR)')
+        parser.add_argument(
+            '--restart', action='store_true', default=False,
+            help='Ignore an existing checkpoint and recompute every invoice')
+
+    def handle(self, *args, **options):
+        year = options['year']
+        path = options['checkpoint'] or os.path.join(
+            settings.RECALC_CHECKPOINT_DIR, 'recalc-invoices-%d.json' % year)
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        done = [] if options['restart'] else _load_checkpoint(path, year)
+
+        ids = [
+            invoice_id
+            for invoice_id in Invoice.objects.filter(created__year=year)
+            .order_by('id').values_list('id', flat=True)
+            if not any(first <= invoice_id <= last for first, last in done)]
+        if done:
+            self.stdout.write('Resuming from %s, %d invoices left.' % (path, len(ids)))
+        ranges = [(first, last, year) for first, last in _partition(ids, options['batch_size'])]
+
+        pool = None
+        if options['processes'] > 1 and len(ranges) > 1:
+            # forked workers must open their own database connections
+            connections.close_all()
+            pool = multiprocessing.Pool(options['processes'])
+            results = pool.imap_unordered(_recalc_range, ranges)
+        else:
+            results = map(_recalc_range, ranges)
+
+        checked = changed = pending = 0
+        started = time.time()
+        try:
+            for first_id, last_id, range_checked, range_changed, range_pending in results:
+                checked += range_checked
+                changed += range_changed
+                pending += range_pending
+                done.append((first_id, last_id))
+                _save_checkpoint(path, year, done)
+                elapsed = time.time() - started
+                self.stdout.write('%d/%d invoices, %d changed (%.1f invoices/s)' % (
+                    checked, len(ids), changed, checked / elapsed if elapsed else 0))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        elapsed = time.time() - started
+
+        VatRollup.objects.refresh(
+            month_of(created)
+            for created in Invoice.objects.filter(created__year=year).datetimes('created', 'month'))
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.stdout.write('Recomputed %d invoices of %d in %.2fs, %d changed.' % (
+            checked, year, elapsed, changed))
+        if pending:
+            self.stdout.write(
+                '%d invoices still wait for an exchange rate, run resolve_pending_rates.' % pending)
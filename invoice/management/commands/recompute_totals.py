@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils.timezone import now
+
+from invoice.models import (
+    TOTAL_FIELDS, Invoice, InvoiceEvent, InvoiceItem, VatRollup, calc_totals, month_of)
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored invoice totals from their items and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of invoices checked per query')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report invoices with wrong totals')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        months = set()
+        last_id = 0
+        while True:
+            invoices = list(Invoice.objects.filter(id__gt=last_id).order_by('id').values(
+                'id', 'created', 'vat_value', 'exchange_rate', *TOTAL_FIELDS)[:batch_size])
+            if not invoices:
+                break
+            last_id = invoices[-1]['id']
+            subtotals = dict(InvoiceItem.objects.filter(
+                invoice_id__in=[inv['id'] for inv in invoices]
+            ).values_list('invoice').annotate(models.Sum('amount')))
+
+            with transaction.atomic():
+                repaired_ids = []
+                for invoice in invoices:
+                    totals = calc_totals(
+                        Decimal(subtotals.get(invoice['id']) or 0),
+                        invoice['vat_value'],
+                        invoice['exchange_rate'])
+                    if any(invoice[name] != totals[name] for name in TOTAL_FIELDS):
+                        repaired += 1
+                        if options['verbosity'] > 1:
+                            self.stdout.write('Invoice %d has wrong totals' % invoice['id'])
+                        if not options['dry_run']:
+                            Invoice.objects.filter(id=invoice['id']).update(
+                                modified=now(), **totals)
+                            months.add(month_of(invoice['created']))
+                            repaired_ids.append(invoice['id'])
+                InvoiceEvent.objects.record(repaired_ids)
+            checked += len(invoices)
+
+        VatRollup.objects.refresh(months)
+
+        self.stdout.write('Checked %d invoices, %s %d.' % (
+            checked, 'found drift in' if options['dry_run'] else 'repaired', repaired))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import multiprocessing
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.six.moves import map
+from django.utils.timezone import localtime
+
+from invoice.export import created_between
+from invoice.management.arguments import date_argument
+from invoice.models import Invoice
+from invoice.printing import get_invoice_pdf
+
+
+def _render(invoice_id):
+    return invoice_id, get_invoice_pdf(invoice_id)
+
+
+class Command(BaseCommand):
+    help = 'Render invoices as PDF and pack them into a ZIP file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Invoice ids to render')
+        parser.add_argument(
+            '--from', dest='date_from', type=date_argument,
+            help='Render invoices created on or after this day (YYYY-MM-DD)')
+        parser.add_argument(
+            '--to', dest='date_to', type=date_argument,
+            help='Render invoices created on or before this day (YYYY-MM-DD)')
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='Number of rendering processes')
+        parser.add_argument('--output', required=True, help='ZIP file to write')
+
+    def handle(self, *args, **options):
+        invoices = created_between(
+            Invoice.objects.all(), options['date_from'], options['date_to'])
+        if options['ids']:
+            invoices = invoices.filter(id__in=options['ids'])
+        names = dict(
+            (invoice_id, 'racun-%s-%s.pdf' % (localtime(created).year, seq))
+            for invoice_id, seq, created in invoices.values_list('id', 'seq', 'created'))
+        if not names:
+            raise CommandError('No invoices to render')
+
+        pool = None
+        if options['processes'] > 1:
+            # forked workers must open their own database connections
+            connections.close_all()
+            pool = multiprocessing.Pool(options['processes'])
+            results = pool.imap_unordered(_render, sorted(names), chunksize=4)
+        else:
+            results = map(_render, sorted(names))
+
+        started = time.time()
+        try:
+            # PDFs are copied into the archive from the disk cache one at a
+            # time, so they are never all held in memory
+            with zipfile.ZipFile(options['output'], 'w', zipfile.ZIP_DEFLATED) as archive:
+                for count, (invoice_id, path) in enumerate(results, 1):
+                    archive.write(path, names[invoice_id])
+                    if options['verbosity'] > 1:
+                        self.stdout.write('%d/%d %s' % (count, len(names), names[invoice_id]))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        elapsed = time.time() - started
+
+        self.stdout.write('Rendered %d invoices in %.2fs (%.1f invoices/s) into %s.' % (
+            len(names), elapsed, len(names) / elapsed if elapsed else 0, options['output']))
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from invoice.models import Invoice
+from invoice.rates import resolve_pending_rates
+
+
+class Command(BaseCommand):
+    help = 'Fetch the exchange rates of invoices saved without one and update their totals'
+
+    def handle(self, *args, **options):
+        resolved = resolve_pending_rates()
+        self.stdout.write('Resolved %d invoices, %d still pending.' % (
+            resolved, Invoice.objects.filter(exchange_rate_pending=True).count()))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import subprocess
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client as TestClient, override_settings
+from django.utils.timezone import now
+
+from invoice.benchmark import measure, rolled_back
+from invoice.export import iter_csv, iter_invoice_rows
+from invoice.models import Client, Invoice, get_latest_invoice
+from invoice.printing import build_printed_invoice, render_printed_invoice
+from invoice.reports import build_client_statement, receivables_aging, vat_report
+
+BENCHMARK_USER = 'benchmark'
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _browser():
+    user = User.objects.filter(username=BENCHMARK_USER).first()
+    if user is None:
+        user = User.objects.create_superuser(BENCHMARK_USER, '', None)
+    browser = TestClient()
+    browser.force_login(user)
+    return browser
+
+
+def _get(browser, url, **params):
+    def run():
+        response = browser.get(url, params)
+        if response.status_code != 200:
+            raise CommandError('%s answered %d' % (url, response.status_code))
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return run
+
+
+def benchmarks():
+    """The key paths to time, as (name, function) pairs."""
+    browser = _browser()
+    invoice = Invoice.objects.order_by('-created', '-id').first()
+    client = invoice.client
+    year = invoice.created.year
+    return [
+        ('admin changelist', _get(browser, reverse('admin:invoice_invoice_changelist'))),
+        ('admin changelist, filtered by client', _get(
+            browser, reverse('admin:invoice_invoice_changelist'), client__id__exact=client.id)),
+        ('print_invoice', lambda: render_printed_invoice(build_printed_invoice(invoice.id))),
+        ('print_invoice (cached)', _get(browser, invoice.get_absolute_url())),
+        ('Invoice.duplicate', rolled_back(lambda: invoice.duplicate())),
+        ('get_latest_invoice', get_latest_invoice),
+        ('CSV export of a year', lambda: list(iter_csv(iter_invoice_rows(
+            Invoice.objects.filter(created__year=year))))),
+        ('client statement', lambda: build_client_statement(client)),
+        ('aging report', receivables_aging),
+        ('VAT report', lambda: vat_report(year)),
+        ('API invoice page', _get(browser, reverse('api_invoice_list'))),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Time the key invoicing paths on the current data and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Runs per benchmark, the median, fastest and slowest are reported')
+        parser.add_argument(
+            '--only', help='Only run benchmarks whose name contains this text')
+        parser.add_argument(
+            '--output', help='Write the JSON here instead of standard output')
+
+    def handle(self, *args, **options):
+        if not Invoice.objects.exists():
+            raise CommandError('There are no invoices, add some with seed_benchmark first')
+
+        results = {}
+        # the test client talks to the project as "testserver"
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, func in benchmarks():
+                if options['only'] and options['only'] not in name:
+                    continue
+                results[name] = measure(func, options['repeat'])
+                if options['verbosity'] > 1:
+                    self.stderr.write('%-40s %10.2fms' % (name, results[name]['median_ms']))
+
+        report = {
+            'revision': _git_revision(),
+            'date': now().isoformat(),
+            'database': connection.vendor,
+            'clients': Client.objects.count(),
+            'invoices': Invoice.objects.count(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        data = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(data + '\n')
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.six.moves import input
+
+from invoice.benchmark import seed
+from invoice.models import Client
+
+
+class Command(BaseCommand):
+    help = ('Add synthetic clients and invoices for benchmarking, with stored '
+            'exchange rates instead of HNB lookups. Adds data to the database!')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Clients to add')
+        parser.add_argument('--invoices', type=int, default=10000, help='Invoices to add')
+        parser.add_argument('--items', type=int, default=3, help='Items per invoice')
+        parser.add_argument(
+            '--years', type=int, default=3,
+            help='Spread the invoices over this many past years')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed on an empty database gives the same data')
+        parser.add_argument(
+            '--noinput', action='store_false', dest='interactive', default=True,
+            help='Do not ask for confirmation before adding data')
+
+    def handle(self, *args, **options):
+        if options['invoices'] and not options['clients'] and not Client.objects.exists():
+            raise CommandError('There are no clients to add invoices to, use --clients')
+        if options['interactive']:
+            answer = input('This adds %d invoices to %s. Continue? [y/N] ' % (
+                options['invoices'], connection.settings_dict['NAME']))
+            if answer.lower() not in ('y', 'yes'):
+                raise CommandError('Cancelled')
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write('%d invoices' % count)
+
+        seed(clients=options['clients'], invoices=options['invoices'], items=options['items'],
+             years=options['years'], random_seed=options['seed'], progress=progress)
+        self.stdout.write('Added %d clients and %d invoices with %d items each.' % (
+            options['clients'], options['invoices'], options['items']))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+
+from invoice.management.arguments import date_argument
+from invoice.models import ExchangeRate, fetch_daily_rates
+
+
+class Command(BaseCommand):
+    help = 'Fetch HNB daily exchange rates for a date range into the local rate table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='date_from', type=date_argument, required=True,
+            help='First day to fetch (YYYY-MM-DD)')
+        parser.add_argument(
+            '--to', dest='date_to', type=date_argument,
+            help='Last day to fetch (YYYY-MM-DD), defaults to today')
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Number of concurrent HNB requests')
+        parser.add_argument(
+            '--force', action='store_true', default=False,
+            help='Fetch again days that are already stored')
+
+    def handle(self, *args, **options):
+        date_from = options['date_from']
+        date_to = options['date_to'] or now().date()
+        workers = options['workers']
+        if date_to < date_from:
+            raise CommandError('--to must not be before --from')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        days = [
+            date_from + datetime.timedelta(days=n)
+            for n in range((date_to - date_from).days + 1)
+        ]
+        if not options['force']:
+            stored = set(ExchangeRate.objects.filter(
+                date__range=(date_from, date_to)).dates('date', 'day'))
+            days = [day for day in days if day not in stored]
+        if not days:
+            self.stdout.write('All days in range are already stored.')
+            return
+
+        # a single session shares one keep-alive connection pool between
+        # all worker threads
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def fetch(day):
+            try:
+                return day, fetch_daily_rates(day, session=session), None
+            except (requests.RequestException, ValueError) as e:
+                return day, None, e
+
+        rates = []
+        failed = []
+        pool = ThreadPool(min(workers, len(days)))
+        started = time.time()
+        try:
+            for day, currency_data, error in pool.imap_unordered(fetch, days):
+                if error is not None:
+                    failed.append(day)
+                    self.stderr.write('%s: %s' % (day, error))
+                else:
+                    rates.extend(ExchangeRate.objects.build_daily(day, currency_data))
+        finally:
+            pool.close()
+            pool.join()
+            session.close()
+        elapsed = time.time() - started
+
+        fetched = set(rate.date for rate in rates)
+        with transaction.atomic():
+            ExchangeRate.objects.filter(date__in=fetched).delete()
+            ExchangeRate.objects.bulk_create(rates, batch_size=500)
+
+        self.stdout.write(
+            'Fetched %d days in %.2fs (%.1f requests/s), stored %d rates.' % (
+                len(days), elapsed, len(days) / elapsed if elapsed else 0, len(rates)))
+        if failed:
+            raise CommandError('Failed to fetch %d days' % len(failed))
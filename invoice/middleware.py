@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Per-request SQL and latency statistics.
+
+With ``QUERY_STATS_ENABLED`` on, every request records how many SQL queries
+it ran, how long they took, how long template rendering and the whole
+request took, as a `RequestTiming` row per request. Requests running more
+than ``QUERY_BUDGET`` queries are logged together with the stack of the
+query they repeated most. With the setting off the middleware removes
+itself at startup and costs nothing.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.template.base import Template
+
+from .models import RequestTiming
+
+logger = logging.getLogger(__name__)
+
+# statistics of the request being handled by the current thread
+_state = threading.local()
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.sql_counts = Counter()
+        self.stacks = {}
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.sql_counts[sql] += 1
+        if self.sql_counts[sql] == 2:
+            # only repeated queries are worth a stack trace, and one is enough
+            self.stacks[sql] = ''.join(traceback.format_stack()[:-3])
+
+    def most_repeated(self):
+        """Get the most repeated query, how often it ran and its stack."""
+        if not self.stacks:
+            return None
+        sql = max(self.stacks, key=lambda sql: self.sql_counts[sql])
+        return sql, self.sql_counts[sql], self.stacks[sql]
+
+
+class StatsCursorWrapper(CursorWrapper):
+
+    def _timed(self, method, sql, *args):
+        start = time.time()
+        try:
+            return getattr(self.cursor, method)(sql, *args)
+        finally:
+            stats = getattr(_state, 'stats', None)
+            if stats is not None:
+                stats.add_query(sql, time.time() - start)
+
+    def execute(self, sql, params=None):
+        return self._timed('execute', sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed('executemany', sql, param_list)
+
+
+def _install_cursor_wrapper(connection):
+    if getattr(connection, '_query_stats_installed', False):
+        return
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: StatsCursorWrapper(make_cursor(cursor), connection)
+    connection.make_debug_cursor = lambda cursor: StatsCursorWrapper(
+        make_debug_cursor(cursor), connection)
+    connection._query_stats_installed = True
+
+
+def _install_template_timer():
+    if getattr(Template.render, '_query_stats_installed', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context):
+        stats = getattr(_state, 'stats', None)
+        # included templates are part of the time of the outermost one
+        if stats is None or stats.template_depth:
+            return render(self, context)
+        stats.template_depth += 1
+        start = time.time()
+        try:
+            return render(self, context)
+        finally:
+            stats.template_depth -= 1
+            stats.template_time += time.time() - start
+
+    timed_render._query_stats_installed = True
+    Template.render = timed_render
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.view_name
+    return request.path
+
+
+class QueryStatsMiddleware(object):
+    """
+    Record query counts and timings of every request, see the module
+    docstring. Put it first in ``MIDDLEWARE_CLASSES`` so the total time
+    covers the other middleware too.
+    """
+
+    def __init__(self):
+        if not settings.QUERY_STATS_ENABLED:
+            raise MiddlewareNotUsed
+        _install_template_timer()
+
+    def process_request(self, request):
+        for connection in connections.all():
+            _install_cursor_wrapper(connection)
+        _state.stats = RequestStats()
+
+    def process_response(self, request, response):
+        stats = getattr(_state, 'stats', None)
+        if stats is None:
+            return response
+        # stop counting before the timing itself is written
+        _state.stats = None
+        total_time = time.time() - stats.start
+        view_name = _view_name(request)
+
+        RequestTiming.objects.create(
+            view_name=view_name[:200],
+            path=request.path[:500],
+            method=request.method,
+            status_code=response.status_code,
+            queries=stats.queries,
+            db_time=stats.db_time * 1000,
+            template_time=stats.template_time * 1000,
+            total_time=total_time * 1000)
+
+        if stats.queries > settings.QUERY_BUDGET:
+            repeated = stats.most_repeated()
+            if repeated is None:
+                logger.warning(
+                    '%s (%s) ran %d queries, over the budget of %d',
+                    view_name, request.path, stats.queries, settings.QUERY_BUDGET)
+            else:
+                logger.warning(
+                    '%s (%s) ran %d queries, over the budget of %d. '
+                    'This one ran %d times:\n%s\nfrom:\n%s',
+                    view_name, request.path, stats.queries, settings.QUERY_BUDGET,
+                    repeated[1], repeated[0], repeated[2])
+        return response
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0009_auto_20160627_0832'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Datum')),
+                ('currency', models.CharField(max_length=3, verbose_name='Valuta')),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=12, verbose_name='Srednji te\u010daj')),
+            ],
+            options={
+                'verbose_name': 'Te\u010daj',
+                'verbose_name_plural': 'Te\u010dajna lista',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='exchangerate',
+            unique_together=set([('date', 'currency')]),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 10:05
+from __future__ import unicode_literals
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def _round2(x):
+    return x.quantize(Decimal('0.01'))
+
+
+def calc_totals(subtotal, vat_value, exchange_rate):
+    # invoice.models.calc_totals as of this migration
+    totals = {
+        'subtotal': _round2(subtotal),
+        'vat_amount': _round2(subtotal * vat_value),
+    }
+    totals['total'] = _round2(totals['subtotal'] + totals['vat_amount'])
+    if exchange_rate is None:
+        totals.update(subtotal_hrk=None, vat_hrk=None, total_hrk=None)
+    else:
+        totals['subtotal_hrk'] = _round2(subtotal * exchange_rate)
+        totals['vat_hrk'] = _round2(totals['subtotal_hrk'] * vat_value)
+        totals['total_hrk'] = _round2(totals['subtotal_hrk'] + totals['vat_hrk'])
+    return totals
+
+
+def compute_totals(apps, schema_editor):
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceItem = apps.get_model('invoice', 'InvoiceItem')
+    subtotals = dict(
+        InvoiceItem.objects.values_list('invoice').annotate(models.Sum('amount')))
+    for invoice in Invoice.objects.all():
+        subtotal = Decimal(subtotals.get(invoice.id) or 0)
+        Invoice.objects.filter(pk=invoice.pk).update(
+            **calc_totals(subtotal, invoice.vat_value, invoice.exchange_rate))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0010_exchangerate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Osnovica'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal_hrk',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='Osnovica (HRK)'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Ukupno'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_hrk',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='Ukupno (HRK)'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='vat_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='PDV'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='vat_hrk',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='PDV (HRK)'),
+        ),
+        migrations.RunPython(compute_totals, migrations.RunPython.noop),
+    ]
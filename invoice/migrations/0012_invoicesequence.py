@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 11:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_counters(apps, schema_editor):
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceSequence = apps.get_model('invoice', 'InvoiceSequence')
+    for year in Invoice.objects.datetimes('created', 'year'):
+        latest = Invoice.objects.filter(
+            created__year=year.year).aggregate(latest=models.Max('seq'))['latest']
+        InvoiceSequence.objects.create(year=year.year, last_seq=latest or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0011_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(unique=True, verbose_name='Godina')),
+                ('last_seq', models.IntegerField(default=0, verbose_name='Zadnji broj ra\u010duna')),
+            ],
+            options={
+                'verbose_name': 'Broja\u010d ra\u010duna',
+                'verbose_name_plural': 'Broja\u010di ra\u010duna',
+            },
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='seq',
+            field=models.IntegerField(blank=True, help_text='Ostavite prazno za sljede\u0107i slobodni broj', null=True, verbose_name='Broj ra\u010duna'),
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 13:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0012_invoicesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Zadnja izmjena'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Zadnja izmjena'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 15:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Invoice numbers are unique per year of the (UTC) creation date. Django
+# can't express that as a model constraint, so it is an expression index on
+# the backends that support one.
+CREATE_YEAR_SEQ_INDEX = {
+    'sqlite': 'CREATE UNIQUE INDEX invoice_invoice_year_seq_uniq '
+              'ON invoice_invoice (substr(created, 1, 4), seq)',
+    'postgresql': 'CREATE UNIQUE INDEX invoice_invoice_year_seq_uniq '
+                  'ON invoice_invoice ((EXTRACT(YEAR FROM created AT TIME ZONE \'UTC\')), seq)',
+}
+DROP_YEAR_SEQ_INDEX = 'DROP INDEX IF EXISTS invoice_invoice_year_seq_uniq'
+
+
+def create_year_seq_index(apps, schema_editor):
+    sql = CREATE_YEAR_SEQ_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_year_seq_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_YEAR_SEQ_INDEX:
+        schema_editor.execute(DROP_YEAR_SEQ_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0013_modified'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='invoice',
+            index_together=set([('created', 'seq'), ('client', 'created'), ('paid', 'due_date')]),
+        ),
+        migrations.RunPython(create_year_seq_index, drop_year_seq_index),
+    ]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 15:05
+from __future__ import unicode_literals
+
+import datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils.timezone import localtime, make_aware
+import django_countries.fields
+
+
+# the VAT_DATA and EXEMPTED_COUNTRIES settings of the time, the rates have
+# since moved to the VatRate table
+VAT_COUNTRIES = ('HR', 'SE')
+EXEMPTED_COUNTRIES = ('HR',)
+
+
+def month_of(created):
+    return localtime(created).date().replace(day=1)
+
+
+def summarize_vat(invoices, month):
+    # invoice.models.summarize_vat as of this migration
+    start = datetime.datetime.combine(month, datetime.time.min)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return (
+        invoices
+        .filter(created__gte=make_aware(start), created__lt=make_aware(end))
+        .order_by()
+        .values('vat_value', 'reverse_charge', 'client__country')
+        .annotate(
+            invoices=models.Count('id'),
+            subtotal_hrk=models.Sum('subtotal_hrk'),
+            vat_hrk=models.Sum('vat_hrk'),
+            total_hrk=models.Sum('total_hrk'))
+    )
+
+
+def set_reverse_charge(apps, schema_editor):
+    # same rule as Client.reverse_charge, which historical models don't have
+    Client = apps.get_model('invoice', 'Client')
+    Invoice = apps.get_model('invoice', 'Invoice')
+    for client in Client.objects.exclude(vat_id=''):
+        if client.country in VAT_COUNTRIES and client.country not in EXEMPTED_COUNTRIES:
+            Invoice.objects.filter(client=client).update(reverse_charge=True)
+
+
+def build_rollups(apps, schema_editor):
+    Invoice = apps.get_model('invoice', 'Invoice')
+    VatRollup = apps.get_model('invoice', 'VatRollup')
+    months = set(month_of(created) for created in Invoice.objects.datetimes('created', 'month'))
+    for month in sorted(months):
+        VatRollup.objects.bulk_create([
+            VatRollup(
+                month=month,
+                vat_value=row['vat_value'],
+                reverse_charge=row['reverse_charge'],
+                country=row['client__country'],
+                invoices=row['invoices'],
+                subtotal_hrk=row['subtotal_hrk'] or 0,
+                vat_hrk=row['vat_hrk'] or 0,
+                total_hrk=row['total_hrk'] or 0)
+            for row in summarize_vat(Invoice.objects.all(), month)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0014_invoice_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='reverse_charge',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Prijenos porezne obveze'),
+        ),
+        migrations.RunPython(set_reverse_charge, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='VatRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mjesec')),
+                ('vat_value', models.DecimalField(decimal_places=2, max_digits=3, verbose_name='Stopa PDV-a')),
+                ('reverse_charge', models.BooleanField(default=False, verbose_name='Prijenos porezne obveze')),
+                ('country', django_countries.fields.CountryField(max_length=2, verbose_name='Dr\u017eava')),
+                ('invoices', models.IntegerField(default=0, verbose_name='Broj ra\u010duna')),
+                ('subtotal_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16, verbose_name='Osnovica (HRK)')),
+                ('vat_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16, verbose_name='PDV (HRK)')),
+                ('total_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16, verbose_name='Ukupno (HRK)')),
+            ],
+            options={
+                'verbose_name': 'Mjese\u010dni PDV',
+                'verbose_name_plural': 'Mjese\u010dni PDV',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='vatrollup',
+            unique_together=set([('month', 'vat_value', 'reverse_charge', 'country')]),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
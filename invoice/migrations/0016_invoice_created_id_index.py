@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 16:30
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0015_vatrollup'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='invoice',
+            index_together=set([('created', 'seq'), ('created', 'id'), ('client', 'created'), ('paid', 'due_date')]),
+        ),
+    ]
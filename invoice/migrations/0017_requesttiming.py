@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 17:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0016_invoice_created_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestTiming',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200, verbose_name='Pogled')),
+                ('path', models.CharField(max_length=500, verbose_name='Putanja')),
+                ('method', models.CharField(max_length=10, verbose_name='Metoda')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status')),
+                ('queries', models.PositiveIntegerField(verbose_name='Broj upita')),
+                ('db_time', models.FloatField(verbose_name='Vrijeme u bazi (ms)')),
+                ('template_time', models.FloatField(verbose_name='Vrijeme predlo\u017eaka (ms)')),
+                ('total_time', models.FloatField(verbose_name='Ukupno vrijeme (ms)')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Vrijeme')),
+            ],
+            options={
+                'verbose_name': 'Mjerenje zahtjeva',
+                'verbose_name_plural': 'Mjerenja zahtjeva',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='requesttiming',
+            index_together=set([('view_name', 'created')]),
+        ),
+    ]
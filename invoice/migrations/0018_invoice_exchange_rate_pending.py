@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 19:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0017_requesttiming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='exchange_rate_pending',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Te\u010daj \u010deka HNB'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 20:20
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, migrations, models
+
+# the search table and documents of invoice.search as of this migration
+CREATE_SQL = {
+    'sqlite': ['CREATE VIRTUAL TABLE invoice_search USING fts5(body)'],
+    'postgresql': [
+        'CREATE TABLE invoice_search (id bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX invoice_search_document ON invoice_search USING gin (document)',
+    ],
+}
+INSERT_SQL = {
+    'sqlite': 'INSERT INTO invoice_search (rowid, body) VALUES (%s, %s)',
+    'postgresql': "INSERT INTO invoice_search (id, document) VALUES (%s, to_tsvector('simple', %s))",
+}
+
+CLIENT = 0
+INVOICE = 1
+CHUNK_SIZE = 500
+
+
+def _documents(apps):
+    Client = apps.get_model('invoice', 'Client')
+    Invoice = apps.get_model('invoice', 'Invoice')
+    InvoiceItem = apps.get_model('invoice', 'InvoiceItem')
+    for id, name, vat_id, address in Client.objects.values_list(
+            'id', 'name', 'vat_id', 'address'):
+        yield id * 2 + CLIENT, ' '.join([name, vat_id or '', address or ''])
+    texts = {}
+    for invoice_id, description, additional_info in InvoiceItem.objects.order_by(
+            'id').values_list('invoice_id', 'description', 'additional_info'):
+        texts.setdefault(invoice_id, []).extend([description, additional_info or ''])
+    for id, seq in Invoice.objects.values_list('id', 'seq'):
+        yield id * 2 + INVOICE, ' '.join(['%s/VP1/1' % seq] + texts.get(id, []))
+
+
+def create_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    connection.__dict__.pop('_invoice_search_backend', None)
+    if connection.vendor not in CREATE_SQL:
+        return
+    try:
+        for sql in CREATE_SQL[connection.vendor]:
+            schema_editor.execute(sql)
+    except DatabaseError:
+        # e.g. SQLite compiled without FTS5, searching falls back to icontains
+        return
+    documents = list(_documents(apps))
+    with connection.cursor() as cursor:
+        for start in range(0, len(documents), CHUNK_SIZE):
+            cursor.executemany(
+                INSERT_SQL[connection.vendor], documents[start:start + CHUNK_SIZE])
+
+
+def drop_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if 'invoice_search' in connection.introspection.table_names():
+        schema_editor.execute('DROP TABLE invoice_search')
+    connection.__dict__.pop('_invoice_search_backend', None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0018_invoice_exchange_rate_pending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='seq',
+            field=models.IntegerField(blank=True, db_index=True, help_text='Ostavite prazno za sljede\u0107i slobodni broj', null=True, verbose_name='Broj ra\u010duna'),
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
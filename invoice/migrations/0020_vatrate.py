@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 21:05
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django_countries.fields
+
+
+# what the VAT_DATA and EXEMPTED_COUNTRIES settings used to hold
+INITIAL_RATES = [
+    ('HR', Decimal('0.25'), False),
+    ('SE', Decimal('0.22'), True),
+]
+
+
+def add_initial_rates(apps, schema_editor):
+    VatRate = apps.get_model('invoice', 'VatRate')
+    VatRate.objects.bulk_create(
+        VatRate(country=country, rate=rate, reverse_charge=reverse_charge)
+        for country, rate, reverse_charge in INITIAL_RATES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0019_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VatRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', django_countries.fields.CountryField(max_length=2, verbose_name='Dr\u017eava')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=3, verbose_name='Stopa')),
+                ('reverse_charge', models.BooleanField(default=True, help_text='Klijentima s VAT ID-em se ne obra\u010dunava PDV', verbose_name='Prijenos porezne obveze')),
+                ('valid_from', models.DateField(blank=True, null=True, verbose_name='Vrijedi od')),
+                ('valid_to', models.DateField(blank=True, null=True, verbose_name='Vrijedi do')),
+            ],
+            options={
+                'verbose_name': 'Stopa PDV-a',
+                'verbose_name_plural': 'Stope PDV-a',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='vatrate',
+            index_together=set([('country', 'valid_from')]),
+        ),
+        migrations.RunPython(add_initial_rates, migrations.RunPython.noop),
+    ]
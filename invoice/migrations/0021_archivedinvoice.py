@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 21:50
+from __future__ import unicode_literals
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0020_vatrate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, max_length=120, verbose_name='Datum izrade ra\u010duna')),
+                ('seq', models.IntegerField(blank=True, db_index=True, help_text='Ostavite prazno za sljede\u0107i slobodni broj', null=True, verbose_name='Broj ra\u010duna')),
+                ('due_date', models.DateTimeField(default=django.utils.timezone.now, max_length=120, verbose_name='Datum dospije\u0107a')),
+                ('currency', models.CharField(choices=[('HRK', 'Hrvatska Kuna'), ('EUR', 'Euro'), ('USD', 'Ameri\u010dki dolar'), ('AUD', 'Australski dolar')], default='HRK', max_length=120, verbose_name='Valuta')),
+                ('default_payment_method', models.CharField(choices=[('PayPal', 'Paypal'), ('Wire-transfer', 'Wire-transfer')], default='Wire-transfer', max_length=120, verbose_name='Na\u010din pla\u0107anja')),
+                ('exchange_rate', models.DecimalField(decimal_places=6, default='1.00', max_digits=12, null=True, verbose_name='Te\u010daj')),
+                ('exchange_rate_pending', models.BooleanField(default=False, editable=False, verbose_name='Te\u010daj \u010deka HNB')),
+                ('vat_value', models.DecimalField(blank=True, decimal_places=2, max_digits=3, verbose_name='VAT')),
+                ('reverse_charge', models.BooleanField(default=False, editable=False, verbose_name='Prijenos porezne obveze')),
+                ('paid', models.BooleanField(default=False, verbose_name='Ra\u010dun je pla\u010den')),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Osnovica')),
+                ('subtotal_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='Osnovica (HRK)')),
+                ('vat_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='PDV')),
+                ('vat_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='PDV (HRK)')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Ukupno')),
+                ('total_hrk', models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14, null=True, verbose_name='Ukupno (HRK)')),
+                ('modified', models.DateTimeField(verbose_name='Zadnja izmjena')),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Arhivirano')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to='invoice.Client', verbose_name='Klijent')),
+            ],
+            options={
+                'verbose_name': 'Arhivirani ra\u010dun',
+                'verbose_name_plural': 'Arhiva ra\u010duna',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedInvoiceItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_hourly', models.BooleanField(default=True, verbose_name='Obra\u010dun po satu')),
+                ('description', models.CharField(max_length=300, verbose_name='Opis stavke')),
+                ('additional_info', models.TextField(blank=True, max_length=300, null=True, verbose_name='Dodatni podaci')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True, verbose_name='Iznos')),
+                ('rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Cijena radnog sata')),
+                ('hours', models.DecimalField(blank=True, decimal_places=1, max_digits=5, null=True, verbose_name='Broj sati')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='invoice.ArchivedInvoice')),
+            ],
+            options={
+                'verbose_name': 'Stavka arhiviranog ra\u010duna',
+                'verbose_name_plural': 'Stavke arhiviranih ra\u010duna',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedinvoice',
+            index_together=set([('created', 'seq'), ('client', 'created')]),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 22:40
+from __future__ import unicode_literals
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+from django.utils import six
+import django.utils.timezone
+
+CHUNK_SIZE = 500
+
+# the logged fields of invoice.models as of this migration
+INVOICE_LOG_FIELDS = (
+    'client', 'created', 'seq', 'due_date', 'currency', 'default_payment_method',
+    'exchange_rate', 'exchange_rate_pending', 'vat_value', 'reverse_charge', 'paid',
+    'subtotal', 'subtotal_hrk', 'vat_amount', 'vat_hrk', 'total', 'total_hrk',
+)
+ITEM_LOG_FIELDS = ('is_hourly', 'description', 'additional_info', 'amount', 'rate', 'hours')
+
+_log_encoder = DjangoJSONEncoder()
+
+
+def _log_value(value):
+    if value is None or isinstance(value, (bool,) + six.integer_types + six.string_types):
+        return value
+    return _log_encoder.default(value)
+
+
+def invoice_states(ids, Invoice, InvoiceItem):
+    states = dict(
+        (row['id'], {
+            'invoice': dict((name, _log_value(row[name])) for name in INVOICE_LOG_FIELDS),
+            'items': {},
+        })
+        for row in Invoice.objects.filter(id__in=ids).values('id', *INVOICE_LOG_FIELDS))
+    for row in InvoiceItem.objects.filter(invoice_id__in=ids).values(
+            'id', 'invoice', *ITEM_LOG_FIELDS):
+        states[row['invoice']]['items'][six.text_type(row['id'])] = dict(
+            (name, _log_value(row[name])) for name in ITEM_LOG_FIELDS)
+    return states
+
+
+def snapshot_invoices(apps, schema_editor):
+    # start every existing invoice's log, archived ones included, with its
+    # state as of its last change
+    InvoiceEvent = apps.get_model('invoice', 'InvoiceEvent')
+    logged = set()
+    for invoice_name, item_name in (
+            ('Invoice', 'InvoiceItem'), ('ArchivedInvoice', 'ArchivedInvoiceItem')):
+        Invoice = apps.get_model('invoice', invoice_name)
+        InvoiceItem = apps.get_model('invoice', item_name)
+        # an id SQLite reused after the archived invoice left its table is
+        # logged as the active invoice
+        modified = [
+            (id, modified) for id, modified in
+            Invoice.objects.order_by('id').values_list('id', 'modified') if id not in logged]
+        logged.update(id for id, modified in modified)
+        for start in range(0, len(modified), CHUNK_SIZE):
+            chunk = dict(modified[start:start + CHUNK_SIZE])
+            states = invoice_states(list(chunk), Invoice, InvoiceItem)
+            InvoiceEvent.objects.bulk_create(
+                InvoiceEvent(
+                    invoice_id=id, version=0, kind=0, created=chunk[id],
+                    data=json.dumps(state, sort_keys=True))
+                for id, state in states.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0021_archivedinvoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoice_id', models.IntegerField(verbose_name='Ra\u010dun')),
+                ('version', models.PositiveIntegerField(verbose_name='Verzija')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Stanje'), (1, 'Izmjena'), (2, 'Brisanje')], verbose_name='Vrsta')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Vrijeme')),
+                ('data', models.TextField(verbose_name='Podaci')),
+            ],
+            options={
+                'verbose_name': 'Promjena ra\u010duna',
+                'verbose_name_plural': 'Povijest ra\u010duna',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='invoiceevent',
+            unique_together=set([('invoice_id', 'version')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='invoiceevent',
+            index_together=set([('invoice_id', 'kind', 'version')]),
+        ),
+        migrations.RunPython(snapshot_invoices, migrations.RunPython.noop),
+    ]
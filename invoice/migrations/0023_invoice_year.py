@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 23:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# the expression index of migration 0014, replaced by the unique year and
+# seq columns (SQLite has already lost it in an earlier table rebuild)
+CREATE_YEAR_SEQ_INDEX = {
+    'sqlite': 'CREATE UNIQUE INDEX invoice_invoice_year_seq_uniq '
+              'ON invoice_invoice (substr(created, 1, 4), seq)',
+    'postgresql': 'CREATE UNIQUE INDEX invoice_invoice_year_seq_uniq '
+                  'ON invoice_invoice ((EXTRACT(YEAR FROM created AT TIME ZONE \'UTC\')), seq)',
+}
+DROP_YEAR_SEQ_INDEX = 'DROP INDEX IF EXISTS invoice_invoice_year_seq_uniq'
+
+
+def drop_year_seq_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_YEAR_SEQ_INDEX:
+        schema_editor.execute(DROP_YEAR_SEQ_INDEX)
+
+
+def create_year_seq_index(apps, schema_editor):
+    sql = CREATE_YEAR_SEQ_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def set_year(apps, schema_editor):
+    # created__year and datetimes() both use the local time zone
+    for model_name in ('Invoice', 'ArchivedInvoice'):
+        model = apps.get_model('invoice', model_name)
+        for year in model.objects.datetimes('created', 'year'):
+            model.objects.filter(created__year=year.year).update(year=year.year)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0022_invoiceevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_year_seq_index, create_year_seq_index),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='year',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Godina'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='year',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Godina'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_year, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='archivedinvoice',
+            unique_together=set([('year', 'seq')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='invoice',
+            unique_together=set([('year', 'seq')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9 on 2026-10-18 23:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0023_invoice_year'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='source',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='invoice.Invoice', verbose_name='Izvorni ra\u010dun'),
+        ),
+    ]
@@ -1,17 +1,28 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+from collections import namedtuple
+from contextlib import contextmanager
 from decimal import Decimal
 from internationalflavor.vat_number import VATNumberField
 from django_countries.fields import CountryField
 import datetime
+import json
 import requests
+import threading
+import time
 
-from django.db import models
+from django.db import connections, models, transaction, IntegrityError
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
-from django.utils.timezone import now
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import six
+from django.utils.timezone import localtime, make_aware, now
+
+from . import search
 
 
 class Client(models.Model):
@@ -55,6 +66,13 @@ class Client(models.Model):
         max_length=30,
         choices=PAYMENT_METHOD_CHOICES,
         default=PAYMENT_METHOD_DEFAULT)
+    modified = models.DateTimeField(u'Zadnja izmjena', auto_now=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Client, cls).from_db(db, field_names, values)
+        instance._country = instance.__dict__.get('country')
+        return instance
 
     def __unicode__(self):
         return '%s, %s, %s' % (self.id, self.name, self.default_payment_method)
@@ -62,30 +80,649 @@ class Client(models.Model):
     def __str__(self):
         return '%s, %s, %s' % (self.id, self.name, self.default_payment_method)
 
+    def vat_period(self, date):
+        """The `VatRate` period of the client's country covering `date`, if any."""
+        return VatRate.objects.lookup(self.country.code, date)
+
+    def vat_on(self, date):
+        """
+        The ``(reverse_charge, vat_value)`` pair for invoicing on `date`.
+
+        Reverse charge applies to clients with a VAT ID in a country whose
+        rate is marked for it, everyone else is charged the country's rate.
+        Countries without a rate are not charged VAT.
+        """
+        period = self.vat_period(date)
+        if period is None:
+            return False, Decimal('0.00')
+        if period.reverse_charge and self.vat_id:
+            return True, Decimal('0.00')
+        return False, period.rate
+
     @property
     def reverse_charge(self):
-        if self.country not in settings.VAT_DATA or self.country in settings.EXEMPTED_COUNTRIES:
-            return False
-        if not self.vat_id:
-            return False
-        return True
+        return self.vat_on(localtime(now()).date())[0]
+
+    def save(self, *args, **kwargs):
+        country_changed = self.pk is not None and getattr(self, '_country', None) != self.country
+        with transaction.atomic():
+            super(Client, self).save(*args, **kwargs)
+            search.index_clients([self.pk])
+            if country_changed:
+                # the VAT rollups are split by the client's country
+                VatRollup.objects.refresh(
+                    month_of(created)
+                    for invoices in (self.invoices, self.archived_invoices)
+                    for created in invoices.datetimes('created', 'month'))
+        self._country = self.country
 
 
 def _round2(x):
     return x.quantize(Decimal('0.01'))
 
 
+TOTAL_FIELDS = ('subtotal', 'subtotal_hrk', 'vat_amount', 'vat_hrk', 'total', 'total_hrk')
+
+
+def calc_totals(subtotal, vat_value, exchange_rate):
+    """
+    Calculate the stored invoice totals from the items subtotal.
+
+    HRK amounts are left empty when the exchange rate is not known.
+    """
+
+    totals = {
+        'subtotal': _round2(subtotal),
+        'vat_amount': _round2(subtotal * vat_value),
+    }
+    totals['total'] = _round2(totals['subtotal'] + totals['vat_amount'])
+    if exchange_rate is None:
+        totals.update(subtotal_hrk=None, vat_hrk=None, total_hrk=None)
+    else:
+        totals['subtotal_hrk'] = _round2(subtotal * exchange_rate)
+        totals['vat_hrk'] = _round2(totals['subtotal_hrk'] * vat_value)
+        totals['total_hrk'] = _round2(totals['subtotal_hrk'] + totals['vat_hrk'])
+    return totals
+
+
+# ids of invoices whose totals are recomputed at the end of a
+# Invoice.deferred_totals() block instead of on every item write
+_deferred_totals = threading.local()
+
+# set while invoice.archive deletes the invoices it has copied
+_archiving = threading.local()
+
+
+def _totals_deferred(invoice_id):
+    return invoice_id in getattr(_deferred_totals, 'ids', ())
+
+
+def _enqueue_pending_rates(dates):
+    # imported here because invoice.rates needs the models
+    from .rates import enqueue
+    for date in dates:
+        enqueue(date)
+
+
+def month_of(created):
+    """Get the first day of the (local) month an invoice was created in."""
+    return localtime(created).date().replace(day=1)
+
+
+def year_of(created):
+    """Get the (local) year an invoice created at `created` is numbered in."""
+    return localtime(created).year
+
+
+def month_bounds(month):
+    start = datetime.datetime.combine(month.replace(day=1), datetime.time.min)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return make_aware(start), make_aware(end)
+
+
+def summarize_vat(invoices, month):
+    """
+    Group the `invoices` created in `month` by VAT rate, reverse charge and
+    client country and sum their HRK amounts, in a single query.
+    """
+
+    start, end = month_bounds(month)
+    return (
+        invoices
+        .filter(created__gte=start, created__lt=end)
+        .order_by()
+        .values('vat_value', 'reverse_charge', 'client__country')
+        .annotate(
+            invoices=models.Count('id'),
+            subtotal_hrk=models.Sum('subtotal_hrk'),
+            vat_hrk=models.Sum('vat_hrk'),
+            total_hrk=models.Sum('total_hrk'))
+    )
+
+
+def fetch_daily_rates(date, session=None):
+    """
+    Fetch the full HNB daily exchange rate list for `date`.
+
+    A `requests.Session` can be passed in to reuse connections when many
+    days are fetched in a row.
+    """
+
+    response = (session or requests).get(
+        settings.HNBEX_URL, params={'date': date.strftime("%Y-%m-%d")},
+        timeout=settings.HNBEX_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class RatePending(Exception):
+    """The rates of a day are not stored yet and were not to be fetched."""
+
+
+class ExchangeRateManager(models.Manager):
+
+    def get_rate(self, currency, date, fetch=True):
+        """
+        Get the HNB median rate for `currency` on `date`.
+
+        The local table is consulted first. The HNB list for the day is
+        only fetched on a miss, and then every currency in it is stored so
+        no further lookups for that day hit the network. A day without a
+        list (weekends, holidays) is stored as a marker row, so it isn't
+        fetched again either. With `fetch` off a miss raises `RatePending`
+        instead.
+        """
+
+        rates = dict(self.filter(date=date).values_list('currency', 'rate'))
+        if not rates:
+            if not fetch:
+                raise RatePending(date)
+            rates = self.store_daily(date, fetch_daily_rates(date))
+        return rates.get(currency)
+
+    def build_daily(self, date, currency_data):
+        if not currency_data:
+            return [self.model(date=date, currency=ExchangeRate.NO_RATES, rate=Decimal(0))]
+        return [
+            self.model(
+                date=date,
+                currency=row[u'currency_code'],
+                rate=Decimal(row[u'median_rate']))
+            for row in currency_data
+        ]
+
+    def store_daily(self, date, currency_data):
+        rates = self.build_daily(date, currency_data)
+        try:
+            with transaction.atomic():
+                self.bulk_create(rates)
+        except IntegrityError:
+            # another request stored the same day in the meantime
+            pass
+        return dict((r.currency, r.rate) for r in rates if r.currency != ExchangeRate.NO_RATES)
+
+
+class ExchangeRate(models.Model):
+
+    # the currency of the row stored for a day HNB has no list for
+    NO_RATES = ''
+
+    class Meta:
+        verbose_name = u'Tečaj'
+        verbose_name_plural = u'Tečajna lista'
+        unique_together = ('date', 'currency')
+
+    date = models.DateField(u'Datum')
+    currency = models.CharField(u'Valuta', max_length=3)
+    rate = models.DecimalField(
+        u'Srednji tečaj',
+        max_digits=12,
+        decimal_places=6)
+
+    objects = ExchangeRateManager()
+
+    def __unicode__(self):
+        return '%s %s %s' % (self.date, self.currency, self.rate)
+
+    def __str__(self):
+        return '%s %s %s' % (self.date, self.currency, self.rate)
+
+
+VatPeriod = namedtuple('VatPeriod', ['valid_from', 'valid_to', 'rate', 'reverse_charge'])
+
+# (loaded at, {country code: [VatPeriod, ...]}), see VatRateManager.periods
+_vat_rate_cache = {}
+
+
+class VatRateManager(models.Manager):
+
+    def periods(self):
+        """
+        All rate periods by country code, served from an in-process cache.
+
+        The table is read once and kept for `VAT_RATES_CACHE_TIMEOUT`
+        seconds. Saving or deleting a rate clears the cache right away, the
+        timeout only catches changes made by other processes.
+        """
+
+        cached = _vat_rate_cache.get('periods')
+        if cached is None or time.time() - cached[0] > settings.VAT_RATES_CACHE_TIMEOUT:
+            periods = {}
+            for rate in self.order_by('country', 'valid_from'):
+                periods.setdefault(rate.country.code, []).append(VatPeriod(
+                    rate.valid_from, rate.valid_to, rate.rate, rate.reverse_charge))
+            cached = _vat_rate_cache['periods'] = (time.time(), periods)
+        return cached[1]
+
+    def lookup(self, country, date):
+        """The `VatPeriod` of `country` covering `date`, or None."""
+        for period in self.periods().get(country, ()):
+            if period.valid_from is not None and date < period.valid_from:
+                continue
+            if period.valid_to is not None and date > period.valid_to:
+                continue
+            return period
+        return None
+
+    def clear_cache(self):
+        _vat_rate_cache.clear()
+
+
+class VatRate(models.Model):
+    """The VAT rate of a country, valid from `valid_from` to `valid_to` inclusive."""
+
+    class Meta:
+        verbose_name = u'Stopa PDV-a'
+        verbose_name_plural = u'Stope PDV-a'
+        index_together = [('country', 'valid_from')]
+
+    country = CountryField(u'Država')
+    rate = models.DecimalField(u'Stopa', max_digits=3, decimal_places=2)
+    reverse_charge = models.BooleanField(
+        u'Prijenos porezne obveze',
+        default=True,
+        help_text=u'Klijentima s VAT ID-em se ne obračunava PDV')
+    valid_from = models.DateField(u'Vrijedi od', null=True, blank=True)
+    valid_to = models.DateField(u'Vrijedi do', null=True, blank=True)
+
+    objects = VatRateManager()
+
+    def __unicode__(self):
+        return '%s %s %s-%s' % (self.country, self.rate, self.valid_from or '', self.valid_to or '')
+
+    def __str__(self):
+        return '%s %s %s-%s' % (self.country, self.rate, self.valid_from or '', self.valid_to or '')
+
+    def clean(self):
+        if self.valid_from and self.valid_to and self.valid_from > self.valid_to:
+            raise ValidationError({'valid_to': u'Kraj razdoblja je prije početka'})
+        overlapping = VatRate.objects.filter(country=self.country).exclude(pk=self.pk)
+        if self.valid_to is not None:
+            overlapping = overlapping.filter(
+                models.Q(valid_from__isnull=True) | models.Q(valid_from__lte=self.valid_to))
+        if self.valid_from is not None:
+            overlapping = overlapping.filter(
+                models.Q(valid_to__isnull=True) | models.Q(valid_to__gte=self.valid_from))
+        if overlapping.exists():
+            raise ValidationError(u'Razdoblje se preklapa s drugom stopom za istu državu')
+
+
+ROLLUP_AMOUNTS = ('subtotal_hrk', 'vat_hrk', 'total_hrk')
+
+# what one invoice adds to the rollup row of its month and VAT treatment
+RollupShare = namedtuple(
+    'RollupShare', ['month', 'vat_value', 'reverse_charge', 'country'] + list(ROLLUP_AMOUNTS))
+
+
+class VatRollupManager(models.Manager):
+
+    def compute(self, month):
+        """Build the (unsaved) rollups of `month` from active and archived invoices."""
+        rollups = {}
+        for invoices in (Invoice.objects.all(), ArchivedInvoice.objects.all()):
+            for row in summarize_vat(invoices, month):
+                key = (row['vat_value'], row['reverse_charge'], row['client__country'])
+                if key not in rollups:
+                    rollups[key] = self.model(
+                        month=month,
+                        vat_value=row['vat_value'],
+                        reverse_charge=row['reverse_charge'],
+                        country=row['client__country'],
+                        invoices=0, subtotal_hrk=0, vat_hrk=0, total_hrk=0)
+                rollup = rollups[key]
+                rollup.invoices += row['invoices']
+                rollup.subtotal_hrk += row['subtotal_hrk'] or 0
+                rollup.vat_hrk += row['vat_hrk'] or 0
+                rollup.total_hrk += row['total_hrk'] or 0
+        return [rollups[key] for key in sorted(rollups)]
+
+    def share(self, invoice):
+        """Get the `RollupShare` of `invoice` as it is in memory."""
+        return RollupShare(
+            month_of(invoice.created), invoice.vat_value, invoice.reverse_charge,
+            invoice.client.country, *[getattr(invoice, name) or 0 for name in ROLLUP_AMOUNTS])
+
+    def stored_share(self, invoice):
+        """
+        Get the `RollupShare` of `invoice` as it is stored, None if it isn't.
+
+        The invoice row stays locked until the end of the transaction, so
+        concurrent saves of one invoice move its share one after another.
+        """
+
+        if invoice.pk is None:
+            return None
+        for row in Invoice.objects.select_for_update().filter(pk=invoice.pk).values(
+                'created', 'client', 'vat_value', 'reverse_charge', *ROLLUP_AMOUNTS):
+            if row['client'] == invoice.client_id:
+                country = invoice.client.country
+            else:
+                country = Client.objects.get(pk=row['client']).country
+            return RollupShare(
+                month_of(row['created']), row['vat_value'], row['reverse_charge'], country,
+                *[row[name] or 0 for name in ROLLUP_AMOUNTS])
+        return None
+
+    def _add(self, share, sign):
+        key = dict(
+            month=share.month, vat_value=share.vat_value,
+            reverse_charge=share.reverse_charge, country=share.country)
+        amounts = dict(
+            (name, models.F(name) + sign * getattr(share, name)) for name in ROLLUP_AMOUNTS)
+        if self.filter(**key).update(invoices=models.F('invoices') + sign, **amounts):
+            if sign < 0:
+                self.filter(invoices__lte=0, **key).delete()
+            return True
+        if sign < 0:
+            return False
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(invoices=1, **dict(
+                    key, **dict((name, getattr(share, name)) for name in ROLLUP_AMOUNTS)))
+        except IntegrityError:
+            # a concurrent save created the row first
+            return self._add(share, sign)
+        return True
+
+    def move(self, old, new):
+        """
+        Move one invoice's share of the rollups from `old` to `new` after the
+        invoice was written, updating the rows in place. Either share is None
+        for an invoice that didn't or doesn't exist.
+        """
+
+        if old == new:
+            return
+        if old is not None and not self._add(old, -1):
+            # the rollups are out of step with the invoices, the months are
+            # summarized again as they are now
+            self.refresh([old.month] + ([new.month] if new is not None else []))
+            return
+        if new is not None:
+            self._add(new, 1)
+
+    def refresh(self, months):
+        """
+        Recompute the rollups of every month in `months`.
+
+        Only the affected months are summarized again, each with one grouped
+        query over that month's invoices. Single invoice writes `move` their
+        share instead, this is for batches and repairs.
+        """
+
+        for month in sorted(set(months)):
+            for attempt in range(3):
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.filter(month=month).delete()
+                        self.bulk_create(self.compute(month))
+                    break
+                except IntegrityError:
+                    # a concurrent refresh of the same month got there first
+                    if attempt == 2:
+                        raise
+
+
+class VatRollup(models.Model):
+    """HRK totals of the invoices of one month with the same VAT treatment."""
+
+    class Meta:
+        verbose_name = u'Mjesečni PDV'
+        verbose_name_plural = u'Mjesečni PDV'
+        unique_together = ('month', 'vat_value', 'reverse_charge', 'country')
+
+    month = models.DateField(u'Mjesec')
+    vat_value = models.DecimalField(u'Stopa PDV-a', max_digits=3, decimal_places=2)
+    reverse_charge = models.BooleanField(u'Prijenos porezne obveze', default=False)
+    country = CountryField(u'Država')
+    invoices = models.IntegerField(u'Broj računa', default=0)
+    subtotal_hrk = models.DecimalField(
+        u'Osnovica (HRK)', max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    vat_hrk = models.DecimalField(
+        u'PDV (HRK)', max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    total_hrk = models.DecimalField(
+        u'Ukupno (HRK)', max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    objects = VatRollupManager()
+
+    def __unicode__(self):
+        return '%s %s %s %s' % (self.month, self.country, self.vat_value, self.reverse_charge)
+
+    def __str__(self):
+        return '%s %s %s %s' % (self.month, self.country, self.vat_value, self.reverse_charge)
+
+
+def format_invoice_number(seq):
+    return str(seq) + '/VP1/1'
+
+
 def get_latest_invoice():
-    val = Invoice.objects.filter(
-        created__year=now().year).aggregate(latest=models.Max('seq'))['latest']
-    return val + 1 if val is not None else 1
+    # numbers are reserved by InvoiceSequence when an invoice is saved, this
+    # only tells which one comes next
+    return InvoiceSequence.objects.peek(year_of(now()))
+
 
+# SQLite has no row locks, so allocations within a process are serialized
+_sequence_lock = threading.RLock()
+
+
+class InvoiceSequenceManager(models.Manager):
+
+    @contextmanager
+    def serialized(self):
+        if connections[self.db].features.has_select_for_update:
+            yield
+        else:
+            with _sequence_lock:
+                yield
 
-class Invoice(models.Model):
+    def _latest_issued(self, year):
+        # archived invoices keep their numbers too
+        return max(
+            model.objects.filter(year=year).aggregate(latest=models.Max('seq'))['latest'] or 0
+            for model in (Invoice, ArchivedInvoice))
+
+    def _create_counter(self, year):
+        # continue after numbers issued before the counter row existed
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(year=year, last_seq=self._latest_issued(year))
+        except IntegrityError:
+            # created by a concurrent allocation
+            pass
+
+    def _bump(self, year, count):
+        return self.filter(year=year).update(last_seq=models.F('last_seq') + count)
+
+    def allocate(self, year, count=1):
+        """
+        Reserve `count` consecutive invoice numbers for `year` and return the
+        first one.
+
+        The counter row is incremented with a single UPDATE before it is
+        read back, so it stays locked until the surrounding transaction
+        commits and concurrent allocations wait for it instead of reading
+        the same value.
+        """
+
+        with self.serialized(), transaction.atomic(using=self.db):
+            if not self._bump(year, count):
+                self._create_counter(year)
+                self._bump(year, count)
+            last_seq = self.filter(year=year).values_list('last_seq', flat=True).get()
+        return last_seq - count + 1
+
+    def advance(self, year, seq):
+        """Make sure numbers up to `seq` are never allocated for `year`."""
+        with self.serialized(), transaction.atomic(using=self.db):
+            if not self.filter(year=year).exists():
+                self._create_counter(year)
+            self.filter(year=year, last_seq__lt=seq).update(last_seq=seq)
+
+    def peek(self, year):
+        last_seq = self.filter(year=year).values_list('last_seq', flat=True).first()
+        if last_seq is None:
+            last_seq = self._latest_issued(year)
+        return last_seq + 1
+
+
+class InvoiceSequence(models.Model):
 
     class Meta:
-        verbose_name = 'Račun'
-        verbose_name_plural = 'Računi'
+        verbose_name = u'Brojač računa'
+        verbose_name_plural = u'Brojači računa'
+
+    year = models.IntegerField(u'Godina', unique=True)
+    last_seq = models.IntegerField(u'Zadnji broj računa', default=0)
+
+    objects = InvoiceSequenceManager()
+
+    def __unicode__(self):
+        return '%s: %s' % (self.year, self.last_seq)
+
+    def __str__(self):
+        return '%s: %s' % (self.year, self.last_seq)
+
+
+class InvoiceManager(models.Manager):
+
+    def create_batch(self, invoices, rates=None):
+        """
+        Create many unsaved invoices together with their items.
+
+        `invoices` is a list of ``(invoice, items)`` pairs. What
+        `Invoice.save` works out for every invoice is resolved once per
+        distinct key instead: exchange rates per currency and day and invoice
+        numbers as one block per year, while VAT comes from the cached rate
+        table without a query per client. Invoices and items
+        are then inserted with ``bulk_create`` in a single transaction, and
+        the VAT rollups are refreshed once per affected month.
+
+        A `rates` dict can be passed in to share resolved exchange rates
+        between calls.
+        """
+
+        rates = {} if rates is None else rates
+        by_year = {}
+        for invoice, items in invoices:
+            invoice.due_date = invoice._calc_due_date()
+            invoice.reverse_charge, invoice.vat_value = invoice._calc_vat()
+            rate_key = (invoice.currency, invoice.created.date())
+            if rate_key not in rates:
+                try:
+                    rates[rate_key] = invoice.get_exchange_rate(*rate_key)
+                except RatePending:
+                    rates[rate_key] = RatePending
+            invoice.exchange_rate_pending = rates[rate_key] is RatePending
+            invoice.exchange_rate = None if invoice.exchange_rate_pending else rates[rate_key]
+            for item in items:
+                item._calc_amount()
+            invoice.subtotal = sum(
+                (item.amount for item in items if item.amount is not None), Decimal(0))
+            invoice._calc_totals()
+            invoice.year = year_of(invoice.created)
+            by_year.setdefault(invoice.year, []).append(invoice)
+
+        with InvoiceSequence.objects.serialized(), transaction.atomic():
+            for year, year_invoices in by_year.items():
+                numbered = [invoice.seq for invoice in year_invoices if invoice.seq is not None]
+                if numbered:
+                    InvoiceSequence.objects.advance(year, max(numbered))
+                unnumbered = [invoice for invoice in year_invoices if invoice.seq is None]
+                if unnumbered:
+                    first = InvoiceSequence.objects.allocate(year, count=len(unnumbered))
+                    for offset, invoice in enumerate(unnumbered):
+                        invoice.seq = first + offset
+
+            self.bulk_create([invoice for invoice, items in invoices], batch_size=500)
+
+            # bulk_create doesn't set primary keys, but (year, seq) is unique
+            for year, year_invoices in by_year.items():
+                seqs = [invoice.seq for invoice in year_invoices]
+                ids = dict(self.filter(
+                    year=year, seq__range=(min(seqs), max(seqs))
+                ).values_list('seq', 'id'))
+                for invoice in year_invoices:
+                    invoice.id = ids[invoice.seq]
+                    invoice._rate_key = invoice._get_rate_key()
+                    invoice._number_key = invoice._get_number_key()
+
+            new_items = []
+            for invoice, items in invoices:
+                for item in items:
+                    item.invoice = invoice
+                    new_items.append(item)
+            InvoiceItem.objects.bulk_create(new_items, batch_size=500)
+
+            VatRollup.objects.refresh(month_of(invoice.created) for invoice, items in invoices)
+            search.index_invoices([invoice.id for invoice, items in invoices])
+            InvoiceEvent.objects.record(invoice.id for invoice, items in invoices)
+            pending_dates = set(
+                invoice.created.date() for invoice, items in invoices
+                if invoice.exchange_rate_pending)
+            if pending_dates:
+                transaction.on_commit(lambda: _enqueue_pending_rates(pending_dates))
+
+        return [invoice for invoice, items in invoices]
+
+    def taken_numbers(self, invoices):
+        """Get the (year, seq) pairs of `invoices` already in use, archived or not."""
+        by_year = {}
+        for invoice in invoices:
+            if invoice.seq is not None:
+                by_year.setdefault(year_of(invoice.created), []).append(invoice.seq)
+        taken = set()
+        for year, seqs in by_year.items():
+            for queryset in (self.all(), ArchivedInvoice.objects.all()):
+                taken.update((year, seq) for seq in queryset.filter(
+                    year=year, seq__range=(min(seqs), max(seqs))
+                ).values_list('seq', flat=True))
+        return taken
+
+    def duplicate(self, queryset):
+        """Copy every invoice in `queryset` into a new invoice dated now."""
+        copies = []
+        for source in queryset.select_related('client').prefetch_related('items').order_by('id'):
+            copy = self.model(client=source.client, currency=source.currency, source=source)
+            items = [
+                InvoiceItem(
+                    is_hourly=item.is_hourly,
+                    description=item.description,
+                    additional_info=item.additional_info,
+                    rate=item.rate,
+                    hours=item.hours,
+                    amount=item.amount)
+                for item in source.items.all()
+            ]
+            copies.append((copy, items))
+        return self.create_batch(copies)
+
+
+class AbstractInvoice(models.Model):
+    """The columns shared by active and archived invoices."""
+
+    class Meta:
+        abstract = True
 
     created = models.DateTimeField(
         'Datum izrade računa',
@@ -94,18 +731,18 @@ class Invoice(models.Model):
         editable=True)
     seq = models.IntegerField(
         'Broj računa',
-        default=get_latest_invoice,
+        help_text=u'Ostavite prazno za sljedeći slobodni broj',
+        blank=True,
+        null=True,
+        db_index=True,
         editable=True)
+    # the local year of `created`, invoice numbers are unique within it
+    year = models.PositiveSmallIntegerField(u'Godina', editable=False)
     due_date = models.DateTimeField(
         'Datum dospijeća',
         max_length=120,
         default=now,
         editable=True)
-    client = models.ForeignKey(
-        Client,
-        on_delete=models.CASCADE,
-        related_name=u'invoices',
-        verbose_name='Klijent')
     currency = models.CharField(
         'Valuta',
         max_length=120,
@@ -122,101 +759,240 @@ class Invoice(models.Model):
         decimal_places=6,
         default="1.00",
         null=True)
+    exchange_rate_pending = models.BooleanField(
+        u'Tečaj čeka HNB',
+        default=False,
+        editable=False)
     vat_value = models.DecimalField(
         u'VAT',
         max_digits=3,
         decimal_places=2,
         blank=True)
+    reverse_charge = models.BooleanField(
+        u'Prijenos porezne obveze',
+        default=False,
+        editable=False)
     paid = models.BooleanField('Račun je plačen', default=False)
+    subtotal = models.DecimalField(
+        u'Osnovica',
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False)
+    subtotal_hrk = models.DecimalField(
+        u'Osnovica (HRK)',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        null=True,
+        editable=False)
+    vat_amount = models.DecimalField(
+        u'PDV',
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False)
+    vat_hrk = models.DecimalField(
+        u'PDV (HRK)',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        null=True,
+        editable=False)
+    total = models.DecimalField(
+        u'Ukupno',
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False)
+    total_hrk = models.DecimalField(
+        u'Ukupno (HRK)',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        null=True,
+        editable=False)
 
-    @property
-    def subtotal(self):
-        val = self.items.aggregate(subtotal=models.Sum(u'amount'))[u'subtotal']
-        return Decimal(val) if val is not None else Decimal(0)
+    def __unicode__(self):
+        return format_invoice_number(self.seq)
 
-    @property
-    def subtotal_hrk(self):
-        return _round2(self.subtotal * self.exchange_rate)
+    def __str__(self):
+        return format_invoice_number(self.seq)
 
-    @property
-    def vat_amount(self):
-        return _round2(self.subtotal * self.vat_value)
 
-    @property
-    def vat_hrk(self):
-        return _round2(self.subtotal_hrk * self.vat_value)
+class Invoice(AbstractInvoice):
 
-    @property
-    def total(self):
-        return _round2(self.subtotal + self.vat_amount)
+    class Meta:
+        verbose_name = 'Račun'
+        verbose_name_plural = 'Računi'
+        unique_together = ('year', 'seq')
+        index_together = [
+            ('created', 'seq'),
+            ('created', 'id'),
+            ('client', 'created'),
+            ('paid', 'due_date'),
+        ]
 
-    @property
-    def total_hrk(self):
-        return _round2(self.subtotal_hrk + self.vat_hrk)
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.CASCADE,
+        related_name=u'invoices',
+        verbose_name='Klijent')
+    modified = models.DateTimeField(u'Zadnja izmjena', auto_now=True)
+    # the invoice this one was duplicated from
+    source = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        related_name=u'copies',
+        null=True,
+        editable=False,
+        verbose_name=u'Izvorni račun')
+
+    objects = InvoiceManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Invoice, cls).from_db(db, field_names, values)
+        instance._rate_key = instance._get_rate_key()
+        instance._number_key = instance._get_number_key()
+        return instance
 
     @property
     def has_hourly(self):
         return self.items.filter(is_hourly=True).exists()
 
-    def __unicode__(self):
-        return str(self.seq) + '/VP1/1'
-
-    def __str__(self):
-        return str(self.seq) + '/VP1/1'
-
     def get_absolute_url(self):
         return reverse('invoice.views.print_invoice', kwargs={"id": self.id})
 
     def _calc_due_date(self):
         return self.created + datetime.timedelta(days=settings.PAYMENT_POSTPONE_RATE)
 
+    def _calc_totals(self):
+        for name, value in calc_totals(self.subtotal, self.vat_value, self.exchange_rate).items():
+            setattr(self, name, value)
+
+    def _aggregate_subtotal(self):
+        val = self.items.aggregate(subtotal=models.Sum(u'amount'))[u'subtotal']
+        return Decimal(val) if val is not None else Decimal(0)
+
+    def recompute_totals(self):
+        """Recompute the stored totals from the items and write them out."""
+        if _totals_deferred(self.pk):
+            return
+        self.subtotal = self._aggregate_subtotal()
+        self._calc_totals()
+        self.modified = now()
+        with transaction.atomic():
+            old = VatRollup.objects.stored_share(self)
+            Invoice.objects.filter(pk=self.pk).update(
+                modified=self.modified,
+                **dict((name, getattr(self, name)) for name in TOTAL_FIELDS))
+            # only the totals are written, the rest of the share stays
+            new = old and old._replace(
+                **dict((name, getattr(self, name) or 0) for name in ROLLUP_AMOUNTS))
+            VatRollup.objects.move(old, new)
+            search.index_invoices([self.pk])
+            InvoiceEvent.objects.record([self.pk])
+
+    @contextmanager
+    def deferred_totals(self):
+        """
+        Recompute the stored totals only once, after all item writes in the
+        block are done, instead of after every single one.
+        """
+
+        if not hasattr(_deferred_totals, 'ids'):
+            _deferred_totals.ids = set()
+        _deferred_totals.ids.add(self.pk)
+        try:
+            yield
+        finally:
+            _deferred_totals.ids.discard(self.pk)
+        self.recompute_totals()
+
+    def _get_rate_key(self):
+        return (self.__dict__.get('currency'), self.__dict__.get('created'))
+
+    def _get_number_key(self):
+        return (self.__dict__.get('year'), self.__dict__.get('seq'))
+
+    def _rate_changed(self):
+        return getattr(self, '_rate_key', None) != self._get_rate_key()
+
     def get_exchange_rate(self, currency, date):
         if currency == Client.CURRENCY_DEFAULT:
             return 1
-        else:
-            hnbex_url = u'http://hnbex.eu/api/v1/rates/daily/?date=' + date.strftime("%Y-%m-%d")
-            currency_data = requests.get(hnbex_url).json()
-            for items in range(len(currency_data)):
-                if currency_data[items][u'currency_code'] == currency:
-                    return Decimal(currency_data[items][u'median_rate'])
-            return None
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        # in the background mode a missing day is fetched by the rate
+        # worker, the request never waits for HNB
+        return ExchangeRate.objects.get_rate(
+            currency, date, fetch=not settings.EXCHANGE_RATES_IN_BACKGROUND)
 
-    def duplicate(self):
-        new_inv = Invoice.objects.create(client=self.client, currency=self.currency)
+    def _set_exchange_rate(self):
+        try:
+            self.exchange_rate = self.get_exchange_rate(self.currency, self.created)
+            self.exchange_rate_pending = False
+        except RatePending:
+            self.exchange_rate = None
+            self.exchange_rate_pending = True
 
-        for item in self.items.all():
-            new_inv.items.create(
-                is_hourly=item.is_hourly,
-                description=item.description,
-                additional_info=item.additional_info,
-                rate=item.rate,
-                hours=item.hours,
-                amount=item.amount)
+    def validate_unique(self, exclude=None):
+        super(Invoice, self).validate_unique(exclude)
+        if self.seq is None or self.created is None or 'seq' in (exclude or ()):
+            return
+        year = year_of(self.created)
+        clash = Invoice.objects.filter(year=year, seq=self.seq).exclude(pk=self.pk)
+        archived = ArchivedInvoice.objects.filter(year=year, seq=self.seq)
+        if clash.exists() or archived.exists():
+            raise ValidationError({
+                'seq': u'Račun broj %s za %s. godinu već postoji' % (self.seq, year)})
 
-        return new_inv
+    def _calc_vat(self):
+        return self.client.vat_on(localtime(self.created).date())
+
+    def duplicate(self):
+        return Invoice.objects.duplicate(Invoice.objects.filter(pk=self.pk))[0]
 
     # overwrite only on first save
     def save(self, *args, **kwargs):
         if self.id is None:
             self.due_date = self._calc_due_date()
-        if self.client.reverse_charge:
-            self.vat_value = 0
+        self.reverse_charge, self.vat_value = self._calc_vat()
+        # the rate only depends on currency and date, so don't look it up
+        # again when neither of them changed since the last save
+        if self.exchange_rate is None or self._rate_changed():
+            self._set_exchange_rate()
         else:
-            self.vat_value = settings.VAT_DATA.get(self.client.country, 0)
-        self.exchange_rate = self.get_exchange_rate(self.currency, self.created)
-        super(Invoice, self).save(*args, **kwargs)
+            self.exchange_rate_pending = False
+        if self.id is not None:
+            self.subtotal = self._aggregate_subtotal()
+        self._calc_totals()
+        self.year = year_of(self.created)
+        with InvoiceSequence.objects.serialized(), transaction.atomic():
+            if self.seq is None:
+                self.seq = InvoiceSequence.objects.allocate(self.year)
+            elif getattr(self, '_number_key', None) != self._get_number_key():
+                # a new invoice, or one given another number or year
+                InvoiceSequence.objects.advance(self.year, self.seq)
+            old = VatRollup.objects.stored_share(self)
+            super(Invoice, self).save(*args, **kwargs)
+            VatRollup.objects.move(old, VatRollup.objects.share(self))
+            search.index_invoices([self.pk])
+            InvoiceEvent.objects.record([self.pk])
+            if self.exchange_rate_pending:
+                pending_dates = [self.created.date()]
+                transaction.on_commit(lambda: _enqueue_pending_rates(pending_dates))
+        self._rate_key = self._get_rate_key()
+        self._number_key = self._get_number_key()
 
 
-class InvoiceItem(models.Model):
+class AbstractInvoiceItem(models.Model):
+    """The columns shared by active and archived invoice items."""
 
     class Meta:
-        verbose_name = 'Stavka računa'
-        verbose_name_plural = 'Stavke računa'
+        abstract = True
 
-    invoice = models.ForeignKey(
-        Invoice,
-        on_delete=models.CASCADE,
-        related_name=u'items')
     is_hourly = models.BooleanField(
         'Obračun po satu',
         default=True)
@@ -257,6 +1033,18 @@ class InvoiceItem(models.Model):
     def __str__(self):
         return 'Stavka: %s' % (self.id)
 
+
+class InvoiceItem(AbstractInvoiceItem):
+
+    class Meta:
+        verbose_name = 'Stavka računa'
+        verbose_name_plural = 'Stavke računa'
+
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name=u'items')
+
     def clean(self):
         if self.is_hourly:
             if self.rate is None or self.hours is None:
@@ -265,7 +1053,327 @@ class InvoiceItem(models.Model):
             if self.amount is None:
                 raise ValidationError("Iznos mora biti naveden")
 
-    def save(self, *args, **kwargs):
+    def _calc_amount(self):
+        # rounded like the stored amount, so sums over unsaved items match
         if self.is_hourly:
-            self.amount = self.rate * self.hours
+            self.amount = _round2(Decimal(self.rate) * Decimal(self.hours))
+
+    def save(self, *args, **kwargs):
+        self._calc_amount()
         super(InvoiceItem, self).save(*args, **kwargs)
+        if not _totals_deferred(self.invoice_id):
+            self.invoice.recompute_totals()
+
+    def delete(self, *args, **kwargs):
+        super(InvoiceItem, self).delete(*args, **kwargs)
+        if not _totals_deferred(self.invoice_id):
+            self.invoice.recompute_totals()
+
+
+class ArchivedInvoice(AbstractInvoice):
+    """A closed invoice moved out of the active tables, see `invoice.archive`."""
+
+    class Meta:
+        verbose_name = u'Arhivirani račun'
+        verbose_name_plural = u'Arhiva računa'
+        unique_together = ('year', 'seq')
+        index_together = [
+            ('created', 'seq'),
+            ('client', 'created'),
+        ]
+
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.CASCADE,
+        related_name=u'archived_invoices',
+        verbose_name='Klijent')
+    # kept as it was when the invoice was archived
+    modified = models.DateTimeField(u'Zadnja izmjena')
+    archived = models.DateTimeField(u'Arhivirano', default=now)
+
+    def get_absolute_url(self):
+        return reverse('invoice.views.print_invoice', kwargs={"id": self.id})
+
+
+class ArchivedInvoiceItem(AbstractInvoiceItem):
+
+    class Meta:
+        verbose_name = u'Stavka arhiviranog računa'
+        verbose_name_plural = u'Stavke arhiviranih računa'
+
+    invoice = models.ForeignKey(
+        ArchivedInvoice,
+        on_delete=models.CASCADE,
+        related_name=u'items')
+
+
+# what the change log keeps of an invoice and of each of its items
+INVOICE_LOG_FIELDS = (
+    'client', 'created', 'seq', 'due_date', 'currency', 'default_payment_method',
+    'exchange_rate', 'exchange_rate_pending', 'vat_value', 'reverse_charge', 'paid',
+) + TOTAL_FIELDS
+ITEM_LOG_FIELDS = ('is_hourly', 'description', 'additional_info', 'amount', 'rate', 'hours')
+
+_log_encoder = DjangoJSONEncoder()
+
+
+def _log_value(value):
+    if value is None or isinstance(value, (bool,) + six.integer_types + six.string_types):
+        return value
+    return _log_encoder.default(value)
+
+
+def invoice_states(ids):
+    """
+    Get the logged state of invoices `ids` as JSON-ready dicts of the form
+    ``{'invoice': {field: value}, 'items': {item id: {field: value}}}``.
+    """
+
+    states = dict(
+        (row['id'], {
+            'invoice': dict((name, _log_value(row[name])) for name in INVOICE_LOG_FIELDS),
+            'items': {},
+        })
+        for row in Invoice.objects.filter(id__in=ids).values('id', *INVOICE_LOG_FIELDS))
+    for row in InvoiceItem.objects.filter(invoice_id__in=ids).values(
+            'id', 'invoice', *ITEM_LOG_FIELDS):
+        states[row['invoice']]['items'][six.text_type(row['id'])] = dict(
+            (name, _log_value(row[name])) for name in ITEM_LOG_FIELDS)
+    return states
+
+
+def _state_diff(old, new):
+    diff = {}
+    invoice = dict(
+        (name, value) for name, value in new['invoice'].items()
+        if old['invoice'].get(name) != value)
+    if invoice:
+        diff['invoice'] = invoice
+    items = {}
+    for id, fields in new['items'].items():
+        before = old['items'].get(id)
+        if before is None:
+            items[id] = fields
+        else:
+            changed = dict(
+                (name, value) for name, value in fields.items() if before.get(name) != value)
+            if changed:
+                items[id] = changed
+    for id in old['items']:
+        if id not in new['items']:
+            items[id] = None
+    if items:
+        diff['items'] = items
+    return diff
+
+
+def _apply_diff(state, diff):
+    state['invoice'].update(diff.get('invoice', {}))
+    for id, fields in diff.get('items', {}).items():
+        if fields is None:
+            state['items'].pop(id, None)
+        else:
+            state['items'].setdefault(id, {}).update(fields)
+    return state
+
+
+def _from_log(model, values):
+    fields = [model._meta.get_field(name) for name in values]
+    return dict((field.attname, field.to_python(values[field.name])) for field in fields)
+
+
+class InvoiceEventManager(models.Manager):
+
+    def _replay(self, events):
+        """Apply `events`, oldest first and starting with a snapshot."""
+        state = None
+        for event in events:
+            if event.kind == InvoiceEvent.SNAPSHOT:
+                state = json.loads(event.data)
+            elif event.kind == InvoiceEvent.CHANGE:
+                state = _apply_diff(state, json.loads(event.data))
+            else:
+                state = None
+        return state
+
+    def _latest(self, ids):
+        """
+        Get ``{invoice id: (snapshot version, last version, state)}`` for
+        the invoices in `ids` that have been logged, reading only the events
+        since their last snapshot.
+        """
+
+        snapshots = dict(
+            self.filter(invoice_id__in=ids, kind=InvoiceEvent.SNAPSHOT)
+            .values_list('invoice_id').annotate(models.Max('version')))
+        if not snapshots:
+            return {}
+        events = {}
+        for event in self.filter(
+                invoice_id__in=list(snapshots), version__gte=min(snapshots.values())
+        ).order_by('invoice_id', 'version'):
+            if event.version >= snapshots[event.invoice_id]:
+                events.setdefault(event.invoice_id, []).append(event)
+        return dict(
+            (id, (snapshots[id], invoice_events[-1].version, self._replay(invoice_events)))
+            for id, invoice_events in events.items())
+
+    def record(self, ids):
+        """
+        Append what changed in invoices `ids` since their last event.
+
+        Call it in the transaction that made the changes, so the log and
+        the invoices never disagree. Unchanged invoices get no event. An
+        invoice's first event, and every `INVOICE_EVENT_SNAPSHOT_INTERVAL`
+        events after that, is a full snapshot instead of a diff.
+        """
+
+        ids = list(ids)
+        if not ids:
+            return
+        latest = self._latest(ids)
+        stamp = now()
+        events = []
+        for id, state in invoice_states(ids).items():
+            snapshot, version, previous = latest.get(id, (None, -1, None))
+            if previous is None:
+                kind, data = InvoiceEvent.SNAPSHOT, state
+            else:
+                data = _state_diff(previous, state)
+                if not data:
+                    continue
+                kind = InvoiceEvent.CHANGE
+                if version + 1 - snapshot >= settings.INVOICE_EVENT_SNAPSHOT_INTERVAL:
+                    kind, data = InvoiceEvent.SNAPSHOT, state
+            events.append(self.model(
+                invoice_id=id, version=version + 1, kind=kind, created=stamp,
+                data=json.dumps(data, sort_keys=True)))
+        self.bulk_create(events)
+
+    def record_deleted(self, ids):
+        latest = self.filter(invoice_id__in=ids).values_list('invoice_id').annotate(
+            models.Max('version'))
+        stamp = now()
+        self.bulk_create(
+            self.model(
+                invoice_id=id, version=version + 1, kind=InvoiceEvent.DELETED,
+                created=stamp, data='{}')
+            for id, version in latest)
+
+    def as_of(self, invoice_id, when):
+        """
+        Rebuild invoice `invoice_id` as it was at `when`.
+
+        Returns an unsaved ``(invoice, items)`` pair, or None if the invoice
+        didn't exist then (or has no history). Reads the last snapshot
+        before `when` and at most `INVOICE_EVENT_SNAPSHOT_INTERVAL` events.
+        """
+
+        snapshot = self.filter(
+            invoice_id=invoice_id, kind=InvoiceEvent.SNAPSHOT, created__lte=when
+        ).order_by('-version').values_list('version', flat=True).first()
+        if snapshot is None:
+            return None
+        state = self._replay(self.filter(
+            invoice_id=invoice_id, version__gte=snapshot, created__lte=when).order_by('version'))
+        if state is None:
+            return None
+        invoice = Invoice(id=invoice_id, **_from_log(Invoice, state['invoice']))
+        items = [
+            InvoiceItem(id=int(id), invoice=invoice, **_from_log(InvoiceItem, fields))
+            for id, fields in sorted(state['items'].items(), key=lambda item: int(item[0]))]
+        return invoice, items
+
+
+class InvoiceEvent(models.Model):
+    """
+    One entry of the append-only change log of invoices and their items.
+
+    Changes are stored as diffs against the previous event, with a full
+    snapshot every so often, see `InvoiceEventManager.record`.
+    """
+
+    SNAPSHOT = 0
+    CHANGE = 1
+    DELETED = 2
+
+    KIND_CHOICES = (
+        (SNAPSHOT, u'Stanje'),
+        (CHANGE, u'Izmjena'),
+        (DELETED, u'Brisanje'),
+    )
+
+    class Meta:
+        verbose_name = u'Promjena računa'
+        verbose_name_plural = u'Povijest računa'
+        unique_together = ('invoice_id', 'version')
+        index_together = [('invoice_id', 'kind', 'version')]
+
+    # not a foreign key, the log outlives deleted and archived invoices
+    invoice_id = models.IntegerField(u'Račun')
+    version = models.PositiveIntegerField(u'Verzija')
+    kind = models.PositiveSmallIntegerField(u'Vrsta', choices=KIND_CHOICES)
+    created = models.DateTimeField(u'Vrijeme', default=now)
+    data = models.TextField(u'Podaci')
+
+    objects = InvoiceEventManager()
+
+    def __unicode__(self):
+        return '%s v%s %s' % (self.invoice_id, self.version, self.get_kind_display())
+
+    def __str__(self):
+        return '%s v%s %s' % (self.invoice_id, self.version, self.get_kind_display())
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Invoice events are never changed')
+        super(InvoiceEvent, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Invoice events are never deleted')
+
+
+class RequestTiming(models.Model):
+    """What one request cost, recorded by `invoice.middleware.QueryStatsMiddleware`."""
+
+    class Meta:
+        verbose_name = u'Mjerenje zahtjeva'
+        verbose_name_plural = u'Mjerenja zahtjeva'
+        index_together = [('view_name', 'created')]
+
+    view_name = models.CharField(u'Pogled', max_length=200)
+    path = models.CharField(u'Putanja', max_length=500)
+    method = models.CharField(u'Metoda', max_length=10)
+    status_code = models.PositiveSmallIntegerField(u'Status')
+    queries = models.PositiveIntegerField(u'Broj upita')
+    db_time = models.FloatField(u'Vrijeme u bazi (ms)')
+    template_time = models.FloatField(u'Vrijeme predložaka (ms)')
+    total_time = models.FloatField(u'Ukupno vrijeme (ms)')
+    created = models.DateTimeField(u'Vrijeme', default=now, db_index=True)
+
+    def __unicode__(self):
+        return '%s %s %s' % (self.created, self.view_name, self.queries)
+
+    def __str__(self):
+        return '%s %s %s' % (self.created, self.view_name, self.queries)
+
+
+@receiver(post_delete, sender=Invoice)
+def update_invoice_reports_on_delete(sender, instance, **kwargs):
+    if getattr(_archiving, 'active', False):
+        # the invoice lives on in the archive, its rollups don't change
+        return
+    VatRollup.objects.refresh([month_of(instance.created)])
+    search.remove(search.INVOICE, [instance.pk])
+    InvoiceEvent.objects.record_deleted([instance.pk])
+
+
+@receiver(post_save, sender=VatRate)
+@receiver(post_delete, sender=VatRate)
+def clear_vat_rate_cache(sender, **kwargs):
+    VatRate.objects.clear_cache()
+
+
+@receiver(post_delete, sender=Client)
+def remove_client_from_search(sender, instance, **kwargs):
+    search.remove(search.CLIENT, [instance.pk])
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import glob
+import hashlib
+import mimetypes
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.utils.six.moves.urllib.parse import urlparse
+
+from .models import ArchivedInvoice, Invoice, InvoiceEvent, _round2
+
+PRINT_TEMPLATE = 'admin/print.html'
+
+
+class PrintedItem(namedtuple('PrintedItem', [
+        'description', 'additional_info', 'is_hourly', 'hours', 'rate',
+        'amount', 'amount_hrk'])):
+    __slots__ = ()
+
+
+class PrintedInvoice(namedtuple('PrintedInvoice', [
+        'instance', 'items', 'has_hourly', 'vat', 'colspan'])):
+    """
+    Everything the print template needs, worked out up front.
+
+    Totals are read from the stored invoice columns and everything derived
+    from the items is computed from a single list of them, so rendering
+    runs no queries.
+    """
+
+    __slots__ = ()
+
+
+def get_printed_instance(id):
+    """Get invoice `id`, falling back to the archive when it is not active."""
+    for model in (Invoice, ArchivedInvoice):
+        instance = model.objects.select_related('client').filter(id=id).first()
+        if instance is not None:
+            return instance
+    raise Http404('No invoice matches the given query.')
+
+
+def build_printed_invoice(id, as_of=None):
+    """
+    Gather what the print template needs for invoice `id`, as it is now or,
+    with `as_of`, as it was at that time according to the change log.
+    """
+
+    if as_of is None:
+        instance = get_printed_instance(id)
+        items = instance.items.order_by('id')
+    else:
+        past = InvoiceEvent.objects.as_of(id, as_of)
+        if past is None:
+            raise Http404('No invoice matches the given query at that time.')
+        instance, items = past
+    rate = instance.exchange_rate
+    items = tuple(
+        PrintedItem(
+            description=item.description,
+            additional_info=item.additional_info,
+            is_hourly=item.is_hourly,
+            hours=item.hours,
+            rate=item.rate,
+            amount=item.amount,
+            amount_hrk=_round2(item.amount * rate)
+            if item.amount is not None and rate is not None else None)
+        for item in items)
+    has_hourly = any(item.is_hourly for item in items)
+    return PrintedInvoice(
+        instance=instance,
+        items=items,
+        has_hourly=has_hourly,
+        vat=int(instance.vat_value * 100),
+        colspan=4 if has_hourly else 2)
+
+
+def render_printed_invoice(printed, request=None):
+    return render_to_string(PRINT_TEMPLATE, printed._asdict(), request=request)
+
+
+def print_version(id):
+    """
+    Get the (invoice, client) modification times a printed invoice depends
+    on, or None if there is no such invoice. Item changes touch the invoice,
+    so these two cover everything on the page. Archived invoices are looked
+    up only when there is no active one.
+    """
+
+    for model in (Invoice, ArchivedInvoice):
+        version = model.objects.filter(id=id).values_list('modified', 'client__modified').first()
+        if version is not None:
+            return version
+    return None
+
+
+def print_version_tag(id, version, output='html'):
+    return hashlib.md5(
+        ('%s:%s:%s:%s' % ((id,) + tuple(version) + (output,))).encode('utf-8')).hexdigest()
+
+
+def _static_url_fetcher(url):
+    from weasyprint import default_url_fetcher
+
+    path = urlparse(url).path
+    if path.startswith(settings.STATIC_URL):
+        filename = finders.find(path[len(settings.STATIC_URL):])
+        if filename:
+            with open(filename, 'rb') as f:
+                return {'string': f.read(), 'mime_type': mimetypes.guess_type(filename)[0]}
+    return default_url_fetcher(url)
+
+
+def html_to_pdf(html):
+    # WeasyPrint is slow to import and only needed when PDFs are rendered
+    from weasyprint import HTML
+
+    return HTML(string=html, base_url='file:///', url_fetcher=_static_url_fetcher).write_pdf()
+
+
+def get_invoice_pdf(id):
+    """
+    Get the path of the PDF for invoice `id`, rendering it only if there is
+    none for the current version of the invoice yet.
+    """
+
+    version = print_version(id)
+    if version is None:
+        raise Invoice.DoesNotExist('Invoice %s does not exist' % id)
+    path = os.path.join(
+        settings.INVOICE_PDF_DIR, '%s-%s.pdf' % (id, print_version_tag(id, version, 'pdf')))
+    if os.path.exists(path):
+        return path
+
+    pdf = html_to_pdf(render_printed_invoice(build_printed_invoice(id)))
+    try:
+        os.makedirs(settings.INVOICE_PDF_DIR)
+    except OSError:
+        if not os.path.isdir(settings.INVOICE_PDF_DIR):
+            raise
+    for stale in glob.glob(os.path.join(settings.INVOICE_PDF_DIR, '%s-*.pdf' % id)):
+        os.remove(stale)
+    # write under a temporary name so concurrent readers never see half a file
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.rename(tmp_path, path)
+    return path
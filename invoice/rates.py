@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Resolving exchange rates of invoices saved while their day's rates were
+not stored yet.
+
+With ``EXCHANGE_RATES_IN_BACKGROUND`` on, `Invoice.save` never fetches from
+HNB: a missing rate leaves the invoice marked as pending and its day is
+queued here once the transaction commits. A worker thread of the process
+takes queued days in batches, fetches and stores their rates and fills in
+the invoices. Days the worker couldn't fetch (or that were queued by a
+process that has since exited) are picked up by the
+``resolve_pending_rates`` command.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import operator
+import threading
+from collections import defaultdict
+from functools import reduce
+
+import requests
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils.six.moves import queue
+from django.utils.timezone import now, utc
+
+from .models import (
+    ExchangeRate, Invoice, InvoiceEvent, VatRollup, calc_totals, fetch_daily_rates, month_of)
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def resolve_pending_rates(dates=None, session=None):
+    """
+    Fill in the exchange rate and HRK totals of pending invoices created on
+    `dates` (default: all of them) and return how many were resolved.
+
+    Every day's rates are fetched at most once. An invoice changed since it
+    was read is left alone, its own save looks the rate up again.
+    """
+
+    invoices = Invoice.objects.filter(exchange_rate_pending=True)
+    if dates is not None:
+        if not dates:
+            return 0
+        invoices = invoices.filter(reduce(operator.or_, (_created_on(day) for day in dates)))
+    pending = defaultdict(list)
+    for row in invoices.values_list('id', 'currency', 'created', 'subtotal', 'vat_value'):
+        pending[row[2].date()].append(row)
+
+    resolved = 0
+    months = set()
+    for day, invoices in sorted(pending.items()):
+        try:
+            rates = dict(ExchangeRate.objects.filter(date=day).values_list('currency', 'rate'))
+            if not rates:
+                rates = ExchangeRate.objects.store_daily(day, fetch_daily_rates(day, session))
+        except (requests.RequestException, ValueError):
+            # unreachable, or answering with something other than the JSON list
+            logger.warning('Exchange rates for %s could not be fetched', day, exc_info=True)
+            continue
+
+        with transaction.atomic():
+            updated = []
+            for id, currency, created, subtotal, vat_value in invoices:
+                rate = rates.get(currency)
+                count = Invoice.objects.filter(
+                    pk=id, exchange_rate_pending=True, currency=currency, created=created,
+                    subtotal=subtotal, vat_value=vat_value,
+                ).update(
+                    exchange_rate=rate, exchange_rate_pending=False, modified=now(),
+                    **calc_totals(subtotal, vat_value, rate))
+                if count:
+                    updated.append(id)
+                months.add(month_of(created))
+            InvoiceEvent.objects.record(updated)
+            resolved += len(updated)
+    VatRollup.objects.refresh(months)
+    return resolved
+
+
+def _created_on(day):
+    # `Invoice.save` queues the UTC date of `created`, not the local one
+    start = datetime.datetime.combine(day, datetime.time.min).replace(tzinfo=utc)
+    return Q(created__gte=start, created__lt=start + datetime.timedelta(days=1))
+
+
+def _work():
+    while True:
+        dates = set([_queue.get()])
+        # whatever was queued in the meantime goes into the same batch
+        while True:
+            try:
+                dates.add(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            resolve_pending_rates(dates)
+        except Exception:
+            logger.exception('Resolving exchange rates for %s failed', sorted(dates))
+        finally:
+            close_old_connections()
+
+
+def enqueue(date):
+    """Have the worker thread resolve the pending invoices of `date`."""
+    global _worker
+    _queue.put(date)
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='invoice-exchange-rates')
+            _worker.daemon = True
+            _worker.start()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, Q, Sum, Value, When
+from django.utils.timezone import now
+
+from .models import Invoice, RequestTiming, VatRollup, format_invoice_number
+
+STATEMENT_FIELDS = (
+    'id', 'seq', 'created', 'due_date', 'currency', 'exchange_rate',
+    'subtotal', 'vat_amount', 'total', 'total_hrk', 'paid',
+)
+
+
+def build_client_statement(client):
+    """
+    Get the statement of `client`: every invoice in date order with the
+    outstanding balance after it, in the invoice currency and in HRK.
+
+    Totals are stored on the invoices, so this is a single ordered query
+    whose running sums are taken in one pass over the rows (Django 1.9 has
+    no window functions to do it in the database).
+    """
+
+    rows = []
+    outstanding = {}
+    outstanding_hrk = Decimal('0.00')
+    invoices = client.invoices.order_by('created', 'id').values_list(*STATEMENT_FIELDS)
+    for values in invoices.iterator():
+        row = dict(zip(STATEMENT_FIELDS, values))
+        row['number'] = format_invoice_number(row['seq'])
+        balance = outstanding.get(row['currency'], Decimal('0.00'))
+        if not row['paid']:
+            balance += row['total']
+            outstanding_hrk += row['total_hrk'] or 0
+        outstanding[row['currency']] = balance
+        row['outstanding'] = balance
+        row['outstanding_hrk'] = outstanding_hrk
+        rows.append(row)
+
+    return {
+        'client': client,
+        'invoices': rows,
+        'outstanding': outstanding,
+        'outstanding_hrk': outstanding_hrk,
+    }
+
+
+# (key, label, first day overdue, last day overdue)
+AGING_BUCKETS = (
+    ('current', 'Nije dospjelo', None, 0),
+    ('days_1_30', '1-30 dana', 1, 30),
+    ('days_31_60', '31-60 dana', 31, 60),
+    ('days_61_90', '61-90 dana', 61, 90),
+    ('days_90_plus', 'Preko 90 dana', 91, None),
+)
+
+
+def _bucket_condition(as_of, first, last):
+    if first is None:
+        return Q(due_date__gte=as_of)
+    condition = Q(due_date__lt=as_of - timedelta(days=first - 1))
+    if last is not None:
+        condition &= Q(due_date__gte=as_of - timedelta(days=last))
+    return condition
+
+
+def receivables_aging(as_of=None, queryset=None):
+    """
+    Get the unpaid totals per client and currency, in HRK, split into the
+    `AGING_BUCKETS` by how many days past `as_of` (default: now) they are
+    due. Besides a key per bucket every row has the unpaid `total_sum` in
+    its currency and `total_hrk_sum`.
+
+    Everything is summed by the database in a single grouped query over the
+    (paid, due_date) index: each bucket is a conditional sum of the stored
+    `total_hrk`.
+    """
+
+    if as_of is None:
+        as_of = now()
+    if queryset is None:
+        queryset = Invoice.objects.all()
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+    buckets = {
+        key: Sum(Case(
+            When(_bucket_condition(as_of, first, last), then='total_hrk'),
+            default=Value(0), output_field=money))
+        for key, label, first, last in AGING_BUCKETS
+    }
+    rows = (
+        queryset
+        .filter(paid=False)
+        .order_by()
+        .values('client', 'client__name', 'currency')
+        .annotate(total_sum=Sum('total'), total_hrk_sum=Sum('total_hrk'), **buckets)
+        .order_by('client__name', 'client', 'currency')
+    )
+    return list(rows)
+
+
+def aging_totals(rows):
+    """Sum the `receivables_aging` rows over all clients and currencies."""
+
+    keys = [bucket[0] for bucket in AGING_BUCKETS] + ['total_hrk_sum']
+    return {key: sum((row[key] or 0 for row in rows), Decimal('0.00')) for key in keys}
+
+
+VAT_REPORT_COLUMNS = (
+    ('month', 'Mjesec'),
+    ('country', 'Država'),
+    ('reverse_charge', 'Prijenos porezne obveze'),
+    ('vat_value', 'Stopa PDV-a'),
+    ('invoices', 'Broj računa'),
+    ('subtotal_hrk', 'Osnovica (HRK)'),
+    ('vat_hrk', 'PDV (HRK)'),
+    ('total_hrk', 'Ukupno (HRK)'),
+)
+
+
+def vat_report(year):
+    """
+    Get the VAT rollups of `year`, one row per month, country, reverse
+    charge and VAT rate.
+
+    The rollups are kept up to date as invoices change, so this never
+    touches the invoices themselves.
+    """
+
+    fields = [name for name, title in VAT_REPORT_COLUMNS]
+    return list(
+        VatRollup.objects
+        .filter(month__year=year)
+        .order_by('month', 'country', 'reverse_charge', 'vat_value')
+        .values(*fields))
+
+
+def iter_vat_report_rows(year):
+    yield [title for name, title in VAT_REPORT_COLUMNS]
+    for row in vat_report(year):
+        yield [
+            row['month'].strftime('%Y-%m'),
+            row['country'],
+            'da' if row['reverse_charge'] else 'ne',
+            row['vat_value'],
+            row['invoices'],
+            row['subtotal_hrk'],
+            row['vat_hrk'],
+            row['total_hrk'],
+        ]
+
+
+TIMING_METRICS = ('queries', 'db_time', 'template_time', 'total_time')
+TIMING_PERCENTILES = (50, 90, 99)
+# how many recent days of requests the percentiles cover by default
+TIMING_DAYS = 7
+
+
+def _percentile(values, percentile):
+    # nearest rank of the sorted `values`
+    rank = max(1, int(round(percentile / 100.0 * len(values))))
+    return values[rank - 1]
+
+
+def request_timing_percentiles(queryset=None, percentiles=TIMING_PERCENTILES):
+    """
+    Get the `percentiles` of every `TIMING_METRICS` per view name, busiest
+    view first.
+
+    Each row has the ``view_name``, the number of ``requests`` and for every
+    metric a list of its percentile values, e.g. ``row['queries'][0]`` is
+    the median query count with the default `percentiles`.
+    """
+
+    if queryset is None:
+        queryset = RequestTiming.objects.all()
+    by_view = {}
+    for values in queryset.order_by().values_list('view_name', *TIMING_METRICS).iterator():
+        by_view.setdefault(values[0], []).append(values[1:])
+
+    rows = []
+    for view_name, timings in by_view.items():
+        row = {'view_name': view_name, 'requests': len(timings)}
+        for metric, column in zip(TIMING_METRICS, zip(*timings)):
+            column = sorted(column)
+            row[metric] = [_percentile(column, p) for p in percentiles]
+        rows.append(row)
+    rows.sort(key=lambda row: (-row['requests'], row['view_name']))
+    return rows
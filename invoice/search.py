@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed search over clients and invoices.
+
+Every client and every invoice has one document in the ``invoice_search``
+table: a client's name, VAT ID and address, an invoice's number and the
+descriptions of its items. On SQLite that's an FTS5 table, on PostgreSQL a
+tsvector column with a GIN index, both created by migration 0019. Documents
+are rewritten whenever the client, the invoice or its items are saved.
+
+Every word of a query is matched as a prefix and results come best match
+first. Where there is no search table (other databases, or SQLite built
+without FTS5) searching falls back to ``icontains`` filters.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from django.apps import apps
+from django.db import connections, models
+
+SEARCH_TABLE = 'invoice_search'
+
+CLIENT = 0
+INVOICE = 1
+
+# "12" or "12/VP1/1" is looked up as an invoice number
+NUMBER_RE = re.compile(r'^\s*(\d+)(?:/VP1/1)?\s*$', re.IGNORECASE)
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+CHUNK_SIZE = 500
+
+
+def _doc_id(kind, id):
+    # clients and invoices share the table, the lowest bit tells them apart
+    return id * 2 + kind
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class SQLiteBackend(object):
+    insert_sql = 'INSERT INTO invoice_search (rowid, body) VALUES (%s, %s)'
+    delete_sql = 'DELETE FROM invoice_search WHERE rowid IN (%s)'
+    search_sql = (
+        'SELECT rowid FROM invoice_search WHERE invoice_search MATCH %s {kind} '
+        'ORDER BY rank LIMIT %s')
+    kind_sql = 'AND rowid %% 2 = %s'
+
+    def match(self, words):
+        return ' '.join('"%s"*' % word for word in words)
+
+
+class PostgreSQLBackend(object):
+    insert_sql = "INSERT INTO invoice_search (id, document) VALUES (%s, to_tsvector('simple', %s))"
+    delete_sql = 'DELETE FROM invoice_search WHERE id IN (%s)'
+    search_sql = (
+        "SELECT id FROM invoice_search, to_tsquery('simple', %s) query "
+        'WHERE document @@ query {kind} ORDER BY ts_rank(document, query) DESC LIMIT %s')
+    kind_sql = 'AND id %% 2 = %s'
+
+    def match(self, words):
+        return ' & '.join('%s:*' % word for word in words)
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend(using='default'):
+    """Get the search backend of the `using` database, None without a search table."""
+    connection = connections[using]
+    if not hasattr(connection, '_invoice_search_backend'):
+        backend = BACKENDS.get(connection.vendor)
+        if backend is not None and SEARCH_TABLE in connection.introspection.table_names():
+            connection._invoice_search_backend = backend()
+        else:
+            connection._invoice_search_backend = None
+    return connection._invoice_search_backend
+
+
+def _client_documents(ids):
+    for id, name, vat_id, address in apps.get_model('invoice', 'Client').objects.filter(
+            id__in=ids).values_list('id', 'name', 'vat_id', 'address'):
+        yield _doc_id(CLIENT, id), ' '.join([name, vat_id or '', address or ''])
+
+
+def _invoice_documents(ids):
+    texts = {}
+    for invoice_id, description, additional_info in apps.get_model(
+            'invoice', 'InvoiceItem').objects.filter(
+            invoice_id__in=ids).order_by('id').values_list(
+            'invoice_id', 'description', 'additional_info'):
+        texts.setdefault(invoice_id, []).extend([description, additional_info or ''])
+    for id, seq in apps.get_model('invoice', 'Invoice').objects.filter(
+            id__in=ids).values_list('id', 'seq'):
+        yield _doc_id(INVOICE, id), ' '.join(['%s/VP1/1' % seq] + texts.get(id, []))
+
+
+def _replace(kind, ids, documents, using):
+    backend = get_backend(using)
+    if backend is None:
+        return
+    with connections[using].cursor() as cursor:
+        for chunk in _chunks(ids):
+            doc_ids = [_doc_id(kind, id) for id in chunk]
+            cursor.execute(backend.delete_sql % ', '.join(['%s'] * len(doc_ids)), doc_ids)
+            cursor.executemany(backend.insert_sql, list(documents(chunk)))
+
+
+def index_clients(ids, using='default'):
+    """Write the search documents of the clients with `ids`."""
+    _replace(CLIENT, ids, _client_documents, using)
+
+
+def index_invoices(ids, using='default'):
+    """Write the search documents of the invoices with `ids`, items included."""
+    _replace(INVOICE, ids, _invoice_documents, using)
+
+
+def remove(kind, ids, using='default'):
+    _replace(kind, ids, lambda chunk: [], using)
+
+
+def rebuild(using='default'):
+    """Write the documents of all clients and invoices from scratch."""
+    backend = get_backend(using)
+    if backend is None:
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM invoice_search')
+    index_clients(apps.get_model('invoice', 'Client').objects.values_list('id', flat=True), using)
+    index_invoices(
+        apps.get_model('invoice', 'Invoice').objects.values_list('id', flat=True), using)
+    return True
+
+
+def _words(query):
+    return [word.lower() for word in WORD_RE.findall(query)]
+
+
+def _fallback(query, kind, limit):
+    words = _words(query)
+    if not words:
+        return []
+    if kind == CLIENT:
+        condition = models.Q()
+        for word in words:
+            condition &= (
+                models.Q(name__icontains=word) | models.Q(vat_id__icontains=word) |
+                models.Q(address__icontains=word))
+        queryset = apps.get_model('invoice', 'Client').objects.filter(condition)
+    else:
+        queryset = apps.get_model('invoice', 'Invoice').objects.all()
+        for word in words:
+            queryset = queryset.filter(items__description__icontains=word)
+    return list(queryset.order_by('-id').values_list('id', flat=True).distinct()[:limit])
+
+
+def search(query, kind, limit=50, using='default'):
+    """
+    Get the ids of the clients or invoices (`kind`) matching `query`, best
+    match first.
+
+    An invoice number matches that invoice before any text matches.
+    """
+
+    ids = []
+    number = NUMBER_RE.match(query) if kind == INVOICE else None
+    if number:
+        ids = list(apps.get_model('invoice', 'Invoice').objects.using(using).filter(
+            seq=int(number.group(1))).order_by('-created').values_list('id', flat=True)[:limit])
+
+    backend = get_backend(using)
+    words = _words(query)
+    if backend is None:
+        found = _fallback(query, kind, limit)
+    elif not words:
+        found = []
+    else:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                backend.search_sql.format(kind=backend.kind_sql),
+                [backend.match(words), kind, limit])
+            found = [doc_id // 2 for doc_id, in cursor.fetchall()]
+    return (ids + [id for id in found if id not in ids])[:limit]
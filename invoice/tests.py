@@ -1,18 +1,45 @@
 # -*- coding: utf-8 -*-
 
+import json
 import mock
-from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from freezegun import freeze_time
+from importlib import import_module
+from requests import RequestException
 
-from django.conf import settings
+from django.apps import apps
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError
-from django.test import TestCase, override_settings
-from django.utils.timezone import now, make_aware
-
-from .models import Client, Invoice, InvoiceItem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import BytesIO, StringIO
+from django.utils.six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from django.utils.six.moves.urllib.parse import parse_qs, urlparse
+from django.utils.timezone import now, make_aware, utc
+
+from . import api, search
+from .archive import archivable, archive_invoices
+from .bulk import create_invoices
+from .export import iter_invoice_rows
+from .models import (
+    ArchivedInvoice, Client, ExchangeRate, Invoice, InvoiceEvent, InvoiceItem, InvoiceSequence, RequestTiming, VatRate,
+    VatRollup)
+from .rates import enqueue as enqueue_pending_rate, resolve_pending_rates
+from .reports import (
+    build_client_statement, receivables_aging, request_timing_percentiles, vat_report)
+from .xml_import import import_invoices
 
 
 HNBEX_2016_01_01 = [{
@@ -21,6 +48,12 @@ HNBEX_2016_01_01 = [{
     "buying_rate": "6.979904",
     "unit_value": 1,
     "currency_code": "USD"
+}, {
+    "median_rate": "7.637340",
+    "selling_rate": "7.660252",
+    "buying_rate": "7.614428",
+    "unit_value": 1,
+    "currency_code": "EUR"
 }]
 
 MOCK_JSON_ATTRS = {"get.return_value.json.return_value": HNBEX_2016_01_01}
@@ -45,6 +78,79 @@ class TestClient(TestCase):
         self.assertFalse(client.reverse_charge)
 
 
+class TestVatRate(TestCase):
+
+    def setUp(self):
+        # the cache outlives the test transaction, don't leak its rates
+        VatRate.objects.clear_cache()
+        self.addCleanup(VatRate.objects.clear_cache)
+
+    def test_rate_is_looked_up_by_date_range(self):
+        VatRate.objects.filter(country='SE').update(valid_to=date(2016, 6, 30))
+        VatRate.objects.create(
+            country='SE', rate=Decimal('0.20'), valid_from=date(2016, 7, 1))
+        self.assertEqual(VatRate.objects.lookup('SE', date(2016, 6, 30)).rate, Decimal('0.22'))
+        self.assertEqual(VatRate.objects.lookup('SE', date(2016, 7, 1)).rate, Decimal('0.20'))
+        self.assertEqual(VatRate.objects.lookup('HR', date(2016, 7, 1)).rate, Decimal('0.25'))
+        self.assertIsNone(VatRate.objects.lookup('US', date(2016, 7, 1)))
+
+    def test_warm_cache_does_not_query(self):
+        client = Client.objects.create(country='SE', vat_id='SE999999999901')
+        VatRate.objects.lookup('SE', date(2016, 1, 1))
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertTrue(client.reverse_charge)
+
+    def test_saving_a_rate_clears_the_cache(self):
+        self.assertEqual(VatRate.objects.lookup('HR', date(2016, 1, 1)).rate, Decimal('0.25'))
+        rate = VatRate.objects.get(country='HR')
+        rate.rate = Decimal('0.13')
+        rate.save()
+        self.assertEqual(VatRate.objects.lookup('HR', date(2016, 1, 1)).rate, Decimal('0.13'))
+        rate.delete()
+        self.assertIsNone(VatRate.objects.lookup('HR', date(2016, 1, 1)))
+
+    @override_settings(VAT_RATES_CACHE_TIMEOUT=60)
+    def test_cache_expires(self):
+        VatRate.objects.lookup('HR', date(2016, 1, 1))
+        VatRate.objects.filter(country='HR').update(rate=Decimal('0.13'))
+        self.assertEqual(VatRate.objects.lookup('HR', date(2016, 1, 1)).rate, Decimal('0.25'))
+        with mock.patch('invoice.models.time.time', return_value=time.time() + 61):
+            self.assertEqual(VatRate.objects.lookup('HR', date(2016, 1, 1)).rate, Decimal('0.13'))
+
+    def test_invoices_use_the_rate_of_their_date(self):
+        VatRate.objects.filter(country='HR').update(valid_to=date(2016, 6, 30))
+        VatRate.objects.create(
+            country='HR', rate=Decimal('0.20'), reverse_charge=False, valid_from=date(2016, 7, 1))
+        client = Client.objects.create(country='HR', vat_id='HR2112211221')
+        before = client.invoices.create(created=make_aware(datetime(2016, 6, 30, 12)))
+        after = client.invoices.create(created=make_aware(datetime(2016, 7, 1, 12)))
+        self.assertEqual(before.vat_value, Decimal('0.25'))
+        self.assertEqual(after.vat_value, Decimal('0.20'))
+        self.assertFalse(after.reverse_charge)
+
+    @override_settings(TIME_ZONE='Europe/Zagreb')
+    def test_invoices_use_their_local_date(self):
+        VatRate.objects.filter(country='HR').update(valid_to=date(2016, 6, 30))
+        VatRate.objects.create(
+            country='HR', rate=Decimal('0.20'), reverse_charge=False, valid_from=date(2016, 7, 1))
+        client = Client.objects.create(country='HR')
+        # 30 June 22:30 UTC is already 1 July in Zagreb
+        invoice = client.invoices.create(created=datetime(2016, 6, 30, 22, 30, tzinfo=utc))
+        self.assertEqual(invoice.vat_value, Decimal('0.20'))
+
+    def test_overlapping_periods_are_rejected(self):
+        VatRate.objects.filter(country='SE').update(valid_to=date(2016, 6, 30))
+        rate = VatRate(country='SE', rate=Decimal('0.20'), valid_from=date(2016, 6, 1))
+        with self.assertRaises(ValidationError):
+            rate.full_clean()
+        rate.valid_from = date(2016, 7, 1)
+        rate.full_clean()
+        rate.valid_to = date(2016, 6, 1)
+        with self.assertRaises(ValidationError):
+            rate.full_clean()
+
+
 @mock.patch('invoice.models.requests', **MOCK_JSON_ATTRS)
 class TestInvoice(TestCase):
 
@@ -101,7 +207,7 @@ class TestInvoice(TestCase):
         invoice.items.create(is_hourly=False, amount=100)
         invoice.save()
         self.assertEqual(requests.get.return_value.json.call_count, 0)
-        self.assertEqual(invoice.vat_amount, settings.VAT_DATA['HR'] * 100)
+        self.assertEqual(invoice.vat_amount, Decimal('25.00'))
 
     def test_vat_amount_for_eu_returns_zero(self, requests):
         invoice = Invoice.objects.create(client=self.client)
@@ -202,6 +308,120 @@ class TestInvoice(TestCase):
         self.assertTrue(invoice.has_hourly)
 
 
+@mock.patch('invoice.models.requests', **MOCK_JSON_ATTRS)
+class TestExchangeRate(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create()
+        self.created = make_aware(datetime(2016, 1, 1))
+
+    def test_daily_list_is_stored_for_all_currencies(self, requests):
+        self.client.invoices.create(currency='USD', created=self.created)
+        self.assertEqual(
+            set(ExchangeRate.objects.values_list('currency', flat=True)),
+            set(['USD', 'EUR']))
+
+    def test_stored_rates_are_used_for_other_currencies(self, requests):
+        self.client.invoices.create(currency='USD', created=self.created)
+        invoice = self.client.invoices.create(currency='EUR', created=self.created)
+        self.assertEqual(requests.get.return_value.json.call_count, 1)
+        self.assertEqual(invoice.exchange_rate, Decimal('7.637340'))
+
+    def test_resave_without_changes_does_not_look_up_rate(self, requests):
+        invoice = self.client.invoices.create(currency='USD', created=self.created)
+        invoice = Invoice.objects.get(id=invoice.id)
+        with mock.patch('invoice.models.ExchangeRateManager.get_rate') as get_rate:
+            invoice.paid = True
+            invoice.save()
+        self.assertFalse(get_rate.called)
+
+    def test_changed_currency_looks_up_rate(self, requests):
+        invoice = self.client.invoices.create(currency='USD', created=self.created)
+        invoice = Invoice.objects.get(id=invoice.id)
+        invoice.currency = 'EUR'
+        invoice.save()
+        self.assertEqual(requests.get.return_value.json.call_count, 1)
+        self.assertEqual(invoice.exchange_rate, Decimal('7.637340'))
+
+    def test_day_without_rates_is_fetched_once(self, requests):
+        requests.get.return_value.json.return_value = []
+        invoice = self.client.invoices.create(currency='USD', created=self.created)
+        self.assertIsNone(invoice.exchange_rate)
+        self.assertIsNone(ExchangeRate.objects.get_rate('EUR', self.created.date()))
+        self.assertEqual(requests.get.return_value.json.call_count, 1)
+
+    def test_changed_date_fetches_new_daily_list(self, requests):
+        invoice = self.client.invoices.create(currency='USD', created=self.created)
+        invoice.created = make_aware(datetime(2016, 1, 2))
+        invoice.save()
+        self.assertEqual(requests.get.return_value.json.call_count, 2)
+
+
+class FakeHNBHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.server.requested_dates.append(query['date'][0])
+        body = json.dumps(HNBEX_2016_01_01).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSyncRatesCommand(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeHNBHandler)
+        self.server.requested_dates = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.hnbex_url = 'http://127.0.0.1:%d/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def sync(self, *args):
+        out = StringIO()
+        with override_settings(HNBEX_URL=self.hnbex_url):
+            call_command('sync_rates', *args, stdout=out)
+        return out.getvalue()
+
+    def test_every_day_in_range_is_fetched_and_stored(self):
+        output = self.sync('--from', '2016-01-01', '--to', '2016-01-05', '--workers', '3')
+        self.assertEqual(sorted(self.server.requested_dates), [
+            '2016-01-01', '2016-01-02', '2016-01-03', '2016-01-04', '2016-01-05'])
+        self.assertEqual(ExchangeRate.objects.count(), 10)
+        self.assertIn('requests/s', output)
+
+    def test_already_stored_days_are_skipped(self):
+        self.sync('--from', '2016-01-01', '--to', '2016-01-02')
+        self.sync('--from', '2016-01-01', '--to', '2016-01-03')
+        self.assertEqual(sorted(self.server.requested_dates), [
+            '2016-01-01', '2016-01-02', '2016-01-03'])
+        self.assertEqual(ExchangeRate.objects.count(), 6)
+
+    def test_force_refetches_stored_days(self):
+        self.sync('--from', '2016-01-01', '--to', '2016-01-01')
+        self.sync('--from', '2016-01-01', '--to', '2016-01-01', '--force')
+        self.assertEqual(len(self.server.requested_dates), 2)
+        self.assertEqual(ExchangeRate.objects.count(), 2)
+
+    @mock.patch('invoice.models.requests')
+    def test_invoice_save_uses_synced_rates(self, requests):
+        self.sync('--from', '2016-01-01', '--to', '2016-01-01')
+        invoice = Client.objects.create().invoices.create(
+            currency='USD', created=make_aware(datetime(2016, 1, 1)))
+        self.assertFalse(requests.get.called)
+        self.assertEqual(invoice.exchange_rate, Decimal('7.000907'))
+
+
 class TestInvoiceDuplicate(TestCase):
 
     def setUp(self):
@@ -216,7 +436,7 @@ class TestInvoiceDuplicate(TestCase):
     def test_duplicated_invoice_has_same_currency(self, requests):
         current_invoice = self.client.invoices.create(currency='USD')
         new_invoice = current_invoice.duplicate()
-        self.assertEqual(requests.get.return_value.json.call_count, 2)
+        self.assertEqual(requests.get.return_value.json.call_count, 1)
         self.assertEqual(new_invoice.currency, current_invoice.currency)
 
     def test_duplicated_invoice_items_have_same_attributes(self):
@@ -261,6 +481,1230 @@ class TestInvoiceDuplicate(TestCase):
         self.assertNotEqual(current_invoice.due_date, new_invoice.due_date)
 
 
+class TestInvoiceSequence(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create()
+
+    def test_allocated_block_is_consecutive(self):
+        first = InvoiceSequence.objects.allocate(2016, count=10)
+        self.assertEqual(first, 1)
+        self.assertEqual(InvoiceSequence.objects.allocate(2016), 11)
+
+    def test_explicit_seq_is_never_allocated_again(self):
+        self.client.invoices.create(seq=50)
+        self.assertEqual(self.client.invoices.create().seq, 51)
+
+    def test_edited_numbers_are_never_allocated_again(self):
+        invoice = self.client.invoices.create(created=make_aware(datetime(2016, 5, 1)))
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.seq = 20
+        invoice.save()
+        self.assertEqual(
+            self.client.invoices.create(created=make_aware(datetime(2016, 6, 1))).seq, 21)
+
+        invoice.created = make_aware(datetime(2017, 1, 10))
+        invoice.save()
+        self.assertEqual(
+            self.client.invoices.create(created=make_aware(datetime(2017, 2, 1))).seq, 21)
+
+    def test_counter_continues_after_existing_invoices(self):
+        self.client.invoices.create()
+        self.client.invoices.create()
+        InvoiceSequence.objects.all().delete()
+        self.assertEqual(self.client.invoices.create().seq, 3)
+
+    def test_peek_does_not_reserve_number(self):
+        self.client.invoices.create()
+        self.assertEqual(InvoiceSequence.objects.peek(now().year), 2)
+        self.assertEqual(self.client.invoices.create().seq, 2)
+
+    def test_allocation_does_not_aggregate_invoices(self):
+        self.client.invoices.create()
+        with CaptureQueriesContext(connection) as queries:
+            InvoiceSequence.objects.allocate(now().year)
+        self.assertFalse([q for q in queries if 'MAX(' in q['sql']])
+
+
+class TestInvoiceSeqUniqueness(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create()
+        self.invoice = self.client.invoices.create(created=make_aware(datetime(2016, 3, 1)))
+
+    def test_same_seq_in_same_year_fails_validation(self):
+        invoice = Invoice(client=self.client, seq=1, created=make_aware(datetime(2016, 9, 1)))
+        with self.assertRaises(ValidationError) as cm:
+            invoice.validate_unique()
+        self.assertIn('seq', cm.exception.message_dict)
+
+    def test_same_seq_in_other_year_is_valid(self):
+        Invoice(client=self.client, seq=1, created=make_aware(datetime(2017, 1, 1))).validate_unique()
+
+    def test_database_rejects_same_seq_in_same_year(self):
+        other = self.client.invoices.create(created=make_aware(datetime(2016, 9, 1)))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Invoice.objects.filter(id=other.id).update(seq=self.invoice.seq)
+
+    @override_settings(TIME_ZONE='Europe/Zagreb')
+    def test_numbers_follow_the_local_year(self):
+        # 31 December 23:30 UTC is already the new year in Zagreb
+        invoice = self.client.invoices.create(created=datetime(2016, 12, 31, 23, 30, tzinfo=utc))
+        self.assertEqual((invoice.year, invoice.seq), (2017, 1))
+
+
+class TestConcurrentInvoiceSequence(TransactionTestCase):
+    # keep the VAT rates the migrations add for the tests that run after
+    serialized_rollback = True
+
+    def test_concurrent_invoices_get_unique_gap_free_numbers(self):
+        client = Client.objects.create()
+        seqs = []
+        errors = []
+
+        def create_invoices():
+            try:
+                for _ in range(10):
+                    seqs.append(client.invoices.create().seq)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create_invoices) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(seqs), list(range(1, 81)))
+        self.assertEqual(
+            sorted(Invoice.objects.values_list('seq', flat=True)), list(range(1, 81)))
+
+
+class TestInvoiceTotals(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(country='HR')
+        self.invoice = self.client.invoices.create()
+
+    def test_totals_are_stored_on_item_save(self):
+        self.invoice.items.create(is_hourly=False, amount=100)
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        self.assertEqual(invoice.subtotal, Decimal('100.00'))
+        self.assertEqual(invoice.vat_amount, Decimal('25.00'))
+        self.assertEqual(invoice.total, Decimal('125.00'))
+        self.assertEqual(invoice.total_hrk, Decimal('125.00'))
+
+    def test_totals_are_updated_on_item_delete(self):
+        self.invoice.items.create(is_hourly=False, amount=100)
+        item = self.invoice.items.create(is_hourly=False, amount=50)
+        item.delete()
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).subtotal, Decimal('100.00'))
+
+    def test_reading_totals_runs_no_queries(self):
+        self.invoice.items.create(is_hourly=False, amount=100)
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        with self.assertNumQueries(0):
+            invoice.subtotal, invoice.subtotal_hrk, invoice.vat_amount
+            invoice.vat_hrk, invoice.total, invoice.total_hrk
+
+    def test_deferred_totals_are_recomputed_once(self):
+        with mock.patch.object(
+                Invoice, '_aggregate_subtotal', autospec=True,
+                side_effect=Invoice._aggregate_subtotal) as aggregate:
+            with self.invoice.deferred_totals():
+                for amount in (10, 20, 30):
+                    self.invoice.items.create(is_hourly=False, amount=amount)
+        self.assertEqual(aggregate.call_count, 1)
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).subtotal, Decimal('60.00'))
+
+    def test_recompute_totals_command_repairs_drift(self):
+        self.invoice.items.create(is_hourly=False, amount=100)
+        Invoice.objects.filter(id=self.invoice.id).update(subtotal=1, total=1)
+        out = StringIO()
+        call_command('recompute_totals', stdout=out)
+        self.assertIn('repaired 1', out.getvalue())
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        self.assertEqual(invoice.subtotal, Decimal('100.00'))
+        self.assertEqual(invoice.total, Decimal('125.00'))
+
+
+@mock.patch('invoice.models.requests', **MOCK_JSON_ATTRS)
+class TestBatchDuplicate(TestCase):
+
+    def setUp(self):
+        self.clients = [
+            Client.objects.create(country='HR'),
+            Client.objects.create(country='SE', vat_id='SE999999999901'),
+        ]
+
+    def create_sources(self, count, created):
+        for n in range(count):
+            invoice = self.clients[n % 2].invoices.create(currency='USD', created=created)
+            invoice.items.create(is_hourly=False, amount=100)
+            invoice.items.create(is_hourly=True, rate=10, hours=2)
+
+    @freeze_time('2016-06-01')
+    def test_copies_get_consecutive_numbers_items_and_totals(self, requests):
+        self.create_sources(3, make_aware(datetime(2016, 5, 10)))
+        copies = Invoice.objects.duplicate(Invoice.objects.all())
+        self.assertEqual([invoice.seq for invoice in copies], [4, 5, 6])
+        for invoice in copies:
+            stored = Invoice.objects.get(id=invoice.id)
+            self.assertEqual(stored.items.count(), 2)
+            self.assertEqual(stored.subtotal, Decimal('120.00'))
+            self.assertEqual(stored.exchange_rate, Decimal('7.000907'))
+            self.assertEqual(stored.due_date, make_aware(datetime(2016, 6, 15)))
+        self.assertEqual(copies[0].vat_value, Decimal('0.25'))
+        self.assertEqual(copies[1].vat_value, 0)
+
+    def test_batch_totals_match_recomputed_ones(self, requests):
+        # 10.55 * 1.5 = 15.825 is stored as 15.82
+        invoice, = Invoice.objects.create_batch([(
+            Invoice(client=self.clients[0], created=make_aware(datetime(2016, 5, 10))),
+            [InvoiceItem(is_hourly=True, description='Rad', rate=Decimal('10.55'), hours=Decimal('1.5'))
+             for n in range(2)])])
+        self.assertEqual(invoice.subtotal, Decimal('31.64'))
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.recompute_totals()
+        self.assertEqual(
+            Invoice.objects.filter(pk=invoice.pk).values_list('subtotal', 'total').get(),
+            (Decimal('31.64'), Decimal('39.55')))
+
+    @freeze_time('2016-06-01')
+    def test_query_count_does_not_depend_on_invoice_count(self, requests):
+        # store today's rates up front so both runs find them
+        self.clients[0].invoices.create(currency='USD')
+        self.create_sources(2, make_aware(datetime(2016, 5, 10)))
+        with CaptureQueriesContext(connection) as few:
+            Invoice.objects.duplicate(Invoice.objects.filter(created__month=5))
+        self.create_sources(8, make_aware(datetime(2016, 5, 10)))
+        with CaptureQueriesContext(connection) as many:
+            Invoice.objects.duplicate(Invoice.objects.filter(created__month=5))
+        self.assertEqual(len(few), len(many))
+
+    @freeze_time('2016-06-01')
+    def test_generate_recurring_duplicates_previous_month(self, requests):
+        self.create_sources(3, make_aware(datetime(2016, 5, 10)))
+        self.create_sources(1, make_aware(datetime(2016, 4, 10)))
+        out = StringIO()
+        call_command('generate_recurring', stdout=out)
+        self.assertIn('Generated 3 invoices from 2016-05', out.getvalue())
+        self.assertIn('invoices/s', out.getvalue())
+        self.assertEqual(Invoice.objects.filter(created__month=6).count(), 3)
+
+    @freeze_time('2016-06-01')
+    def test_generate_recurring_runs_once_a_month(self, requests):
+        self.create_sources(3, make_aware(datetime(2016, 5, 10)))
+        call_command('generate_recurring', stdout=StringIO())
+        out = StringIO()
+        call_command('generate_recurring', stdout=out)
+        self.assertIn('Skipping 3 invoices', out.getvalue())
+        self.assertIn('Generated 0 invoices', out.getvalue())
+        self.assertEqual(Invoice.objects.filter(created__month=6).count(), 3)
+
+
+IMPORT_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<invoices>
+    <invoice client_vat_id="SE 999999999901" created="2016-05-10T10:00:00" seq="7">
+        <item is_hourly="true" rate="40" hours="10" description="Development">Sprint 1</item>
+        <item is_hourly="false" amount="100" description="Hosting"/>
+    </invoice>
+    <invoice client_vat_id="SE000000000000">
+        <item is_hourly="false" amount="100" description="Hosting"/>
+    </invoice>
+    <invoice client_vat_id="SE999999999901" created="2016-05-11T10:00:00">
+        <item is_hourly="true" description="Development"/>
+    </invoice>
+    <invoice client_vat_id="SE999999999901" created="2016-05-12T10:00:00" paid="true">
+        <item is_hourly="false" amount="50" description="Support"/>
+    </invoice>
+</invoices>
+"""
+
+
+class TestXMLImport(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(country='SE', vat_id='SE999999999901')
+
+    def test_valid_invoices_are_imported_with_items(self):
+        result = import_invoices(BytesIO(IMPORT_XML))
+        self.assertEqual(result.imported, 2)
+        invoice = Invoice.objects.get(seq=7)
+        self.assertEqual(invoice.client, self.client)
+        self.assertEqual(invoice.subtotal, Decimal('500.00'))
+        self.assertEqual(invoice.items.get(description='Development').additional_info, 'Sprint 1')
+        self.assertTrue(Invoice.objects.get(seq=8).paid)
+
+    def test_invalid_invoices_are_reported_by_position(self):
+        result = import_invoices(BytesIO(IMPORT_XML))
+        self.assertEqual([row for row, message in result.errors], [2, 3])
+
+    def test_small_batches_give_the_same_result(self):
+        result = import_invoices(BytesIO(IMPORT_XML), batch_size=1)
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(InvoiceItem.objects.count(), 3)
+
+    def test_existing_invoice_number_is_reported(self):
+        self.client.invoices.create(seq=7, created=make_aware(datetime(2016, 1, 1)))
+        result = import_invoices(BytesIO(IMPORT_XML))
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([row for row, message in result.errors], [1, 2, 3])
+
+
+class TestUploadXMLView(TestCase):
+
+    def setUp(self):
+        Client.objects.create(country='SE', vat_id='SE999999999901')
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        self.client.login(username='admin', password='admin_password')
+        self.url = reverse('admin:invoice_invoice_upload_xml')
+
+    def test_upload_form_is_shown(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'admin/upload_xml.html')
+
+    def test_uploaded_file_is_imported(self):
+        response = self.client.post(self.url, {
+            'xml_file': SimpleUploadedFile('invoices.xml', IMPORT_XML)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(len(response.context['result'].errors), 2)
+
+    def test_malformed_file_is_rejected(self):
+        response = self.client.post(self.url, {
+            'xml_file': SimpleUploadedFile('invoices.xml', b'<invoices>')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Invoice.objects.count(), 0)
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(name='Klijent', country='HR')
+        for day in (1, 2, 3):
+            invoice = self.client.invoices.create(created=make_aware(datetime(2016, 5, day)))
+            invoice.items.create(is_hourly=False, amount=100)
+
+    def test_rows_have_stored_totals(self):
+        header, first = list(iter_invoice_rows(Invoice.objects.all()))[:2]
+        row = dict(zip(header, first))
+        self.assertEqual(row['Klijent'], 'Klijent')
+        self.assertEqual(row['Datum izrade'], '2016-05-01')
+        self.assertEqual(row['Ukupno (HRK)'], Decimal('125.00'))
+
+    def test_one_query_per_chunk(self):
+        with self.assertNumQueries(2):
+            rows = list(iter_invoice_rows(Invoice.objects.all(), chunk_size=2))
+        self.assertEqual(len(rows), 4)
+
+    def test_export_command_filters_by_period(self):
+        out = StringIO()
+        call_command('export_invoices', '--from', '2016-05-02', '--to', '2016-05-02', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2016-05-02', lines[1])
+
+    def test_admin_action_streams_csv(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        self.client = self.client_class()
+        self.client.login(username='admin', password='admin_password')
+        response = self.client.post(reverse('admin:invoice_invoice_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': list(Invoice.objects.values_list('id', flat=True)),
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+
+@mock.patch('invoice.printing.html_to_pdf', return_value=b'%PDF-1.4 test')
+class TestPDF(TestCase):
+
+    def setUp(self):
+        self.pdf_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(INVOICE_PDF_DIR=self.pdf_dir)
+        self.settings_override.enable()
+        client = Client.objects.create()
+        self.invoices = [
+            client.invoices.create(created=make_aware(datetime(2016, 5, day)))
+            for day in (1, 2)]
+        User.objects.create_user(username='test_user', password='test_password')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.pdf_dir)
+
+    def test_print_view_returns_pdf(self, html_to_pdf):
+        self.client.login(username='test_user', password='test_password')
+        response = self.client.get('/invoice/%d/?format=pdf' % self.invoices[0].id)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 test')
+
+    def test_pdf_is_rendered_once_per_version(self, html_to_pdf):
+        self.client.login(username='test_user', password='test_password')
+        url = '/invoice/%d/?format=pdf' % self.invoices[0].id
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(html_to_pdf.call_count, 1)
+        with freeze_time(now() + timedelta(seconds=1)):
+            self.invoices[0].items.create(is_hourly=False, description='Stavka', amount=10)
+        self.client.get(url)
+        self.assertEqual(html_to_pdf.call_count, 2)
+        self.assertEqual(len(os.listdir(self.pdf_dir)), 1)
+
+    def test_render_invoices_writes_zip(self, html_to_pdf):
+        output = os.path.join(self.pdf_dir, 'invoices.zip')
+        call_command(
+            'render_invoices', '--from', '2016-05-01', '--processes', '1',
+            '--output', output, stdout=StringIO())
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()), ['racun-2016-1.pdf', 'racun-2016-2.pdf'])
+            self.assertEqual(archive.read('racun-2016-1.pdf'), b'%PDF-1.4 test')
+
+
+class TestClientStatement(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(name='Klijent', country='HR')
+        self.invoices = []
+        for day, paid in ((1, False), (2, True), (3, False)):
+            invoice = self.client.invoices.create(
+                created=make_aware(datetime(2016, 5, day)), paid=paid)
+            invoice.items.create(is_hourly=False, amount=100)
+            self.invoices.append(invoice)
+
+    def test_running_outstanding_balance(self):
+        statement = build_client_statement(self.client)
+        self.assertEqual(
+            [row['outstanding'] for row in statement['invoices']],
+            [Decimal('125.00'), Decimal('125.00'), Decimal('250.00')])
+        self.assertEqual(statement['outstanding'], {'HRK': Decimal('250.00')})
+        self.assertEqual(statement['outstanding_hrk'], Decimal('250.00'))
+
+    def test_single_query_regardless_of_invoice_count(self):
+        with self.assertNumQueries(1):
+            build_client_statement(self.client)
+        for day in range(4, 20):
+            self.client.invoices.create(created=make_aware(datetime(2016, 5, day)))
+        with self.assertNumQueries(1):
+            build_client_statement(self.client)
+
+    def test_statement_view_json(self):
+        User.objects.create_user(username='test_user', password='test_password')
+        client = self.client_class()
+        client.login(username='test_user', password='test_password')
+        response = client.get(
+            reverse('client_statement', args=[self.client.id]), {'format': 'json'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['client']['name'], 'Klijent')
+        self.assertEqual(len(data['invoices']), 3)
+        self.assertEqual(data['outstanding_hrk'], '250.00')
+
+    def test_statement_view_html(self):
+        User.objects.create_user(username='test_user', password='test_password')
+        client = self.client_class()
+        client.login(username='test_user', password='test_password')
+        response = client.get(reverse('client_statement', args=[self.client.id]))
+        self.assertContains(response, str(self.invoices[2]))
+
+
+class TestAgingReport(TestCase):
+
+    def setUp(self):
+        self.as_of = make_aware(datetime(2016, 6, 1, 12))
+        self.client = Client.objects.create(name='Klijent', country='HR')
+        for days_overdue, paid in ((-5, False), (10, False), (45, False), (75, True), (120, False)):
+            invoice = self.client.invoices.create(
+                created=make_aware(datetime(2016, 1, 4)), paid=paid)
+            invoice.items.create(is_hourly=False, amount=100)
+            Invoice.objects.filter(pk=invoice.pk).update(
+                due_date=self.as_of - timedelta(days=days_overdue))
+
+    def test_unpaid_totals_by_bucket(self):
+        with self.assertNumQueries(1):
+            rows = receivables_aging(self.as_of)
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row['current'], Decimal('125.00'))
+        self.assertEqual(row['days_1_30'], Decimal('125.00'))
+        self.assertEqual(row['days_31_60'], Decimal('125.00'))
+        self.assertEqual(row['days_61_90'], Decimal('0.00'))
+        self.assertEqual(row['days_90_plus'], Decimal('125.00'))
+        self.assertEqual(row['total_hrk_sum'], Decimal('500.00'))
+
+    def test_command_prints_totals(self):
+        out = StringIO()
+        call_command('aging_report', '--date', '2016-06-01', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[-1].endswith('500.00'))
+
+    def test_admin_page(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        client = self.client_class()
+        client.login(username='admin', password='admin_password')
+        response = client.get(reverse('admin:invoice_invoice_aging'))
+        self.assertContains(response, 'Klijent')
+
+
+class TestVatRollup(TestCase):
+
+    def setUp(self):
+        self.domestic = Client.objects.create(name='Domaći', country='HR')
+        self.foreign = Client.objects.create(name='Strani', country='SE', vat_id='SE556036079301')
+        self.may = make_aware(datetime(2016, 5, 10))
+        self.invoice = self.domestic.invoices.create(created=self.may)
+        self.invoice.items.create(is_hourly=False, amount=100)
+        foreign_invoice = self.foreign.invoices.create(created=self.may)
+        foreign_invoice.items.create(is_hourly=False, amount=200)
+
+    def rollups(self):
+        return dict(
+            ((rollup.month, rollup.country.code, rollup.reverse_charge),
+             (rollup.invoices, rollup.subtotal_hrk, rollup.vat_hrk))
+            for rollup in VatRollup.objects.all())
+
+    def test_rollups_follow_item_changes(self):
+        self.assertEqual(self.rollups(), {
+            (date(2016, 5, 1), 'HR', False): (1, Decimal('100.00'), Decimal('25.00')),
+            (date(2016, 5, 1), 'SE', True): (1, Decimal('200.00'), Decimal('0.00')),
+        })
+        item = self.invoice.items.create(is_hourly=False, amount=20)
+        self.assertEqual(
+            self.rollups()[date(2016, 5, 1), 'HR', False], (1, Decimal('120.00'), Decimal('30.00')))
+        item.delete()
+        self.assertEqual(
+            self.rollups()[date(2016, 5, 1), 'HR', False], (1, Decimal('100.00'), Decimal('25.00')))
+
+    def test_moving_and_deleting_invoices(self):
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        invoice.created = make_aware(datetime(2016, 6, 2))
+        invoice.save()
+        rollups = self.rollups()
+        self.assertNotIn((date(2016, 5, 1), 'HR', False), rollups)
+        self.assertEqual(rollups[date(2016, 6, 1), 'HR', False], (1, Decimal('100.00'), Decimal('25.00')))
+        invoice.delete()
+        self.assertEqual(list(self.rollups()), [(date(2016, 5, 1), 'SE', True)])
+
+    def test_saves_move_only_their_own_share(self):
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        invoice.paid = True
+        with CaptureQueriesContext(connection) as queries:
+            invoice.save()
+        self.assertFalse([q for q in queries.captured_queries if 'invoice_vatrollup' in q['sql']])
+
+        invoice.created = make_aware(datetime(2016, 6, 2))
+        invoice.save()
+        invoice.items.create(is_hourly=False, amount=20)
+        self.assertEqual(self.rollups(), dict(
+            ((rollup.month, rollup.country.code, rollup.reverse_charge),
+             (rollup.invoices, rollup.subtotal_hrk, rollup.vat_hrk))
+            for month in (date(2016, 5, 1), date(2016, 6, 1))
+            for rollup in VatRollup.objects.compute(month)))
+
+    def test_client_country_change(self):
+        client = Client.objects.get(pk=self.domestic.pk)
+        client.country = 'SI'
+        client.save()
+        self.assertIn((date(2016, 5, 1), 'SI', False), self.rollups())
+
+    def test_batch_created_invoices(self):
+        Invoice.objects.create_batch([
+            (Invoice(client=self.domestic, created=self.may),
+             [InvoiceItem(is_hourly=False, description='Stavka', amount=50)]),
+        ])
+        self.assertEqual(
+            self.rollups()[date(2016, 5, 1), 'HR', False], (2, Decimal('150.00'), Decimal('37.50')))
+
+    def test_rebuild_finds_and_repairs_drift(self):
+        VatRollup.objects.filter(country='HR').update(vat_hrk=0)
+        out = StringIO()
+        call_command('rebuild_vat_rollups', '--dry-run', stdout=out)
+        self.assertIn('found wrong 1', out.getvalue())
+        call_command('rebuild_vat_rollups', stdout=StringIO())
+        self.assertEqual(
+            self.rollups()[date(2016, 5, 1), 'HR', False], (1, Decimal('100.00'), Decimal('25.00')))
+        out = StringIO()
+        call_command('rebuild_vat_rollups', '--dry-run', stdout=out)
+        self.assertIn('found wrong 0', out.getvalue())
+
+    def test_report_reads_only_rollups(self):
+        with self.assertNumQueries(1):
+            rows = vat_report(2016)
+        self.assertEqual(len(rows), 2)
+
+    def test_admin_csv_export(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        client = self.client_class()
+        client.login(username='admin', password='admin_password')
+        response = client.get(
+            reverse('admin:invoice_invoice_vat_report'), {'year': 2016, 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('2016-05,HR,ne,0.25,1,100.00,25.00'))
+
+
+class TestRecalcInvoices(TestCase):
+
+    def setUp(self):
+        VatRate.objects.clear_cache()
+        self.addCleanup(VatRate.objects.clear_cache)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.checkpoint = os.path.join(self.tmp_dir, 'recalc.json')
+        client = Client.objects.create(country='HR')
+        self.invoices = []
+        for month in (5, 7, 8):
+            invoice = client.invoices.create(created=make_aware(datetime(2016, month, 10)))
+            invoice.items.create(is_hourly=False, amount=100)
+            self.invoices.append(invoice)
+        # the rate changes after the invoices were issued
+        VatRate.objects.filter(country='HR').update(valid_to=date(2016, 6, 30))
+        VatRate.objects.create(
+            country='HR', rate=Decimal('0.20'), reverse_charge=False, valid_from=date(2016, 7, 1))
+
+    def recalc(self, *args):
+        out = StringIO()
+        call_command(
+            'recalc_invoices', '--year', '2016', '--processes', '1', '--batch-size', '1',
+            '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_recomputes_vat_totals_and_rollups(self):
+        output = self.recalc()
+        self.assertIn('Recomputed 3 invoices of 2016', output)
+        self.assertIn('2 changed', output)
+        may, july, august = [Invoice.objects.get(id=invoice.id) for invoice in self.invoices]
+        self.assertEqual((may.vat_value, may.vat_amount), (Decimal('0.25'), Decimal('25.00')))
+        self.assertEqual((july.vat_value, july.vat_amount), (Decimal('0.20'), Decimal('20.00')))
+        self.assertEqual(august.total_hrk, Decimal('120.00'))
+        self.assertEqual(
+            VatRollup.objects.get(month=date(2016, 7, 1)).vat_hrk, Decimal('20.00'))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        first = self.invoices[1].id
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'year': 2016, 'done': [[first, first]]}, f)
+        output = self.recalc()
+        self.assertIn('2 invoices left', output)
+        self.assertEqual(Invoice.objects.get(id=first).vat_value, Decimal('0.25'))
+        self.assertEqual(Invoice.objects.get(id=self.invoices[2].id).vat_value, Decimal('0.20'))
+
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'year': 2016, 'done': [[first, first]]}, f)
+        self.recalc('--restart')
+        self.assertEqual(Invoice.objects.get(id=first).vat_value, Decimal('0.20'))
+
+    def test_few_queries_per_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            self.recalc('--restart')
+        Invoice.objects.update(vat_value=0)
+        with CaptureQueriesContext(connection) as large:
+            call_command(
+                'recalc_invoices', '--year', '2016', '--processes', '1', '--batch-size', '100',
+                '--checkpoint', self.checkpoint, stdout=StringIO())
+        self.assertLess(len(large), len(small))
+        self.assertEqual(
+            sorted(Invoice.objects.values_list('vat_value', flat=True)),
+            [Decimal('0.20'), Decimal('0.20'), Decimal('0.25')])
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        customer = Client.objects.create(name='Klijent', country='HR')
+        self.old = customer.invoices.create(created=make_aware(datetime(2016, 5, 10)), paid=True)
+        self.old.items.create(is_hourly=False, description='Hosting', amount=100)
+        self.old.items.create(is_hourly=True, description='Razvoj', rate=10, hours=2)
+        self.unpaid = customer.invoices.create(created=make_aware(datetime(2016, 5, 11)))
+        self.unpaid.items.create(is_hourly=False, description='Hosting', amount=50)
+        self.recent = customer.invoices.create(created=make_aware(datetime(2018, 1, 5)), paid=True)
+        self.cutoff = make_aware(datetime(2017, 1, 1))
+
+    def test_moves_closed_invoices_with_items(self):
+        modified = Invoice.objects.get(id=self.old.id).modified
+        self.assertEqual(archive_invoices(archivable(self.cutoff), batch_size=1), 1)
+        self.assertEqual(
+            sorted(Invoice.objects.values_list('id', flat=True)), [self.unpaid.id, self.recent.id])
+        archived = ArchivedInvoice.objects.get(id=self.old.id)
+        self.assertEqual(archived.seq, self.old.seq)
+        self.assertEqual(archived.total, Decimal('150.00'))
+        self.assertEqual(archived.modified, modified)
+        self.assertEqual(
+            list(archived.items.order_by('id').values_list('description', flat=True)),
+            ['Hosting', 'Razvoj'])
+        self.assertEqual(InvoiceItem.objects.filter(invoice_id=self.old.id).count(), 0)
+        self.assertNotIn(self.old.id, search.search(str(self.old.seq), search.INVOICE))
+
+    def test_rollups_keep_archived_invoices(self):
+        before = VatRollup.objects.get(month=date(2016, 5, 1)).total_hrk
+        archive_invoices(archivable(self.cutoff))
+        self.assertEqual(VatRollup.objects.get(month=date(2016, 5, 1)).total_hrk, before)
+        # a change to a remaining invoice of the month recomputes it
+        self.unpaid.items.create(is_hourly=False, description='Domena', amount=10)
+        self.assertEqual(
+            VatRollup.objects.get(month=date(2016, 5, 1)).total_hrk, before + Decimal('12.50'))
+
+    def test_archived_numbers_stay_taken(self):
+        archive_invoices(archivable(self.cutoff))
+        invoice = Invoice(client=self.unpaid.client, created=self.old.created, seq=self.old.seq)
+        with self.assertRaises(ValidationError):
+            invoice.validate_unique()
+
+    def test_archived_numbers_are_not_allocated_again(self):
+        self.unpaid.paid = True
+        self.unpaid.save()
+        archive_invoices(archivable(self.cutoff))
+        # e.g. a database restored from before the counters existed
+        InvoiceSequence.objects.filter(year=2016).delete()
+        self.assertEqual(InvoiceSequence.objects.peek(2016), 3)
+        invoice = self.unpaid.client.invoices.create(created=make_aware(datetime(2016, 12, 1)))
+        self.assertEqual(invoice.seq, 3)
+
+    def test_print_falls_back_to_archive(self):
+        archive_invoices(archivable(self.cutoff))
+        User.objects.create_user(username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+        response = self.client.get('/invoice/%d/' % self.old.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['items']), 2)
+        self.assertEqual(self.client.get('/invoice/999/').status_code, 404)
+
+    def test_admin_is_read_only(self):
+        archive_invoices(archivable(self.cutoff))
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        self.client.login(username='admin', password='admin_password')
+        self.assertEqual(
+            self.client.get(reverse('admin:invoice_archivedinvoice_changelist')).status_code, 200)
+        url = reverse('admin:invoice_archivedinvoice_change', args=[self.old.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {}).status_code, 403)
+
+    @freeze_time('2019-06-01')
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_invoices', '--years', '2', '--dry-run', stdout=out)
+        self.assertIn('Would archive 1 invoices created before 2017-01-01', out.getvalue())
+        self.assertEqual(ArchivedInvoice.objects.count(), 0)
+        call_command('archive_invoices', '--years', '2', stdout=StringIO())
+        self.assertEqual(list(ArchivedInvoice.objects.values_list('id', flat=True)), [self.old.id])
+
+
+class TestInvoiceEvents(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Client.objects.create(name='Klijent', country='HR')
+        with freeze_time('2016-05-10 10:00'):
+            self.invoice = self.customer.invoices.create()
+            self.item = self.invoice.items.create(is_hourly=False, description='Hosting', amount=100)
+
+    def events(self, invoice_id=None):
+        return list(InvoiceEvent.objects.filter(
+            invoice_id=invoice_id or self.invoice.id).order_by('version'))
+
+    def test_changes_are_logged_as_diffs(self):
+        self.invoice.paid = True
+        self.invoice.save()
+        events = self.events()
+        self.assertEqual(
+            [event.kind for event in events],
+            [InvoiceEvent.SNAPSHOT, InvoiceEvent.CHANGE, InvoiceEvent.CHANGE])
+        self.assertEqual(json.loads(events[-1].data), {'invoice': {'paid': True}})
+        self.invoice.save()
+        self.assertEqual(len(self.events()), 3)
+
+    def test_rebuilds_past_versions(self):
+        with freeze_time('2016-05-10 11:00'):
+            self.item.amount = 200
+            self.item.save()
+        with freeze_time('2016-05-10 12:00'):
+            self.item.delete()
+            self.invoice.items.create(is_hourly=True, description='Razvoj', rate=10, hours=3)
+
+        invoice, items = InvoiceEvent.objects.as_of(
+            self.invoice.id, make_aware(datetime(2016, 5, 10, 10, 30)))
+        self.assertEqual(invoice.seq, self.invoice.seq)
+        self.assertEqual(invoice.client, self.customer)
+        self.assertEqual(invoice.total, Decimal('125.00'))
+        self.assertEqual([(item.description, item.amount) for item in items], [('Hosting', 100)])
+        invoice, items = InvoiceEvent.objects.as_of(
+            self.invoice.id, make_aware(datetime(2016, 5, 10, 11, 30)))
+        self.assertEqual(invoice.total, Decimal('250.00'))
+        invoice, items = InvoiceEvent.objects.as_of(
+            self.invoice.id, make_aware(datetime(2016, 5, 10, 12, 30)))
+        self.assertEqual([(item.description, item.amount) for item in items], [('Razvoj', 30)])
+        self.assertIsNone(InvoiceEvent.objects.as_of(
+            self.invoice.id, make_aware(datetime(2016, 5, 9))))
+
+    @override_settings(INVOICE_EVENT_SNAPSHOT_INTERVAL=3)
+    def test_snapshots_bound_the_rows_read(self):
+        for amount in range(1, 11):
+            self.item.amount = amount
+            self.item.save()
+        kinds = [event.kind for event in self.events()]
+        self.assertEqual(kinds[:7], [0, 1, 1, 0, 1, 1, 0])
+        with CaptureQueriesContext(connection) as queries:
+            invoice, items = InvoiceEvent.objects.as_of(self.invoice.id, now())
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(items[0].amount, Decimal('10.00'))
+        self.assertEqual(invoice.total, Decimal('12.50'))
+
+    def test_deleted_invoices_keep_their_history(self):
+        invoice_id = self.invoice.id
+        # delete() leaves the instance without an id
+        self.invoice.delete()
+        self.assertEqual(self.events(invoice_id)[-1].kind, InvoiceEvent.DELETED)
+        self.assertIsNone(InvoiceEvent.objects.as_of(invoice_id, now()))
+        invoice, items = InvoiceEvent.objects.as_of(
+            invoice_id, make_aware(datetime(2016, 5, 10, 10, 30)))
+        self.assertEqual(len(items), 1)
+
+    def test_existing_invoices_are_snapshotted(self):
+        archived = self.customer.invoices.create(created=make_aware(datetime(2016, 4, 1)))
+        archived.items.create(is_hourly=False, description='Domena', amount=10)
+        archive_invoices(Invoice.objects.filter(id=archived.id))
+        InvoiceEvent.objects.all().delete()
+        migration = import_module('invoice.migrations.0022_invoiceevent')
+        migration.snapshot_invoices(apps, None)
+        for invoice_id, description in ((self.invoice.id, 'Hosting'), (archived.id, 'Domena')):
+            invoice, items = InvoiceEvent.objects.as_of(invoice_id, now())
+            self.assertEqual([item.description for item in items], [description])
+
+    def test_events_are_append_only(self):
+        event = self.events()[0]
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+    def test_print_as_of(self):
+        with freeze_time('2016-05-11 09:00'):
+            self.item.amount = 300
+            self.item.save()
+        User.objects.create_user(username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+        url = '/invoice/%d/' % self.invoice.id
+        response = self.client.get(url, {'as_of': '2016-05-10'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['items'][0].amount, Decimal('100.00'))
+        response = self.client.get(url)
+        self.assertEqual(response.context['items'][0].amount, Decimal('300.00'))
+        self.assertEqual(self.client.get(url, {'as_of': '2016-05-01'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'as_of': 'yesterday'}).status_code, 400)
+
+
+class TestAPI(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(name='Klijent', country='HR')
+        self.invoices = []
+        for day in range(1, 6):
+            invoice = self.client.invoices.create(created=make_aware(datetime(2016, 5, day)))
+            invoice.items.create(is_hourly=False, description='Stavka', amount=100)
+            invoice.items.create(is_hourly=True, description='Rad', rate=10, hours=2)
+            self.invoices.append(invoice)
+        User.objects.create_user(username='test_user', password='test_password')
+        self.api = self.client_class()
+        self.api.login(username='test_user', password='test_password')
+
+    def get(self, url, **params):
+        response = self.api.get(url, params)
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_requires_login(self):
+        self.api.logout()
+        status, data = self.get(reverse('api_invoice_list'))
+        self.assertEqual(status, 401)
+
+    def test_invoices_are_paged_by_cursor(self):
+        user = User.objects.get()
+        seen = []
+        url = reverse('api_invoice_list') + '?limit=2'
+        while url:
+            request = RequestFactory().get(url)
+            request.user = user
+            # one query for the invoices, one for all of their items
+            with self.assertNumQueries(2):
+                response = api.invoice_list(request)
+            data = json.loads(response.content.decode('utf-8'))
+            seen.extend(invoice['id'] for invoice in data['results'])
+            url = data['next']
+            # each page's link carries only the cursor of the page after it
+            self.assertLessEqual((url or '').count('cursor='), 1)
+        self.assertEqual(seen, [invoice.id for invoice in self.invoices])
+
+    def test_items_are_embedded_with_totals(self):
+        status, data = self.get(reverse('api_invoice_list'), limit=1)
+        invoice = data['results'][0]
+        self.assertEqual(invoice['total'], '150.00')
+        self.assertEqual(
+            [item['amount'] for item in invoice['items']], ['100.00', '20.00'])
+
+    def test_fields_projection_skips_items(self):
+        request = RequestFactory().get(reverse('api_invoice_list'), {'fields': 'id,seq,total_hrk'})
+        request.user = User.objects.get()
+        with self.assertNumQueries(1):
+            response = api.invoice_list(request)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(sorted(data['results'][0]), ['id', 'seq', 'total_hrk'])
+
+    def test_bad_parameters(self):
+        status, data = self.get(reverse('api_invoice_list'), fields='id,secret')
+        self.assertEqual(status, 400)
+        status, data = self.get(reverse('api_invoice_list'), cursor='garbage')
+        self.assertEqual(status, 400)
+
+    def test_detail_views(self):
+        status, data = self.get(reverse('api_invoice_detail', args=[self.invoices[0].id]))
+        self.assertEqual(len(data['items']), 2)
+        status, data = self.get(reverse('api_client_detail', args=[self.client.id]))
+        self.assertEqual(data['name'], 'Klijent')
+        status, data = self.get(reverse('api_client_list'))
+        self.assertEqual([row['id'] for row in data['results']], [self.client.id])
+
+
+class TestBulkCreate(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(name='Klijent', country='HR')
+
+    def rows(self, count, **extra):
+        return [dict({
+            'client': self.client.id,
+            'created': '2016-05-10T10:00:00',
+            'items': [
+                {'is_hourly': True, 'rate': '40', 'hours': '2.5', 'description': 'Rad'},
+                {'is_hourly': False, 'amount': '100', 'description': 'Hosting'},
+            ],
+        }, **extra) for i in range(count)]
+
+    def test_creates_numbered_invoices_with_totals(self):
+        result = create_invoices(self.rows(3))
+        self.assertEqual(result.errors, [])
+        self.assertEqual([invoice.seq for invoice in result.invoices], [1, 2, 3])
+        invoice = Invoice.objects.get(pk=result.invoices[0].pk)
+        self.assertEqual(invoice.total, Decimal('250.00'))
+        self.assertEqual(invoice.items.count(), 2)
+
+    def test_queries_dont_grow_with_invoice_count(self):
+        # the first batch of the year also creates the sequence counter
+        create_invoices(self.rows(1))
+        with CaptureQueriesContext(connection) as few:
+            create_invoices(self.rows(2))
+        with CaptureQueriesContext(connection) as many:
+            create_invoices(self.rows(40))
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_rows_create_nothing(self):
+        self.client.invoices.create(created=make_aware(datetime(2016, 5, 1)), seq=7)
+        rows = self.rows(4)
+        rows[1]['items'][1]['amount'] = None
+        rows[2]['client'] = 0
+        rows[3]['seq'] = 7
+        result = create_invoices(rows)
+        self.assertEqual([position for position, message in result.errors], [1, 2, 3])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_malformed_client_ids_are_reported(self):
+        rows = self.rows(4)
+        rows[1]['client'] = [self.client.id]
+        rows[2]['client'] = {}
+        rows[3]['client'] = True
+        result = create_invoices(rows)
+        self.assertEqual([position for position, message in result.errors], [1, 2, 3])
+        self.assertTrue(all('Nepoznat klijent' in message for position, message in result.errors))
+        self.assertEqual(Invoice.objects.count(), 0)
+
+    def test_items_are_fully_validated(self):
+        rows = self.rows(3)
+        rows[0]['items'][0]['description'] = 'x' * 301
+        # fields left out are checked as well
+        del rows[1]['items'][1]['description']
+        rows[2]['items'][0]['hours'] = None
+        result = create_invoices(rows)
+        self.assertEqual([position for position, message in result.errors], [0, 1, 2])
+        self.assertIn('description', result.errors[0][1])
+        self.assertEqual(Invoice.objects.count(), 0)
+
+    def test_bulk_endpoint(self):
+        User.objects.create_user(username='test_user', password='test_password')
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        client = self.client_class()
+        url = reverse('api_invoice_bulk_create')
+
+        client.login(username='test_user', password='test_password')
+        response = client.post(url, json.dumps(self.rows(2)), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        client.login(username='admin', password='admin_password')
+        response = client.post(url, json.dumps(self.rows(2)), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([row['number'] for row in data['invoices']], ['1/VP1/1', '2/VP1/1'])
+
+        response = client.post(url, json.dumps(self.rows(1, client=0)), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['errors'][0]['index'], 0)
+
+    def test_bulk_endpoint_needs_csrf_token(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        client = self.client_class(enforce_csrf_checks=True)
+        client.get(reverse('admin:login'))
+        client.post(reverse('admin:login'), {
+            'username': 'admin', 'password': 'admin_password',
+            'csrfmiddlewaretoken': client.cookies['csrftoken'].value})
+        url = reverse('api_invoice_bulk_create')
+
+        response = client.post(url, json.dumps(self.rows(1)), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        response = client.post(
+            url, json.dumps(self.rows(1)), content_type='application/json',
+            HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.status_code, 201)
+
+
+class TestQueryStats(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        client = Client.objects.create(name='Klijent', country='HR')
+        client.invoices.create()
+
+    def login(self):
+        browser = self.client_class()
+        browser.login(username='admin', password='admin_password')
+        return browser
+
+    def test_disabled_by_default(self):
+        self.login().get(reverse('admin:invoice_invoice_changelist'))
+        self.assertFalse(RequestTiming.objects.exists())
+
+    @override_settings(QUERY_STATS_ENABLED=True)
+    def test_records_requests_per_view(self):
+        browser = self.login()
+        browser.get(reverse('admin:invoice_invoice_changelist'))
+        timing = RequestTiming.objects.get()
+        self.assertEqual(timing.view_name, 'admin:invoice_invoice_changelist')
+        self.assertEqual(timing.status_code, 200)
+        self.assertGreater(timing.queries, 0)
+        self.assertGreater(timing.template_time, 0)
+        self.assertGreaterEqual(timing.total_time, timing.template_time)
+
+    @override_settings(QUERY_STATS_ENABLED=True, QUERY_BUDGET=0)
+    @mock.patch('invoice.middleware.logger')
+    def test_logs_requests_over_budget(self, logger):
+        self.login().get(reverse('admin:invoice_invoice_changelist'))
+        self.assertEqual(logger.warning.call_count, 1)
+
+    def test_percentiles(self):
+        for queries in range(1, 101):
+            RequestTiming.objects.create(
+                view_name='print', path='/', method='GET', status_code=200, queries=queries,
+                db_time=queries, template_time=0, total_time=2 * queries)
+        RequestTiming.objects.create(
+            view_name='other', path='/', method='GET', status_code=200, queries=1,
+            db_time=1, template_time=0, total_time=1)
+        rows = request_timing_percentiles()
+        self.assertEqual([row['view_name'] for row in rows], ['print', 'other'])
+        self.assertEqual(rows[0]['queries'], [50, 90, 99])
+        self.assertEqual(rows[0]['total_time'], [100, 180, 198])
+
+        out = StringIO()
+        call_command('query_stats', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+    def test_admin_percentiles_page(self):
+        for days in (1, 30):
+            RequestTiming.objects.create(
+                view_name='day %d' % days, path='/', method='GET', status_code=200, queries=1,
+                db_time=1, template_time=0, total_time=1,
+                created=now() - timedelta(days=days))
+        url = reverse('admin:invoice_requesttiming_percentiles')
+        response = self.login().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['view_name'] for row in response.context['rows']], ['day 1'])
+        response = self.login().get(url, {'days': 60})
+        self.assertEqual(len(response.context['rows']), 2)
+
+
+class TestBenchmark(TestCase):
+
+    def test_seed_and_run(self):
+        call_command(
+            'seed_benchmark', '--clients', '3', '--invoices', '20', '--items', '2',
+            '--noinput', stdout=StringIO())
+        self.assertEqual(Invoice.objects.count(), 20)
+        self.assertEqual(InvoiceItem.objects.count(), 40)
+
+        out = StringIO()
+        call_command('run_benchmark', '--repeat', '1', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['invoices'], 20)
+        self.assertIn('admin changelist', report['results'])
+        self.assertGreater(report['results']['print_invoice']['queries'], 0)
+        # the duplicate benchmark doesn't leave its copies behind
+        self.assertEqual(Invoice.objects.count(), 20)
+
+
+@override_settings(EXCHANGE_RATES_IN_BACKGROUND=True)
+@mock.patch('invoice.models.requests', **MOCK_JSON_ATTRS)
+class TestPendingExchangeRate(TestCase):
+
+    def setUp(self):
+        self.client = Client.objects.create(name='Klijent', country='HR')
+        self.created = make_aware(datetime(2016, 1, 1))
+
+    def create_invoice(self):
+        invoice = self.client.invoices.create(currency='USD', created=self.created)
+        invoice.items.create(is_hourly=False, description='Stavka', amount=100)
+        return Invoice.objects.get(pk=invoice.pk)
+
+    def test_save_does_not_fetch(self, requests):
+        invoice = self.create_invoice()
+        self.assertFalse(requests.get.called)
+        self.assertTrue(invoice.exchange_rate_pending)
+        self.assertIsNone(invoice.exchange_rate)
+        self.assertEqual(invoice.total, Decimal('125.00'))
+        self.assertIsNone(invoice.total_hrk)
+
+    def test_stored_rate_is_used_right_away(self, requests):
+        ExchangeRate.objects.create(date=date(2016, 1, 1), currency='USD', rate=Decimal('7'))
+        invoice = self.create_invoice()
+        self.assertFalse(invoice.exchange_rate_pending)
+        self.assertEqual(invoice.total_hrk, Decimal('875.00'))
+
+    def test_resolve_pending_rates(self, requests):
+        invoice = self.create_invoice()
+        out = StringIO()
+        call_command('resolve_pending_rates', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Resolved 1 invoices, 0 still pending.')
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        self.assertFalse(invoice.exchange_rate_pending)
+        self.assertEqual(invoice.exchange_rate, Decimal('7.000907'))
+        self.assertEqual(invoice.total_hrk, Decimal('875.11'))
+
+    def test_unreachable_hnb_leaves_invoice_pending(self, requests):
+        invoice = self.create_invoice()
+        requests.get.side_effect = RequestException('HNB is down')
+        self.assertEqual(resolve_pending_rates(), 0)
+        self.assertTrue(Invoice.objects.get(pk=invoice.pk).exchange_rate_pending)
+
+    def test_non_json_response_leaves_invoice_pending(self, requests):
+        invoice = self.create_invoice()
+        requests.get.return_value.json.side_effect = ValueError('No JSON object could be decoded')
+        self.assertEqual(resolve_pending_rates(), 0)
+        self.assertTrue(Invoice.objects.get(pk=invoice.pk).exchange_rate_pending)
+
+    def test_resolve_only_given_days(self, requests):
+        invoice = self.create_invoice()
+        self.created += timedelta(days=1)
+        other = self.create_invoice()
+        self.assertEqual(resolve_pending_rates({date(2016, 1, 2)}), 1)
+        self.assertTrue(Invoice.objects.get(pk=invoice.pk).exchange_rate_pending)
+        self.assertFalse(Invoice.objects.get(pk=other.pk).exchange_rate_pending)
+        self.assertEqual(requests.get.call_count, 1)
+
+    def test_worker_resolves_queued_days(self, requests):
+        called = threading.Event()
+        with mock.patch('invoice.rates.resolve_pending_rates', side_effect=lambda dates: called.set()):
+            enqueue_pending_rate(date(2016, 1, 1))
+            self.assertTrue(called.wait(5))
+
+    def test_pending_is_shown(self, requests):
+        invoice = self.create_invoice()
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        browser = self.client_class()
+        browser.login(username='admin', password='admin_password')
+        self.assertContains(browser.get(invoice.get_absolute_url()), 'Exchange rate pending')
+        self.assertContains(
+            browser.get(reverse('admin:invoice_invoice_changelist')), u'čeka tečaj')
+
+
+class TestSearch(TestCase):
+
+    def setUp(self):
+        self.dobar = Client.objects.create(name='Dobar kod d.o.o.', country='HR', address='Zagreb')
+        self.acme = Client.objects.create(name='Acme', country='SE', vat_id='SE999999999901')
+        self.invoice = self.dobar.invoices.create(created=make_aware(datetime(2016, 5, 1)), seq=12)
+        self.invoice.items.create(is_hourly=False, description='Razvoj web aplikacije', amount=100)
+        self.other = self.acme.invoices.create(created=make_aware(datetime(2016, 5, 2)))
+        self.other.items.create(is_hourly=False, description='Hosting', amount=10)
+
+    def test_prefix_search_over_clients(self):
+        self.assertEqual(search.search('dob', search.CLIENT), [self.dobar.id])
+        self.assertEqual(search.search('SE9999', search.CLIENT), [self.acme.id])
+        self.assertEqual(search.search('kod zag', search.CLIENT), [self.dobar.id])
+        self.assertEqual(search.search('nema', search.CLIENT), [])
+
+    def test_search_invoices_by_item_and_number(self):
+        self.assertEqual(search.search('host', search.INVOICE), [self.other.id])
+        self.assertEqual(search.search('12/VP1/1', search.INVOICE), [self.invoice.id])
+        self.assertEqual(search.search('12', search.INVOICE), [self.invoice.id])
+
+    def test_index_follows_changes(self):
+        item = self.invoice.items.create(is_hourly=False, description=u'Održavanje', amount=5)
+        self.assertEqual(search.search(u'održ', search.INVOICE), [self.invoice.id])
+        item.delete()
+        self.assertEqual(search.search(u'održ', search.INVOICE), [])
+
+        self.acme.name = 'Novi naziv'
+        self.acme.save()
+        self.assertEqual(search.search('novi', search.CLIENT), [self.acme.id])
+        self.assertEqual(search.search('acme', search.CLIENT), [])
+
+        self.other.delete()
+        self.assertEqual(search.search('host', search.INVOICE), [])
+
+    def test_search_uses_index(self):
+        if search.get_backend() is None:
+            self.skipTest('no search table on this database')
+        with CaptureQueriesContext(connection) as queries:
+            search.search('razvoj', search.INVOICE)
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql']])
+
+    def test_rebuild_command(self):
+        if search.get_backend() is None:
+            self.skipTest('no search table on this database')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search.search('razvoj', search.INVOICE), [self.invoice.id])
+
+    def test_admin_search(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        browser = self.client_class()
+        browser.login(username='admin', password='admin_password')
+        response = browser.get(reverse('admin:invoice_invoice_changelist'), {'q': 'dobar'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.invoice])
+        response = browser.get(reverse('admin:invoice_client_changelist'), {'q': 'acme'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.acme])
+
+    def test_search_endpoint(self):
+        User.objects.create_user(username='test_user', password='test_password')
+        browser = self.client_class()
+        browser.login(username='test_user', password='test_password')
+        response = browser.get(reverse('api_search'), {'q': 'razvoj'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['clients'], [])
+        self.assertEqual([row['number'] for row in data['invoices']], ['12/VP1/1'])
+
+
 class TestInvoiceItem(TestCase):
 
     def setUp(self):
@@ -303,6 +1747,7 @@ class TestInvoiceItem(TestCase):
 class TestsViews(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.invoice = Invoice.objects.create(client=Client.objects.create(), seq=50)
         self.user = User.objects.create_user(
             username='test_user',
@@ -330,6 +1775,50 @@ class TestsViews(TestCase):
         response = self.client.get('/invoice/1/')
         self.assertTemplateUsed(response, 'admin/print.html')
 
+    def test_print_response_has_validators(self):
+        response = self.client.get('/invoice/1/')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_unchanged_invoice_returns_304(self):
+        etag = self.client.get('/invoice/1/')['ETag']
+        response = self.client.get('/invoice/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_repeated_print_is_served_from_cache(self):
+        first = self.client.get('/invoice/1/')
+        second = self.client.get('/invoice/1/')
+        self.assertTemplateNotUsed(second, 'admin/print.html')
+        self.assertEqual(first.content, second.content)
+
+    def test_item_change_invalidates_cached_print(self):
+        etag = self.client.get('/invoice/1/')['ETag']
+        with freeze_time(now() + timedelta(seconds=1)):
+            self.invoice.items.create(is_hourly=False, description='Nova stavka', amount=10)
+        response = self.client.get('/invoice/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Nova stavka')
+
+    def test_client_change_invalidates_cached_print(self):
+        self.client.get('/invoice/1/')
+        client = self.invoice.client
+        client.name = 'Novo ime'
+        with freeze_time(now() + timedelta(seconds=1)):
+            client.save()
+        self.assertContains(self.client.get('/invoice/1/'), 'Novo ime')
+
+    def test_print_of_200_items_runs_constant_queries(self):
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=self.invoice, is_hourly=n % 2 == 0, description='Stavka %d' % n,
+                        rate=10, hours=2, amount=20)
+            for n in range(200)])
+        # session, user, version check, invoice with client, items
+        with self.assertNumQueries(5):
+            response = self.client.get('/invoice/1/')
+        self.assertEqual(len(response.context['items']), 200)
+        self.assertTrue(response.context['has_hourly'])
+        self.assertEqual(response.context['items'][0].amount_hrk, Decimal('20.00'))
+
     def test_duplicate_invoice_view_redirects_if_method_is_post(self):
         reverse_url = reverse('duplicate_invoice', args=[self.invoice.id])
         response = self.client.post(reverse_url)
@@ -339,3 +1828,35 @@ class TestsViews(TestCase):
         reverse_url = reverse('duplicate_invoice', args=[self.invoice.id])
         response = self.client.get(reverse_url)
         self.assertEqual(response.status_code, 405)
+
+
+class TestInvoiceAdmin(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@dobarkod.hr', password='admin_password')
+        self.client.login(username='admin', password='admin_password')
+        self.changelist_url = reverse('admin:invoice_invoice_changelist')
+
+    def create_invoices(self, count):
+        for n in range(count):
+            invoice = Client.objects.create(name='Client %d' % n).invoices.create()
+            invoice.items.create(is_hourly=False, amount=100)
+
+    def count_changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist_url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_depend_on_row_count(self):
+        self.create_invoices(2)
+        few_rows = self.count_changelist_queries()
+        self.create_invoices(48)
+        self.assertEqual(self.count_changelist_queries(), few_rows)
+        self.assertLessEqual(few_rows, 10)
+
+    def test_changelist_shows_stored_totals(self):
+        self.create_invoices(1)
+        response = self.client.get(self.changelist_url)
+        self.assertContains(response, '100.00 HRK')
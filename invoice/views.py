@@ -1,22 +1,95 @@
+import datetime
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.views.decorators.http import require_http_methods
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from django.views.decorators.http import condition, require_http_methods
 from django.shortcuts import render, redirect, get_object_or_404
 
-from .models import Invoice
+from .models import Client, Invoice
+from .printing import (
+    build_printed_invoice, get_invoice_pdf, html_to_pdf, print_version, print_version_tag,
+    render_printed_invoice)
+from .reports import build_client_statement
+
+
+def _print_output(request):
+    return 'pdf' if request.GET.get('format') == 'pdf' else 'html'
+
+
+def _print_as_of(request):
+    """
+    Parse the ``as_of`` parameter, a date (meaning the end of that day) or a
+    date and time. Raises ValueError if it is neither.
+    """
+
+    value = request.GET.get('as_of')
+    if not value:
+        return None
+    as_of = parse_datetime(value)
+    if as_of is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        as_of = datetime.datetime.combine(day, datetime.time.max)
+    return make_aware(as_of) if is_naive(as_of) else as_of
+
+
+def _print_version(request, id):
+    if not hasattr(request, '_print_version'):
+        request._print_version = print_version(id)
+    return request._print_version
+
+
+def _print_etag(request, id=None):
+    version = _print_version(request, id)
+    if version is None:
+        return None
+    variant = _print_output(request)
+    if request.GET.get('as_of'):
+        variant += '@' + request.GET['as_of']
+    return print_version_tag(id, version, variant)
+
+
+def _print_last_modified(request, id=None):
+    version = _print_version(request, id)
+    if version is None:
+        return None
+    return max(version)
 
 
 @login_required
+@condition(etag_func=_print_etag, last_modified_func=_print_last_modified)
 def print_invoice(request, id=None):
-    instance = get_object_or_404(Invoice, id=id)
+    try:
+        as_of = _print_as_of(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid as_of, expected YYYY-MM-DD or YYYY-MM-DD HH:MM')
+    if as_of is not None:
+        # past versions come from the change log and are not cached
+        html = render_printed_invoice(build_printed_invoice(id, as_of), request=request)
+        if _print_output(request) == 'pdf':
+            return HttpResponse(html_to_pdf(html), content_type='application/pdf')
+        return HttpResponse(html)
 
-    context = {
-        "instance": instance,
-        "instance_items": instance.items.all(),
-        "vat": int(instance.vat_value * 100),
-        "colspan": 4 if instance.has_hourly else 2,
-    }
-    return render(request, "admin/print.html", context)
+    if _print_output(request) == 'pdf':
+        try:
+            path = get_invoice_pdf(id)
+        except Invoice.DoesNotExist:
+            raise Http404
+        return FileResponse(open(path, 'rb'), content_type='application/pdf')
+
+    etag = _print_etag(request, id)
+    cache_key = 'print_invoice:%s' % etag
+    html = cache.get(cache_key) if etag is not None else None
+    if html is None:
+        html = render_printed_invoice(build_printed_invoice(id), request=request)
+        cache.set(cache_key, html, settings.PRINT_CACHE_TIMEOUT)
+    return HttpResponse(html)
 
 
 @require_http_methods(["POST"])
@@ -29,3 +102,17 @@ def duplicate_invoice(request, id=None):
         args=(new_inv.id,),
         current_app='invoice')
     return redirect(change_url)
+
+
+@login_required
+def client_statement(request, id=None):
+    client = get_object_or_404(Client, id=id)
+    statement = build_client_statement(client)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(dict(statement, client={
+            'id': client.id,
+            'name': client.name,
+            'vat_id': client.vat_id,
+            'country': client.country.code,
+        }))
+    return render(request, "admin/statement.html", statement)
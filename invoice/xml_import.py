@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming import of invoices from XML.
+
+The expected format is::
+
+    <invoices>
+        <invoice client_vat_id="SE999999999901" created="2016-05-10T10:00:00"
+                 currency="USD" seq="12" payment_method="PayPal" paid="true">
+            <item is_hourly="true" rate="40" hours="12.5" description="Development">
+                Optional additional info
+            </item>
+            <item is_hourly="false" amount="100" description="Hosting"/>
+        </invoice>
+    </invoices>
+
+Only ``client_vat_id`` is required on an invoice. Without ``seq`` the next
+free invoice number is used, without ``created`` the current time.
+"""
+
+from __future__ import unicode_literals
+
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+
+from .models import Client, Invoice, InvoiceItem, year_of
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+ParseError = ET.ParseError
+
+
+class ImportResult(object):
+
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+
+    def add_error(self, row, message):
+        self.errors.append((row, message))
+
+
+def _error_text(error):
+    if not hasattr(error, 'error_dict'):
+        return '; '.join(error.messages)
+    return '; '.join(
+        ' '.join(messages) if field == '__all__' else '%s: %s' % (field, ' '.join(messages))
+        for field, messages in sorted(error.message_dict.items()))
+
+
+def _normalize_vat_id(vat_id):
+    return vat_id.replace(' ', '').upper()
+
+
+def _decimal(elem, name):
+    value = elem.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError('Neispravan broj u atributu %s: %s' % (name, value))
+
+
+def _boolean(elem, name, default):
+    value = elem.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('true', 'yes', '1')
+
+
+def _parse_invoice(elem, clients):
+    vat_id = _normalize_vat_id(elem.get('client_vat_id', ''))
+    client = clients.get(vat_id)
+    if client is None:
+        raise ValidationError('Nepoznat klijent s VAT ID-em "%s"' % vat_id)
+
+    invoice = Invoice(
+        client=client,
+        currency=elem.get('currency', client.currency),
+        default_payment_method=elem.get('payment_method', client.default_payment_method),
+        paid=_boolean(elem, 'paid', False))
+    if elem.get('created'):
+        created = parse_datetime(elem.get('created'))
+        if created is None:
+            raise ValidationError('Neispravan datum: %s' % elem.get('created'))
+        invoice.created = make_aware(created) if is_naive(created) else created
+    if elem.get('seq'):
+        try:
+            invoice.seq = int(elem.get('seq'))
+        except ValueError:
+            raise ValidationError('Neispravan broj računa: %s' % elem.get('seq'))
+    invoice.full_clean(exclude=['client'], validate_unique=False)
+
+    items = []
+    for item_elem in elem.iter('item'):
+        item = InvoiceItem(
+            invoice=invoice,
+            is_hourly=_boolean(item_elem, 'is_hourly', True),
+            description=item_elem.get('description', ''),
+            additional_info=(item_elem.text or '').strip() or None,
+            amount=_decimal(item_elem, 'amount'),
+            rate=_decimal(item_elem, 'rate'),
+            hours=_decimal(item_elem, 'hours'))
+        item.full_clean(exclude=['invoice'])
+        items.append(item)
+    return invoice, items
+
+
+def _flush(batch, result):
+    """Insert a chunk of parsed invoices, skipping numbers already taken."""
+    taken = Invoice.objects.taken_numbers(invoice for row, invoice, items in batch)
+
+    invoices = []
+    for row, invoice, items in batch:
+        key = (year_of(invoice.created), invoice.seq)
+        if invoice.seq is not None and key in taken:
+            result.add_error(row, 'Račun broj %s za %s. već postoji' % key[::-1])
+            continue
+        taken.add(key)
+        invoices.append((invoice, items))
+
+    Invoice.objects.create_batch(invoices)
+    result.imported += len(invoices)
+
+
+def import_invoices(source, batch_size=500):
+    """
+    Import invoices from the XML file-like `source`.
+
+    The file is parsed incrementally and every invoice element is dropped as
+    soon as it is read, so memory use doesn't depend on the file size.
+    Invoices are inserted in chunks of `batch_size`, each in its own
+    transaction. Invalid invoices are skipped and reported by their position
+    in the file, in file order.
+    """
+
+    clients = dict(
+        (_normalize_vat_id(client.vat_id), client)
+        for client in Client.objects.exclude(vat_id=''))
+    result = ImportResult()
+    batch = []
+    row = 0
+
+    # cElementTree on Python 2 only takes native strings as event names
+    context = ET.iterparse(source, events=(str('start'), str('end')))
+    event, root = next(context)
+    for event, elem in context:
+        if event != 'end' or elem.tag != 'invoice':
+            continue
+        row += 1
+        try:
+            invoice, items = _parse_invoice(elem, clients)
+        except ValidationError as e:
+            result.add_error(row, _error_text(e))
+        else:
+            batch.append((row, invoice, items))
+        root.clear()
+
+        if len(batch) >= batch_size:
+            _flush(batch, result)
+            batch = []
+    if batch:
+        _flush(batch, result)
+    # invalid invoices are reported as they're read, taken numbers only
+    # when their chunk is flushed
+    result.errors.sort(key=lambda error: error[0])
+    return result
@@ -1,5 +1,3 @@
-from decimal import Decimal
-
 from .env import *
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -21,6 +19,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'invoice.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +57,7 @@ WSGI_APPLICATION = 'project.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': ABS_PATH('db.sqlite3'),
+        'NAME': ENV_STR('DATABASE_NAME', ABS_PATH('db.sqlite3')),
     }
 }
 
@@ -97,11 +96,29 @@ STATICFILES_DIRS = [
     ABS_PATH("static"),
 ]
 
-# http://ec.europa.eu/taxation_customs/resources/documents/taxation/vat/how_vat_works/rates/vat_rates_en.pdf
-
-VAT_DATA = {
-    'HR': Decimal(0.25),
-    'SE': Decimal(0.22)
-}
-EXEMPTED_COUNTRIES = ['HR']
+# VAT rates live in the VatRate table, each process keeps them cached for
+# this long so changes made elsewhere show up eventually
+VAT_RATES_CACHE_TIMEOUT = 60  # seconds
 PAYMENT_POSTPONE_RATE = 14  # days
+
+HNBEX_URL = ENV_STR('HNBEX_URL', 'http://hnbex.eu/api/v1/rates/daily/')
+HNBEX_TIMEOUT = 10  # seconds
+# save invoices with a missing exchange rate right away and fetch it in a
+# background thread (see invoice.rates)
+EXCHANGE_RATES_IN_BACKGROUND = ENV_BOOL('EXCHANGE_RATES_IN_BACKGROUND', False)
+
+PRINT_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # seconds
+INVOICE_PDF_DIR = ENV_STR('INVOICE_PDF_DIR', ABS_PATH('var', 'pdf'))
+# paid invoices from before the last this many years are moved to the
+# archive tables by archive_invoices
+ARCHIVE_AFTER_YEARS = 3
+# the invoice change log stores a full snapshot after this many diffs, which
+# bounds the rows read to rebuild an invoice as of some time
+INVOICE_EVENT_SNAPSHOT_INTERVAL = 20
+# progress of interrupted recalc_invoices runs
+RECALC_CHECKPOINT_DIR = ENV_STR('RECALC_CHECKPOINT_DIR', ABS_PATH('var', 'recalc'))
+
+# record SQL query counts and timings of every request (see invoice.middleware)
+QUERY_STATS_ENABLED = ENV_BOOL('QUERY_STATS_ENABLED', False)
+# requests running more queries than this are logged
+QUERY_BUDGET = ENV_INT('QUERY_BUDGET', 50)
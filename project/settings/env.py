@@ -1,6 +1,6 @@
 import os
 
-__all__ = ['BASE_DIR', 'ABS_PATH', 'ENV_BOOL', 'ENV_STR', 'ENV_LIST']
+__all__ = ['BASE_DIR', 'ABS_PATH', 'ENV_BOOL', 'ENV_STR', 'ENV_INT', 'ENV_LIST']
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -39,6 +39,20 @@ def ENV_STR(name, default=None):  # noqa
     return os.environ.get(name, default)
 
 
+def ENV_INT(name, default=None):  # noqa
+    """
+    Get an integer value from environment variable.
+
+    If the environment variable is not set or is not a number, the default
+    value is returned instead.
+    """
+
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
 def ENV_LIST(name, separator, default=None):  # noqa
     """
     Get a list of string values from environment variable.
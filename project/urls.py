@@ -17,12 +17,20 @@ Including another URLconf
 from django.conf.urls import url
 from django.contrib import admin
 
-from invoice.views import print_invoice, duplicate_invoice
+from invoice import api
+from invoice.views import client_statement, print_invoice, duplicate_invoice
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^invoice/(?P<id>\d+)/$', print_invoice),
     url(r'^invoice/(?P<id>\d+)/duplicate/$', duplicate_invoice, name="duplicate_invoice"),
+    url(r'^client/(?P<id>\d+)/statement/$', client_statement, name="client_statement"),
+    url(r'^api/clients/$', api.client_list, name="api_client_list"),
+    url(r'^api/clients/(?P<id>\d+)/$', api.client_detail, name="api_client_detail"),
+    url(r'^api/invoices/$', api.invoice_list, name="api_invoice_list"),
+    url(r'^api/invoices/(?P<id>\d+)/$', api.invoice_detail, name="api_invoice_detail"),
+    url(r'^api/invoices/bulk/$', api.invoice_bulk_create, name="api_invoice_bulk_create"),
+    url(r'^api/search/$', api.search_view, name="api_search"),
 ]
 
 homepage_title = 'Dobar kod - Simple invoicer'